@@ -16,3 +16,9 @@ class ImagesAdminAPIEndpoint(ImagesAPIEndpoint):
         'height',
         'thumbnail',
     ]
+
+    def get_queryset(self):
+        # Fetch the thumbnails for the whole listing in a single query
+        return super(ImagesAdminAPIEndpoint, self).get_queryset().prefetch_renditions(
+            AdminImageSerializer.thumbnail_filter_spec
+        )
@@ -50,4 +50,6 @@ class ImageRenditionField(Field):
 
 
 class AdminImageSerializer(ImageSerializer):
-    thumbnail = ImageRenditionField('max-165x165', read_only=True)
+    thumbnail_filter_spec = 'max-165x165'
+
+    thumbnail = ImageRenditionField(thumbnail_filter_spec, read_only=True)
@@ -10,7 +10,8 @@ from wagtail.wagtailimages.permissions import permission_policy
 from wagtail.wagtailimages.utils import (
     get_folders_list,
     create_db_entries,
-    get_image_dict
+    get_image_dict,
+    get_images_list
 )
 from wagtail.wagtailimages import get_image_model
 from wagtail.wagtailsearch import index as search_index
@@ -43,10 +44,7 @@ def list(request, folder_id=None):
         root_folder['sub_folders'] = get_folders_list(folders)
 
         # Get all images under root
-        images = Image.objects.filter(folder__isnull=True)
-        root_folder['images'] = list()
-        for image in images:
-            root_folder['images'].append(get_image_dict(image))
+        root_folder['images'] = get_images_list(Image.objects.filter(folder__isnull=True))
 
         folders_list = [root_folder]
 
@@ -136,6 +134,10 @@ def move(request):
             response['message'] = "Invalid Folder ID"
             return JsonResponse(response, status=404)
 
+        if target_folder and target_folder.is_descendant_of(source_folder):
+            response['message'] = "A folder cannot be moved into one of its sub folders."
+            return JsonResponse(response, status=400)
+
         source_folder.folder = target_folder
         while True:
             try:
@@ -245,6 +247,10 @@ def edit(request, folder_id):
             response['message'] = "Invalid Parent ID"
             return JsonResponse(response, status=404)
 
+        if parent_folder.pk == folder.pk or parent_folder.is_descendant_of(folder):
+            response['message'] = "A folder cannot be moved into itself or one of its sub folders."
+            return JsonResponse(response, status=400)
+
     title = request.POST.get('title', folder.title)
     folder.title = title
     if parent_folder:
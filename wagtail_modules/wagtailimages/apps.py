@@ -9,3 +9,11 @@ class WagtailImagesAppConfig(AppConfig):
     name = 'wagtail.wagtailimages'
     label = 'wagtailimages'
     verbose_name = "Wagtail images"
+
+    def ready(self):
+        from wagtail.wagtailcore.blocks import ListBlock
+        from wagtail.wagtailimages.blocks import list_block_to_python
+
+        # wagtailcore's ListBlock converts its items one at a time, which would fetch
+        # the images in a ListBlock(ImageChooserBlock()) with a query each
+        ListBlock.to_python = list_block_to_python
@@ -2,9 +2,9 @@ from __future__ import absolute_import, unicode_literals
 
 from django.utils.functional import cached_property
 
-from wagtail.wagtailcore.blocks import ChooserBlock
+from wagtail.wagtailcore.blocks import ChooserBlock, ListBlock
 
-from .shortcuts import get_rendition_or_not_found
+from .rendition_collector import render_rendition
 
 
 class ImageChooserBlock(ChooserBlock):
@@ -18,11 +18,65 @@ class ImageChooserBlock(ChooserBlock):
         from wagtail.wagtailimages.widgets import AdminImageChooser
         return AdminImageChooser
 
+    def prefetch_renditions(self, images):
+        """
+        Prefetches the renditions given by the rendition_specs option for the images,
+        in a single query
+        """
+        if self.meta.rendition_specs:
+            from wagtail.wagtailimages.models import prefetch_renditions
+            prefetch_renditions(images, *self.meta.rendition_specs)
+
+    def bulk_to_python(self, values):
+        """
+        Returns the images for a list of ids (keeping their order, and None for the
+        ones that don't exist), fetching them and their renditions with a query each
+        """
+        ids = [self.normalise_id(value) for value in values]
+        images = self.target_model.objects.in_bulk([image_id for image_id in ids if image_id is not None])
+        self.prefetch_renditions(list(images.values()))
+        return [images.get(image_id) for image_id in ids]
+
+    @staticmethod
+    def normalise_id(value):
+        # Ids may have been stored as strings, but in_bulk returns integer keys
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
     def render_basic(self, value, context=None):
         if value:
-            return get_rendition_or_not_found(value, 'original').img_tag()
+            return render_rendition(value, 'original', lambda rendition: rendition.img_tag())
         else:
             return ''
 
     class Meta:
         icon = "image"
+        # Filter specs of the renditions to fetch along with the images, eg. the ones
+        # used by the block's template
+        rendition_specs = []
+
+
+def list_block_to_python(self, value):
+    """
+    Replaces ListBlock.to_python, so that the items of ListBlocks whose child block
+    has a bulk_to_python method (such as ImageChooserBlock) are converted together
+    """
+    bulk_to_python = getattr(self.child_block, 'bulk_to_python', None)
+    if bulk_to_python is not None:
+        return bulk_to_python(value)
+
+    return [self.child_block.to_python(item) for item in value]
+
+
+class ImageListBlock(ListBlock):
+    """
+    A ListBlock of images (such as a gallery), which fetches all of the images at
+    once rather than one at a time
+    """
+    def __init__(self, child_block=None, **kwargs):
+        super(ImageListBlock, self).__init__(child_block or ImageChooserBlock(), **kwargs)
+
+    def to_python(self, value):
+        return self.child_block.bulk_to_python(value)
@@ -3,3 +3,11 @@ from __future__ import absolute_import, unicode_literals
 
 class InvalidFilterSpecError(ValueError):
     pass
+
+
+class ReconciliationError(Exception):
+    """
+    Raised when fixing the differences between the image files and the database
+    looks unsafe, such as when the media directory appears not to be mounted
+    """
+    pass
@@ -5,7 +5,7 @@ from django.utils.translation import ugettext_lazy as _
 
 from wagtail.utils.apps import get_app_submodules
 
-from .shortcuts import get_rendition_or_not_found
+from .rendition_collector import render_rendition
 
 
 class Format(object):
@@ -30,17 +30,18 @@ class Format(object):
         )
 
     def image_to_html(self, image, alt_text, extra_attributes=''):
-        rendition = get_rendition_or_not_found(image, self.filter_spec)
-
         if self.classnames:
             class_attr = 'class="%s" ' % escape(self.classnames)
         else:
             class_attr = ''
 
-        return '<img %s%ssrc="%s" width="%d" height="%d" alt="%s">' % (
-            extra_attributes, class_attr,
-            escape(rendition.url), rendition.width, rendition.height, alt_text
-        )
+        def render(rendition):
+            return '<img %s%ssrc="%s" width="%d" height="%d" alt="%s">' % (
+                extra_attributes, class_attr,
+                escape(rendition.url), rendition.width, rendition.height, alt_text
+            )
+
+        return render_rendition(image, self.filter_spec, render)
 
 
 FORMATS = []
@@ -29,14 +29,45 @@ class Operation(object):
     def run(self, willow, image, env):
         raise NotImplementedError
 
+    def get_output_size(self, width, height, image):
+        """
+        Returns the (width, height) of the image this operation would output when
+        run on an image of the given size, without having to run it. Raises
+        NotImplementedError if this can't be worked out from the size alone.
+        """
+        raise NotImplementedError
+
+    def get_output_scale(self, width, height, image):
+        """
+        Returns the fraction of the resolution of an image of the given size that this
+        operation's output needs. For example, an operation that halves the size of
+        the image would return 0.5.
+
+        If all the operations of a filter scale the image down enough, JPEGs are
+        decoded at a reduced size (see ``Filter.run``). ``env['unscaled-size']`` is then
+        set to the size the image would have had; operations that implement this must
+        work out what to do from that size, and remove it from ``env`` once they have
+        resized the image. Raises NotImplementedError by default, which prevents the
+        image from being decoded at a reduced size.
+        """
+        raise NotImplementedError
+
 
 class DoNothingOperation(Operation):
+    only_resizes = True
+
     def construct(self):
         pass
 
     def run(self, willow, image, env):
         pass
 
+    def get_output_size(self, width, height, image):
+        return width, height
+
+    def get_output_scale(self, width, height, image):
+        return 1
+
 
 class FillOperation(Operation):
     vary_fields = ('focal_point_width', 'focal_point_height', 'focal_point_x', 'focal_point_y')
@@ -63,10 +94,10 @@ class FillOperation(Operation):
         if self.crop_closeness > 1:
             self.crop_closeness = 1
 
-    def run(self, willow, image, env):
-        image_width, image_height = willow.get_size()
-        focal_point = image.get_focal_point()
-
+    def get_crop_rect(self, image_width, image_height, focal_point):
+        """
+        Returns the (rounded) rect that gets cropped out of an image of the given size
+        """
         # Get crop aspect ratio
         crop_aspect_ratio = self.width / self.height
 
@@ -127,33 +158,84 @@ class FillOperation(Operation):
         # Don't allow the crop box to go over the image boundary
         rect = rect.move_to_clamp(Rect(0, 0, image_width, image_height))
 
-        # Crop!
-        willow = willow.crop(rect.round())
+        return rect.round()
 
+    def get_resize_size(self, crop_width, crop_height):
+        """
+        Returns the size to resize the cropped image to, or None if it's small enough already
+        """
         # Get scale for resizing
         # The scale should be the same for both the horizontal and
         # vertical axes
-        aftercrop_width, aftercrop_height = willow.get_size()
-        scale = self.width / aftercrop_width
+        scale = self.width / crop_width
 
         # Only resize if the image is too big
         if scale < 1.0:
+            return self.width, self.height
+
+    def run(self, willow, image, env):
+        if 'unscaled-size' in env:
+            return self.run_on_scaled_image(willow, image, env)
+
+        image_width, image_height = willow.get_size()
+
+        # Crop!
+        willow = willow.crop(self.get_crop_rect(image_width, image_height, image.get_focal_point()))
+
+        aftercrop_width, aftercrop_height = willow.get_size()
+        size = self.get_resize_size(aftercrop_width, aftercrop_height)
+
+        if size is not None:
             # Resize!
-            willow = willow.resize((self.width, self.height))
+            willow = willow.resize(size)
 
         return willow
 
+    def run_on_scaled_image(self, willow, image, env):
+        # The image has been decoded at a reduced size. Work out the crop in terms of
+        # the full size image (which is what the focal point refers to), then scale it
+        # down to fit the decoded image
+        image_width, image_height = env.pop('unscaled-size')
+        rect = self.get_crop_rect(image_width, image_height, image.get_focal_point())
+
+        scaled_width, scaled_height = willow.get_size()
+        x_scale = scaled_width / image_width
+        y_scale = scaled_height / image_height
+
+        willow = willow.crop(Rect(
+            rect.left * x_scale,
+            rect.top * y_scale,
+            rect.right * x_scale,
+            rect.bottom * y_scale
+        ).round())
+
+        # Resize to the size the full size image would have been resized to
+        return willow.resize(self.get_resize_size(rect.width, rect.height) or (rect.width, rect.height))
+
+    def get_output_size(self, width, height, image):
+        rect = self.get_crop_rect(width, height, image.get_focal_point())
+        return self.get_resize_size(rect.width, rect.height) or (rect.width, rect.height)
+
+    def get_output_scale(self, width, height, image):
+        rect = self.get_crop_rect(width, height, image.get_focal_point())
+        output_width, output_height = self.get_resize_size(rect.width, rect.height) or (rect.width, rect.height)
+        return max(output_width / rect.width, output_height / rect.height)
+
 
 class MinMaxOperation(Operation):
+    only_resizes = True
+
     def construct(self, size):
         # Get width and height
         width_str, height_str = size.split('x')
         self.width = int(width_str)
         self.height = int(height_str)
 
-    def run(self, willow, image, env):
-        image_width, image_height = willow.get_size()
-
+    def get_resize_size(self, image_width, image_height):
+        """
+        Returns the size to resize an image of the given size to, or None if it
+        shouldn't be resized
+        """
         horz_scale = self.width / image_width
         vert_scale = self.height / image_height
 
@@ -183,16 +265,36 @@ class MinMaxOperation(Operation):
             # Unknown method
             return
 
-        return willow.resize((width, height))
+        return width, height
+
+    def run(self, willow, image, env):
+        # If the image was decoded at a reduced size, resize it to what the full size
+        # image would have been resized to
+        size = self.get_resize_size(*env.get('unscaled-size', willow.get_size()))
+
+        if size is not None:
+            env.pop('unscaled-size', None)
+            return willow.resize(size)
+
+    def get_output_size(self, width, height, image):
+        return self.get_resize_size(width, height) or (width, height)
+
+    def get_output_scale(self, width, height, image):
+        output_width, output_height = self.get_output_size(width, height, image)
+        return max(output_width / width, output_height / height)
 
 
 class WidthHeightOperation(Operation):
+    only_resizes = True
+
     def construct(self, size):
         self.size = int(size)
 
-    def run(self, willow, image, env):
-        image_width, image_height = willow.get_size()
-
+    def get_resize_size(self, image_width, image_height):
+        """
+        Returns the size to resize an image of the given size to, or None if it
+        shouldn't be resized
+        """
         if self.method == 'width':
             if image_width <= self.size:
                 return
@@ -215,10 +317,28 @@ class WidthHeightOperation(Operation):
             # Unknown method
             return
 
-        return willow.resize((width, height))
+        return width, height
+
+    def run(self, willow, image, env):
+        # If the image was decoded at a reduced size, resize it to what the full size
+        # image would have been resized to
+        size = self.get_resize_size(*env.get('unscaled-size', willow.get_size()))
+
+        if size is not None:
+            env.pop('unscaled-size', None)
+            return willow.resize(size)
+
+    def get_output_size(self, width, height, image):
+        return self.get_resize_size(width, height) or (width, height)
+
+    def get_output_scale(self, width, height, image):
+        output_width, output_height = self.get_output_size(width, height, image)
+        return max(output_width / width, output_height / height)
 
 
 class JPEGQualityOperation(Operation):
+    only_resizes = True
+
     def construct(self, quality):
         self.quality = int(quality)
 
@@ -228,8 +348,16 @@ class JPEGQualityOperation(Operation):
     def run(self, willow, image, env):
         env['jpeg-quality'] = self.quality
 
+    def get_output_size(self, width, height, image):
+        return width, height
+
+    def get_output_scale(self, width, height, image):
+        return 1
+
 
 class FormatOperation(Operation):
+    only_resizes = True
+
     def construct(self, fmt):
         self.format = fmt
 
@@ -238,3 +366,9 @@ class FormatOperation(Operation):
 
     def run(self, willow, image, env):
         env['output-format'] = self.format
+
+    def get_output_size(self, width, height, image):
+        return width, height
+
+    def get_output_scale(self, width, height, image):
+        return 1
@@ -0,0 +1,319 @@
+from __future__ import absolute_import, unicode_literals
+
+import filecmp
+import logging
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db.models import Case, FloatField, Value, When
+from django.utils.encoding import force_text
+
+from wagtail.wagtailcore.models import Collection
+from wagtail.wagtailimages import get_image_model
+from wagtail.wagtailimages.fields import ALLOWED_EXTENSIONS, WagtailImageField
+from wagtail.wagtailimages.models import IMAGES_FOLDER_NAME, get_folder_model
+from wagtail.wagtailimages.rendition_cache import invalidate_image_renditions
+from wagtail.wagtailsearch.backends import get_search_backends_with_name
+
+logger = logging.getLogger('wagtail.images')
+
+
+def read_image_file(path):
+    """
+    Validates an image file in the same way as the image upload form, returning a
+    ((width, height), None) tuple, or (None, error message) if it isn't valid. Runs
+    in a worker process when importing in parallel, so it mustn't use the database.
+    """
+    import django
+    from django.apps import apps
+
+    # Worker processes that weren't forked from the main process have to set up
+    # Django themselves
+    if not apps.ready:
+        django.setup()
+
+    try:
+        with open(path, 'rb') as f:
+            image_file = WagtailImageField().clean(File(f, name=os.path.basename(path)))
+            return image_file.image.size, None
+    except ValidationError as e:
+        return None, '; '.join(force_text(message) for message in e.messages)
+    except EnvironmentError as e:
+        return None, force_text(e)
+
+
+# Earlier versions of create_db_entries saved a copy of each file next to it, which
+# the storage gave a name such as cat_Ab3dE7f.png (or cat_1.png in older Django versions)
+LEGACY_COPY_NAME_RE = re.compile(r'^(.+)_(?:[a-zA-Z0-9]{7}|[0-9]+)(\.[^./]+)$')
+
+
+def get_legacy_copies(file_names):
+    """
+    Returns {original file name: [file names]} for the file names that may be copies
+    of another file in the same directory made by earlier versions of
+    create_db_entries. Use is_legacy_copy to check them.
+    """
+    copies = {}
+    for file_name in file_names:
+        match = LEGACY_COPY_NAME_RE.match(file_name)
+        if match:
+            copies.setdefault(match.group(1) + match.group(2), []).append(file_name)
+    return copies
+
+
+def is_legacy_copy(path, copy_path):
+    """
+    Returns True if the file at copy_path is a copy of the file at path. Such files
+    already have an image (the one created for the copy), so importing the original
+    would create a duplicate.
+    """
+    try:
+        return filecmp.cmp(path, copy_path, shallow=False)
+    except EnvironmentError:
+        return False
+
+
+class ImportJob(object):
+    """
+    A file found while scanning that needs to be imported, or re-imported if it has
+    changed since it was last imported (in which case existing_id is set).
+    """
+    def __init__(self, folder, name, path, size, mtime, existing_id=None):
+        self.folder = folder
+        self.name = name
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.existing_id = existing_id
+
+
+class ImageImporter(object):
+    """
+    Creates images and folders in the database for the image files and directories
+    under MEDIA_ROOT/original_images, leaving the files where they are.
+
+    Imports are incremental: files whose size and modification time match those of
+    an existing image are skipped, as are files whose image is a copy of them made
+    by an earlier version of create_db_entries. Changed files update their image (and
+    discard its renditions). The files are validated in a pool of worker processes when workers
+    is more than 1, and the images are created and indexed in batches.
+    """
+    def __init__(self, user=None, collection=None, workers=1, batch_size=500):
+        self.user = user
+        self.collection = collection or Collection.get_first_root_node()
+        self.workers = workers
+        self.batch_size = batch_size
+
+        self.Image = get_image_model()
+        self.ImageFolder = get_folder_model()
+
+        self.created_count = 0
+        self.updated_count = 0
+        self.skipped_count = 0
+        self.errors = []
+
+    def import_folder(self, title, parent_folder=None):
+        """
+        Imports the directory with the given title in the parent folder (or the root
+        image folder), creating its folder if needed. Returns the folder.
+        """
+        folder = self.get_or_create_folder(title, parent_folder)
+        self.import_tree(folder)
+        return folder
+
+    def import_all(self):
+        """
+        Imports everything under the root image folder
+        """
+        self.import_tree(None)
+
+    def get_or_create_folder(self, title, parent_folder):
+        folder = self.ImageFolder.objects.filter(folder=parent_folder, title=title).first()
+
+        if folder is None:
+            folder = self.ImageFolder(title=title, folder=parent_folder)
+            try:
+                folder.save()
+            except FileExistsError:
+                # Ignore the exception as the physical folder already exists
+                pass
+
+        return folder
+
+    def walk(self, root_folder):
+        """
+        Yields (folder, directory entries) for the directory of the folder (or the root
+        image folder if it's None) and each directory below it, creating any folders
+        that don't exist yet. Folders are looked up from a single query.
+        """
+        if root_folder is None:
+            folders = self.ImageFolder.objects.all()
+        else:
+            folders = root_folder.get_descendants(include_self=True)
+        folders_by_path = {folder.path: folder for folder in folders}
+
+        pending = [(root_folder.path if root_folder else IMAGES_FOLDER_NAME, root_folder)]
+        while pending:
+            path, folder = pending.pop()
+
+            entries = list(os.scandir(os.path.join(settings.MEDIA_ROOT, path)))
+
+            yield folder, path, [entry for entry in entries if entry.is_file()]
+
+            for entry in entries:
+                if entry.is_dir():
+                    sub_path = os.path.join(path, entry.name)
+                    sub_folder = folders_by_path.get(sub_path)
+                    if sub_folder is None:
+                        sub_folder = self.get_or_create_folder(entry.name, folder)
+                    pending.append((sub_path, sub_folder))
+
+    def get_existing_images(self, root_folder):
+        """
+        Returns the {file name: (id, file size, file mtime)} of all the images under
+        the folder, from a single query
+        """
+        path = root_folder.path if root_folder else IMAGES_FOLDER_NAME
+        images = self.Image.objects.filter(file__startswith=path + '/')
+        return {
+            file_name: (pk, file_size, file_mtime)
+            for pk, file_name, file_size, file_mtime in images.values_list('pk', 'file', 'file_size', 'file_mtime')
+        }
+
+    def import_tree(self, root_folder):
+        existing_images = self.get_existing_images(root_folder)
+        legacy_copies = get_legacy_copies(existing_images)
+        executor = None
+
+        if self.workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        try:
+            jobs = []
+            missing_mtimes = {}
+            for folder, path, entries in self.walk(root_folder):
+                for entry in entries:
+                    extension = os.path.splitext(entry.name)[1][1:].lower()
+                    if extension not in ALLOWED_EXTENSIONS:
+                        continue
+
+                    name = os.path.join(path, entry.name)
+                    stat = entry.stat()
+                    existing_id, existing_size, existing_mtime = existing_images.get(name, (None, None, None))
+
+                    if existing_id is not None and existing_size == stat.st_size:
+                        if existing_mtime is None:
+                            # Images that weren't imported (such as ones uploaded through
+                            # the admin) don't have a modification time yet. Their files
+                            # are assumed to be unchanged if the size matches.
+                            missing_mtimes[existing_id] = stat.st_mtime
+                            if len(missing_mtimes) >= self.batch_size:
+                                self.save_mtimes(missing_mtimes)
+                                missing_mtimes = {}
+                            self.skipped_count += 1
+                            continue
+                        elif existing_mtime == stat.st_mtime:
+                            self.skipped_count += 1
+                            continue
+
+                    if existing_id is None and any(
+                        is_legacy_copy(entry.path, os.path.join(settings.MEDIA_ROOT, copy_name))
+                        for copy_name in legacy_copies.get(name, [])
+                    ):
+                        self.skipped_count += 1
+                        continue
+
+                    jobs.append(ImportJob(folder, name, entry.path, stat.st_size, stat.st_mtime, existing_id))
+
+                    if len(jobs) >= self.batch_size:
+                        self.import_batch(jobs, executor)
+                        jobs = []
+
+            if jobs:
+                self.import_batch(jobs, executor)
+            if missing_mtimes:
+                self.save_mtimes(missing_mtimes)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def import_batch(self, jobs, executor=None):
+        paths = [job.path for job in jobs]
+        if executor is not None:
+            results = executor.map(read_image_file, paths, chunksize=max(len(paths) // (self.workers * 4), 1))
+        else:
+            results = map(read_image_file, paths)
+
+        new_images = []
+        updated_ids = []
+        imported_names = []
+        for job, (size, error) in zip(jobs, results):
+            if error is not None:
+                self.errors.append((job.name, error))
+                continue
+
+            imported_names.append(job.name)
+            width, height = size
+            if job.existing_id is not None:
+                self.update_image(job, width, height)
+                updated_ids.append(job.existing_id)
+            else:
+                new_images.append(self.Image(
+                    title=os.path.splitext(os.path.basename(job.name))[0],
+                    file=job.name,
+                    width=width,
+                    height=height,
+                    file_size=job.size,
+                    file_mtime=job.mtime,
+                    folder=job.folder,
+                    collection=self.collection,
+                    uploaded_by_user=self.user,
+                ))
+
+        if new_images:
+            self.Image.objects.bulk_create(new_images)
+            self.created_count += len(new_images)
+
+        if updated_ids:
+            self.updated_count += len(updated_ids)
+
+            # The renditions of the old file are out of date
+            self.Image.get_rendition_model().objects.filter(image_id__in=updated_ids).delete()
+            for image_id in updated_ids:
+                invalidate_image_renditions(self.Image, image_id)
+
+        # Not all databases return the ids of the rows created by bulk_create, so the
+        # images are fetched again for indexing
+        if imported_names:
+            self.index_images(self.Image.objects.filter(file__in=imported_names))
+
+    def save_mtimes(self, mtimes):
+        """
+        Records the {image id: file mtime} of images in a single query
+        """
+        self.Image.objects.filter(pk__in=mtimes.keys()).update(file_mtime=Case(
+            *[When(pk=image_id, then=Value(mtime)) for image_id, mtime in mtimes.items()],
+            output_field=FloatField()
+        ))
+
+    def update_image(self, job, width, height):
+        self.Image.objects.filter(pk=job.existing_id).update(
+            width=width,
+            height=height,
+            file_size=job.size,
+            file_mtime=job.mtime,
+            file_hash='',
+        )
+
+    def index_images(self, images):
+        images = list(images)
+        for backend_name, backend in get_search_backends_with_name(with_auto_update=True):
+            try:
+                backend.add_bulk(self.Image, images)
+            except Exception:
+                # Catch and log all errors, as wagtailsearch does when indexing single objects
+                logger.exception("Exception raised while adding images into the '%s' search backend", backend_name)
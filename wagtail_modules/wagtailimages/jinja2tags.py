@@ -2,19 +2,27 @@ from __future__ import absolute_import, unicode_literals
 
 from jinja2.ext import Extension
 
-from .shortcuts import get_rendition_or_not_found
+from .rendition_collector import render_rendition
+from .shortcuts import (
+    expand_filter_spec, get_rendition_or_not_found, get_renditions_or_not_found, srcset_img_tag)
 
 
 def image(image, filterspec, **attrs):
     if not image:
         return ''
 
-    rendition = get_rendition_or_not_found(image, filterspec)
-
     if attrs:
-        return rendition.img_tag(attrs)
+        return render_rendition(image, filterspec, lambda rendition: rendition.img_tag(attrs))
     else:
-        return rendition
+        return get_rendition_or_not_found(image, filterspec)
+
+
+def srcset_image(image, filterspec, **attrs):
+    if not image:
+        return ''
+
+    renditions = list(get_renditions_or_not_found(image, expand_filter_spec(filterspec)).values())
+    return srcset_img_tag(renditions, attrs)
 
 
 class WagtailImagesExtension(Extension):
@@ -23,6 +31,7 @@ class WagtailImagesExtension(Extension):
 
         self.environment.globals.update({
             'image': image,
+            'srcset_image': srcset_image,
         })
 
 
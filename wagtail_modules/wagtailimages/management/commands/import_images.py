@@ -0,0 +1,57 @@
+from __future__ import absolute_import, unicode_literals
+
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wagtail.wagtailimages.importer import ImageImporter
+from wagtail.wagtailimages.models import get_folder_model
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates images and folders for the files and directories under MEDIA_ROOT/original_images "
+        "that aren't in the database yet, and updates the images whose files have changed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--folder', type=int,
+            help="Only import the directory of the folder with this id")
+        parser.add_argument(
+            '--workers', type=int, default=multiprocessing.cpu_count(),
+            help="Number of worker processes to read images with (default: one per CPU)")
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Number of images to insert into the database at once (default: 500)")
+
+    def handle(self, **options):
+        importer = ImageImporter(workers=options['workers'], batch_size=options['batch_size'])
+        start_time = time.time()
+
+        if options['folder'] is not None:
+            ImageFolder = get_folder_model()
+            try:
+                folder = ImageFolder.objects.get(pk=options['folder'])
+            except ImageFolder.DoesNotExist:
+                raise CommandError("Folder %d does not exist" % options['folder'])
+            importer.import_tree(folder)
+        else:
+            importer.import_all()
+
+        elapsed = time.time() - start_time
+        file_count = importer.created_count + importer.updated_count + importer.skipped_count + len(importer.errors)
+        self.stdout.write(
+            "Created %d images and updated %d images (%d unchanged) in %.1f seconds (%.1f files/sec)" % (
+                importer.created_count,
+                importer.updated_count,
+                importer.skipped_count,
+                elapsed,
+                file_count / elapsed if elapsed else 0,
+            )
+        )
+        for file_name, error in importer.errors:
+            self.stderr.write("Failed to import %s: %s" % (file_name, error))
+        if importer.errors:
+            self.stderr.write("%d files could not be imported" % len(importer.errors))
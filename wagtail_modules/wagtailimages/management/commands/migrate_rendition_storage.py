@@ -0,0 +1,137 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+
+from django.core.files.move import file_move_safe
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Case, CharField, Value, When
+
+from wagtail.wagtailimages import get_image_model
+from wagtail.wagtailimages.models import RENDITION_STORAGE_LAYOUTS
+from wagtail.wagtailimages.rendition_cache import get_rendition_cache, invalidate_many_image_renditions
+
+
+def move_file(storage, old_name, new_name, max_length=None):
+    """
+    Moves a file to a new name within the storage, returning the name it was given.
+    Files in local storage are renamed; otherwise they're copied and then deleted.
+    """
+    new_name = storage.get_available_name(new_name, max_length=max_length)
+
+    try:
+        old_path = storage.path(old_name)
+    except NotImplementedError:
+        old_path = None
+
+    if old_path is not None:
+        new_path = storage.path(new_name)
+
+        directory = os.path.dirname(new_path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        file_move_safe(old_path, new_path)
+    else:
+        with storage.open(old_name, 'rb') as f:
+            new_name = storage.save(new_name, f)
+        storage.delete(old_name)
+
+    return new_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves existing rendition files into the directories of the current rendition storage layout. "
+        "Running processes are told to discard the rendition details they have cached through the "
+        "shared WAGTAILIMAGES_RENDITION_CACHE_BACKEND cache, which they notice within a few seconds; "
+        "if this command is run without that setting, restart them once it has finished."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--layout', choices=RENDITION_STORAGE_LAYOUTS,
+            help="Storage layout to move the renditions to "
+                 "(default: the WAGTAILIMAGES_RENDITION_STORAGE_LAYOUT setting)")
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Number of renditions to update in the database at once (default: 500)")
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help="Only report the number of renditions that would be moved")
+
+    def update_file_names(self, Rendition, new_names):
+        """
+        Saves the new file names of a batch of renditions in a single query
+        """
+        Rendition.objects.filter(pk__in=new_names.keys()).update(file=Case(
+            *[When(pk=pk, then=Value(name)) for pk, name in new_names.items()],
+            output_field=CharField()
+        ))
+
+    def handle(self, **options):
+        Image = get_image_model()
+        Rendition = Image.get_rendition_model()
+        field = Rendition._meta.get_field('file')
+        storage = field.storage
+
+        layout = options['layout'] or Rendition.get_storage_layout()
+        if layout not in RENDITION_STORAGE_LAYOUTS:
+            raise CommandError("Unknown rendition storage layout: %s" % layout)
+
+        if not options['dry_run'] and get_rendition_cache().backend is None:
+            self.stderr.write(
+                "WARNING: WAGTAILIMAGES_RENDITION_CACHE_BACKEND is not set, so running processes "
+                "can't be told that the rendition files have moved. If they cache rendition "
+                "details, restart them once this command has finished."
+            )
+
+        moved_count = 0
+        missing_count = 0
+        last_pk = 0
+
+        while True:
+            batch = list(
+                Rendition.objects.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', 'image_id', 'file')[:options['batch_size']]
+            )
+            if not batch:
+                break
+
+            last_pk = batch[-1][0]
+            new_names = {}
+            image_ids = set()
+
+            try:
+                for pk, image_id, old_name in batch:
+                    rendition = Rendition(pk=pk, image_id=image_id)
+                    new_name = rendition.get_upload_to(os.path.basename(old_name), layout=layout)
+
+                    if new_name == old_name:
+                        continue
+
+                    if options['dry_run']:
+                        moved_count += 1
+                        continue
+
+                    if not storage.exists(old_name):
+                        missing_count += 1
+                        continue
+
+                    new_names[pk] = move_file(storage, old_name, new_name, max_length=field.max_length)
+                    image_ids.add(image_id)
+            finally:
+                # Record the files that have been moved, even if moving one of them failed
+                if new_names:
+                    self.update_file_names(Rendition, new_names)
+                    moved_count += len(new_names)
+
+                    invalidate_many_image_renditions(Image, image_ids)
+
+        if options['dry_run']:
+            self.stdout.write("%d renditions would be moved" % moved_count)
+        else:
+            self.stdout.write("Moved %d renditions" % moved_count)
+
+        if missing_count:
+            self.stderr.write("%d rendition files were missing from storage and were not moved" % missing_count)
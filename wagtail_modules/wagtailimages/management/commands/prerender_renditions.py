@@ -0,0 +1,253 @@
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import multiprocessing
+import os
+import time
+
+from django.conf import settings
+from django.core.files.images import get_image_dimensions
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.template.defaultfilters import filesizeformat
+from django.utils.dateparse import parse_date, parse_datetime
+
+from wagtail.wagtailimages import get_image_model
+from wagtail.wagtailimages.exceptions import InvalidFilterSpecError
+from wagtail.wagtailimages.models import Filter, SourceImageIOError, get_peak_memory_usage
+
+logger = logging.getLogger('wagtail.images')
+
+
+def render_image(image, filter_specs):
+    """
+    Generates renditions of an image and saves their files. Runs in a worker process,
+    and returns the details of the renditions for the main process to insert into the
+    database, as a list of (filter_spec, focal_point_key, file_name, file_size, width,
+    height) tuples. The worker's process id and peak memory usage are returned along
+    with them.
+
+    This mustn't use the database, as forked workers share the main process's
+    connection.
+    """
+    import django
+    from django.apps import apps
+
+    # Worker processes that weren't forked from the main process have to set up
+    # Django themselves
+    if not apps.ready:
+        django.setup()
+
+    filters = [Filter(spec=filter_spec) for filter_spec in filter_specs]
+
+    results = []
+    for filter, generated_image in image.generate_rendition_images(filters):
+        with generated_image.f as output:
+            file_size = output.tell()
+            width, height = get_image_dimensions(output)
+            file_name = image.save_rendition_file(filter, generated_image)
+
+        results.append((filter.spec, filter.get_cache_key(image), file_name, file_size, width, height))
+
+    return os.getpid(), get_peak_memory_usage(), results
+
+
+class Command(BaseCommand):
+    help = "Generates renditions of images ahead of them being requested"
+
+    def add_arguments(self, parser):
+        parser.add_argument('filter_specs', nargs='+', metavar='filter_spec')
+        parser.add_argument(
+            '--folder', type=int,
+            help="Only render images in the folder with this id")
+        parser.add_argument(
+            '--collection', type=int,
+            help="Only render images in the collection with this id")
+        parser.add_argument(
+            '--created-since',
+            help="Only render images created on or after this date (YYYY-MM-DD) or time")
+        parser.add_argument(
+            '--workers', type=int, default=multiprocessing.cpu_count(),
+            help="Number of worker processes to render images with (default: one per CPU)")
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help="Number of renditions to insert into the database at once (default: 100)")
+
+    def get_images(self, options):
+        images = get_image_model().objects.all()
+
+        if options['folder'] is not None:
+            images = images.filter(folder_id=options['folder'])
+
+        if options['collection'] is not None:
+            images = images.filter(collection_id=options['collection'])
+
+        if options['created_since']:
+            created_since = parse_datetime(options['created_since']) or parse_date(options['created_since'])
+            if created_since is None:
+                raise CommandError("Invalid date: %s" % options['created_since'])
+            images = images.filter(created_at__gte=created_since)
+
+        return images.order_by('pk')
+
+    def get_jobs(self, images, filters):
+        """
+        Yields (image, filter_specs) pairs for the images that are missing any of the
+        renditions
+        """
+        Rendition = images.model.get_rendition_model()
+
+        # Fetch all the renditions that already exist in a single query
+        existing = set(Rendition.objects.filter(
+            image__in=images,
+            filter_spec__in=[filter.spec for filter in filters],
+        ).values_list('image_id', 'filter_spec', 'focal_point_key'))
+
+        for image in images.iterator():
+            filter_specs = [
+                filter.spec for filter in filters
+                if (image.pk, filter.spec, filter.get_cache_key(image)) not in existing
+            ]
+            if filter_specs:
+                if getattr(settings, 'WAGTAILIMAGES_CONTENT_ADDRESSED_RENDITIONS', False):
+                    # Rendition file names include the hash of the image, which may
+                    # need to be saved to the database first
+                    image.get_file_hash()
+
+                yield image, filter_specs
+
+    def save_renditions(self, renditions):
+        """
+        Inserts the renditions into the database, returning the number inserted
+        """
+        Rendition = type(renditions[0])
+
+        try:
+            with transaction.atomic():
+                Rendition.objects.bulk_create(renditions)
+            return len(renditions)
+        except IntegrityError:
+            pass
+
+        # Some of the renditions have been created in the meantime (such as by a
+        # page being viewed). Insert the rest one by one.
+        saved_count = 0
+        for rendition in renditions:
+            try:
+                with transaction.atomic():
+                    rendition.save()
+                saved_count += 1
+            except IntegrityError:
+                existing_file_name = Rendition.objects.filter(
+                    image_id=rendition.image_id,
+                    filter_spec=rendition.filter_spec,
+                    focal_point_key=rendition.focal_point_key,
+                ).values_list('file', flat=True).first()
+
+                # Content-addressed renditions have the same file name as the one
+                # that was created in the meantime, so the file mustn't be deleted
+                if existing_file_name != rendition.file.name:
+                    rendition.file.storage.delete(rendition.file.name)
+
+        return saved_count
+
+    def handle(self, **options):
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+        try:
+            filters = [Filter(spec=filter_spec) for filter_spec in options['filter_specs']]
+            for filter in filters:
+                filter.operations
+        except InvalidFilterSpecError as e:
+            raise CommandError(e)
+
+        images = self.get_images(options)
+        Rendition = images.model.get_rendition_model()
+        jobs = self.get_jobs(images, filters)
+
+        image_count = 0
+        rendition_count = 0
+        error_count = 0
+        bytes_written = 0
+        peak_memory_usage = {}
+        pending_renditions = []
+        start_time = time.time()
+
+        executor = ProcessPoolExecutor(max_workers=options['workers'])
+        in_flight = {}
+
+        try:
+            while True:
+                # Keep a bounded number of images queued up, so that the whole
+                # queryset isn't loaded into memory
+                while len(in_flight) < options['workers'] * 2:
+                    try:
+                        image, filter_specs = next(jobs)
+                    except StopIteration:
+                        break
+                    in_flight[executor.submit(render_image, image, filter_specs)] = image
+
+                if not in_flight:
+                    break
+
+                done, not_done = wait(in_flight, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    image = in_flight.pop(future)
+                    image_count += 1
+
+                    try:
+                        pid, peak_memory, results = future.result()
+                    except (SourceImageIOError, IOError) as e:
+                        error_count += 1
+                        self.stderr.write("Failed to render image %d: %s" % (image.pk, e))
+                        continue
+                    except Exception as e:
+                        # Such as a corrupt file that the image library can't read. This
+                        # mustn't stop the other images from being rendered.
+                        error_count += 1
+                        logger.exception("Failed to render image %d", image.pk)
+                        self.stderr.write("Failed to render image %d: %r" % (image.pk, e))
+                        continue
+
+                    peak_memory_usage[pid] = peak_memory
+
+                    for filter_spec, focal_point_key, file_name, file_size, width, height in results:
+                        bytes_written += file_size
+
+                        # The dimensions are passed in, so that they aren't read back
+                        # from storage
+                        pending_renditions.append(Rendition(
+                            image=image,
+                            filter_spec=filter_spec,
+                            focal_point_key=focal_point_key,
+                            file=file_name,
+                            width=width,
+                            height=height,
+                        ))
+
+                if len(pending_renditions) >= options['batch_size']:
+                    rendition_count += self.save_renditions(pending_renditions)
+                    pending_renditions = []
+        finally:
+            executor.shutdown()
+
+            # Save the renditions whose files have been written, even if the run was
+            # stopped by an error, so that the files aren't left without rows
+            if pending_renditions:
+                rendition_count += self.save_renditions(pending_renditions)
+
+        elapsed = time.time() - start_time
+        self.stdout.write(
+            "Rendered %d renditions of %d images in %.1f seconds (%.1f images/sec, %s written)" % (
+                rendition_count,
+                image_count,
+                elapsed,
+                image_count / elapsed if elapsed else 0,
+                filesizeformat(bytes_written),
+            )
+        )
+        if peak_memory_usage and None not in peak_memory_usage.values():
+            self.stdout.write("Peak memory usage per worker: %s" % filesizeformat(max(peak_memory_usage.values())))
+        if error_count:
+            self.stderr.write("%d images could not be rendered" % error_count)
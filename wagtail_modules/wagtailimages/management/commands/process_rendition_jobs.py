@@ -0,0 +1,27 @@
+from __future__ import absolute_import, unicode_literals
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from wagtail.wagtailimages.rendition_queue import process_rendition_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates the renditions queued when WAGTAILIMAGES_ASYNC_RENDITIONS is enabled, including "
+        "ones whose jobs were left unfinished by a worker that stopped or failed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retry-failed', action='store_true', default=False,
+            help="Retry failed jobs straight away, rather than once WAGTAILIMAGES_ASYNC_RENDITION_TIMEOUT has passed")
+
+    def handle(self, **options):
+        start_time = time.time()
+        run_count, failed_count = process_rendition_jobs(retry_failed=options['retry_failed'])
+
+        self.stdout.write("Ran %d rendition jobs in %.1f seconds" % (run_count, time.time() - start_time))
+        if failed_count:
+            self.stderr.write("%d rendition jobs failed" % failed_count)
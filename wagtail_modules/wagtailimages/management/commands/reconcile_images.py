@@ -0,0 +1,102 @@
+from __future__ import absolute_import, unicode_literals
+
+import io
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wagtail.wagtailimages.exceptions import ReconciliationError
+from wagtail.wagtailimages.reconciler import ISSUE_TYPES, Reconciler
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the files under MEDIA_ROOT with the image folders, images and renditions in the "
+        "database, reporting (or fixing) missing files and directories, and orphan files"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true', default=False,
+            help="Create missing directories and orphan folders, delete images with missing files, "
+                 "import orphan image files and delete orphan rendition files")
+        parser.add_argument(
+            '--max-deletions', type=int, default=100,
+            help="With --fix, stop with an error rather than delete more than this many images "
+                 "with missing files (default: 100)")
+        parser.add_argument(
+            '--limit', type=int,
+            help="Stop after scanning this many files, printing the cursor to resume from")
+        parser.add_argument(
+            '--start-after',
+            help="Resume from the cursor printed by a previous run")
+        parser.add_argument(
+            '--cursor-file',
+            help="File to resume from and save the cursor to, so that periodic runs with --limit "
+                 "scan the whole tree over several runs")
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help="Ignore files modified less than this many seconds ago (default: 3600)")
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Number of rows to query or change in the database at once (default: 500)")
+
+    def read_cursor(self, cursor_file):
+        if not os.path.exists(cursor_file):
+            return None
+
+        with io.open(cursor_file, encoding='utf-8') as f:
+            return f.read().strip() or None
+
+    def write_cursor(self, cursor_file, cursor):
+        if cursor is None:
+            # The scan is complete, so the next one starts from the beginning
+            if os.path.exists(cursor_file):
+                os.remove(cursor_file)
+        else:
+            with io.open(cursor_file, 'w', encoding='utf-8') as f:
+                f.write(cursor)
+
+    def report(self, issue_type, name):
+        self.stdout.write("%s: %s" % (issue_type, name))
+
+    def handle(self, **options):
+        if options['start_after'] and options['cursor_file']:
+            raise CommandError("--start-after and --cursor-file can't be used together")
+
+        start_after = options['start_after']
+        if options['cursor_file']:
+            start_after = self.read_cursor(options['cursor_file'])
+
+        reconciler = Reconciler(
+            fix=options['fix'],
+            min_age=options['min_age'],
+            batch_size=options['batch_size'],
+            report=self.report,
+            max_deletions=options['max_deletions'],
+        )
+        start_time = time.time()
+        try:
+            cursor = reconciler.run(start_after=start_after, limit=options['limit'])
+        except ReconciliationError as e:
+            raise CommandError(e)
+        elapsed = time.time() - start_time
+
+        if options['cursor_file']:
+            self.write_cursor(options['cursor_file'], cursor)
+
+        self.stdout.write(
+            "Scanned %d files in %.1f seconds (%.1f files/sec)" % (
+                reconciler.file_count,
+                elapsed,
+                reconciler.file_count / elapsed if elapsed else 0,
+            )
+        )
+        self.stdout.write(", ".join(
+            "%d %s" % (reconciler.counts[issue_type], issue_type.replace('_', ' ') + 's')
+            for issue_type in ISSUE_TYPES
+        ) + (" (fixed)" if options['fix'] else ""))
+
+        if cursor is not None and not options['cursor_file']:
+            self.stdout.write("Resume with --start-after=%s" % cursor)
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailimages', '0018_image_folder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenditionJob',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, auto_created=True, verbose_name='ID')),
+                ('image_id', models.PositiveIntegerField()),
+                ('filter_spec', models.CharField(max_length=255)),
+                ('focal_point_key', models.CharField(max_length=16, blank=True, default='')),
+                ('status', models.CharField(max_length=16, choices=[('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed')], default='pending', db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='renditionjob',
+            unique_together=set([('image_id', 'filter_spec', 'focal_point_key')]),
+        ),
+    ]
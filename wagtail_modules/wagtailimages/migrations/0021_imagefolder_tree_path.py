@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def set_tree_paths(apps, schema_editor):
+    ImageFolder = apps.get_model('wagtailimages', 'ImageFolder')
+    db_alias = schema_editor.connection.alias
+
+    parent_ids = dict(ImageFolder.objects.using(db_alias).values_list('id', 'folder_id'))
+    tree_paths = {}
+
+    def get_tree_path(folder_id):
+        if folder_id not in tree_paths:
+            parent_id = parent_ids[folder_id]
+            if parent_id is None:
+                tree_paths[folder_id] = ('%d/' % folder_id, 1)
+            else:
+                parent_tree_path, parent_depth = get_tree_path(parent_id)
+                tree_paths[folder_id] = ('%s%d/' % (parent_tree_path, folder_id), parent_depth + 1)
+        return tree_paths[folder_id]
+
+    for folder_id in parent_ids:
+        tree_path, depth = get_tree_path(folder_id)
+        ImageFolder.objects.using(db_alias).filter(id=folder_id).update(tree_path=tree_path, depth=depth)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailimages', '0020_image_file_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagefolder',
+            name='tree_path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='imagefolder',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(set_tree_paths, migrations.RunPython.noop),
+    ]
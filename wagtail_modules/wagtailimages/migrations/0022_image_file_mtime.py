@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailimages', '0021_imagefolder_tree_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='file_mtime',
+            field=models.FloatField(editable=False, null=True),
+        ),
+    ]
@@ -1,31 +1,46 @@
 from __future__ import absolute_import, unicode_literals
 
+import copy
 import hashlib
 import inspect
+import io
+import logging
+import math
 import os
 import shutil
 import os.path
+import sys
+import threading
+import uuid
 import warnings
 from collections import OrderedDict
 from contextlib import contextmanager
+from tempfile import SpooledTemporaryFile
 
 import django
+import PIL.Image
 from django.conf import settings
 from django.core import checks
 from django.core.files import File
+from django.core.files.images import get_image_dimensions
+from django.core.files.move import file_move_safe
 from django.core.urlresolvers import reverse
-from django.db import models
-from django.db.models.signals import post_delete, pre_save
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
+from django.db.models.query import prefetch_related_objects
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch.dispatcher import receiver
 from django.forms.widgets import flatatt
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.functional import cached_property
 from django.utils.safestring import mark_safe
-from django.utils.six import BytesIO, string_types, text_type
+from django.utils.six import string_types, text_type
 from django.utils.translation import ugettext_lazy as _
 from taggit.managers import TaggableManager
 from unidecode import unidecode
 from willow.image import Image as WillowImage
+from willow.plugins.pillow import PillowImage
 from django.core.exceptions import ValidationError
 
 from wagtail.utils.deprecation import RemovedInWagtail19Warning, RemovedInWagtail110Warning
@@ -34,11 +49,80 @@ from wagtail.wagtailcore import hooks
 from wagtail.wagtailcore.models import CollectionMember
 from wagtail.wagtailimages.exceptions import InvalidFilterSpecError
 from wagtail.wagtailimages.rect import Rect
+from wagtail.wagtailimages.rendition_cache import (
+    get_image_key, get_rendition_cache, invalidate_image_renditions)
+from wagtail.wagtailimages.rendition_locks import rendition_lock
 from wagtail.wagtailsearch import index
+from wagtail.wagtailsearch.backends import get_search_backends_with_name
 from wagtail.wagtailsearch.queryset import SearchableQuerySetMixin
 
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+logger = logging.getLogger('wagtail.images')
+
+# Number of images deleted at a time when deleting a folder
+FOLDER_DELETE_BATCH_SIZE = 500
+
 IMAGES_FOLDER_NAME = 'original_images'
 
+# The ways rendition files can be arranged into directories, see AbstractRendition.get_upload_to
+RENDITION_STORAGE_LAYOUTS = ('flat', 'hashed', 'image_id')
+
+# A mapping of image formats to extensions
+FORMAT_EXTENSIONS = {
+    'jpeg': '.jpg',
+    'png': '.png',
+    'gif': '.gif',
+}
+
+# The formats of rendition files, by extension
+EXTENSION_FORMATS = {
+    '.jpg': 'jpeg',
+    '.jpeg': 'jpeg',
+    '.png': 'png',
+    '.gif': 'gif',
+}
+
+
+class RenditionOutputFile(SpooledTemporaryFile):
+    """
+    A temporary file to write generated renditions to. It's kept in memory until it
+    grows larger than the ``WAGTAILIMAGES_RENDITION_MAX_MEMORY_SIZE`` setting (2.5MB by
+    default), and is then moved to disk.
+    """
+    def __init__(self):
+        SpooledTemporaryFile.__init__(
+            self, max_size=getattr(settings, 'WAGTAILIMAGES_RENDITION_MAX_MEMORY_SIZE', 2621440)
+        )
+
+    def fileno(self):
+        # Pillow writes directly to the file descriptor of files that have one, which
+        # would move the file to disk straight away
+        if not self._rolled:
+            raise io.UnsupportedOperation("fileno")
+
+        return SpooledTemporaryFile.fileno(self)
+
+
+def get_peak_memory_usage():
+    """
+    Returns the peak memory usage of the current process in bytes, or None if it can't
+    be measured on this platform
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # This is in bytes on macOS, and kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return peak
+    return peak * 1024
+
 
 class SourceImageIOError(IOError):
     """
@@ -48,7 +132,13 @@ class SourceImageIOError(IOError):
 
 
 class ImageQuerySet(SearchableQuerySetMixin, models.QuerySet):
-    pass
+    def prefetch_renditions(self, *filters):
+        """
+        Prefetches the renditions matching the given filters (spec strings or
+        Filter objects) with one query, so that ``get_rendition`` can find them
+        without querying the database for every image.
+        """
+        return self.prefetch_related(get_renditions_prefetch(self.model.get_rendition_model(), filters))
 
 
 def get_image_model():
@@ -59,6 +149,94 @@ def get_image_model():
     return get_image_model()
 
 
+def get_renditions_prefetch(rendition_model, filters):
+    filter_specs = [
+        filter if isinstance(filter, string_types) else filter.spec
+        for filter in filters
+    ]
+    return models.Prefetch('renditions', queryset=rendition_model.objects.filter(filter_spec__in=filter_specs))
+
+
+def prefetch_renditions(images, *filters):
+    """
+    Prefetches the renditions matching the given filters for a list of image
+    objects, in one query. This is the equivalent of
+    ``ImageQuerySet.prefetch_renditions`` for images that have already been fetched.
+    """
+    images = [image for image in images if image is not None]
+    if not images:
+        return
+
+    lookup = get_renditions_prefetch(images[0].get_rendition_model(), filters)
+
+    # prefetch_related_objects skips images whose renditions have already been
+    # prefetched (for other filters), so theirs are fetched separately and added to
+    # the ones they have
+    prefetched_images = [
+        image for image in images if 'renditions' in getattr(image, '_prefetched_objects_cache', {})
+    ]
+    other_images = [
+        image for image in images if 'renditions' not in getattr(image, '_prefetched_objects_cache', {})
+    ]
+
+    if other_images:
+        if django.VERSION >= (1, 10):
+            prefetch_related_objects(other_images, lookup)
+        else:
+            prefetch_related_objects(other_images, [lookup])
+
+    if prefetched_images:
+        images_by_id = {}
+        for image in prefetched_images:
+            images_by_id.setdefault(image.pk, []).append(image)
+
+        for rendition in lookup.queryset.filter(image_id__in=images_by_id.keys()):
+            for image in images_by_id[rendition.image_id]:
+                renditions = image._prefetched_objects_cache['renditions']
+                if not any(existing.pk == rendition.pk for existing in renditions):
+                    renditions._result_cache.append(rendition)
+
+
+def open_for_filters(willow, image, filters, env):
+    """
+    Prepares an image opened with ``get_willow_image`` for running the filters on,
+    returning the Willow image to pass to their operations.
+
+    This fixes the orientation of the image. JPEGs can also be decoded at 1/2, 1/4 or
+    1/8 of their full size, which is much faster and uses far less memory; this is
+    done if all the filters scale the image down by at least half. In that case,
+    ``env['unscaled-size']`` is set to the size of the full size image (see
+    ``Operation.get_output_scale``).
+    """
+    if willow.format_name == 'jpeg':
+        willow.f.seek(0)
+        pil_image = PIL.Image.open(willow.f)
+
+        # The filters run on the image after its orientation has been fixed, so swap
+        # the dimensions if the image is going to be rotated by 90 degrees
+        width, height = pil_image.size
+        exif = pil_image._getexif() if hasattr(pil_image, '_getexif') else None
+        if exif is not None and exif.get(0x0112, 1) in (5, 6, 7, 8):
+            unscaled_size = (height, width)
+        else:
+            unscaled_size = (width, height)
+
+        scale = max(filter.get_output_scale(image, unscaled_size) for filter in filters)
+
+        if scale <= 0.5:
+            # Pillow picks the smallest scale that gives an image of at least this size
+            pil_image.draft(pil_image.mode, (int(math.ceil(width * scale)), int(math.ceil(height * scale))))
+
+            if pil_image.size != (width, height):
+                env['unscaled-size'] = unscaled_size
+
+            willow = PillowImage(pil_image)
+        else:
+            willow.f.seek(0)
+
+    return willow.auto_orient()
+
+
 def get_upload_to(instance, filename):
     """
     Obtain a valid upload path for an image file.
@@ -81,12 +259,75 @@ def get_rendition_upload_to(instance, filename):
     return instance.get_upload_to(filename)
 
 
+def save_file_as(storage, name, content, max_length=None):
+    """
+    Saves the content to the storage at exactly the given name, replacing any file
+    that's already there, without checking whether the name is taken first. Only
+    suitable for names that are unique to their content. Returns the name the file
+    was saved as.
+
+    Files in local storage are written to a temporary file and moved into place, so
+    that the file is never seen half-written. They're given the same permissions as
+    FileSystemStorage would give them.
+    """
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        # Remote storages generally write to the name they're given, but may choose
+        # another one
+        return storage.save(name, content, max_length=max_length)
+
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        try:
+            if getattr(storage, 'directory_permissions_mode', None) is not None:
+                # os.makedirs applies the umask, so it needs to be cleared to set
+                # the exact permissions (as FileSystemStorage does)
+                old_umask = os.umask(0)
+                try:
+                    os.makedirs(directory, storage.directory_permissions_mode)
+                finally:
+                    os.umask(old_umask)
+            else:
+                os.makedirs(directory)
+        except OSError:
+            # Another process may have just created it
+            if not os.path.isdir(directory):
+                raise
+
+    # The temporary file is created with the default permissions for new files
+    # (0666 less the umask), rather than the 0600 that tempfile uses
+    temp_path = '%s.%s.tmp' % (path, uuid.uuid4().hex)
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            for chunk in content.chunks():
+                temp_file.write(chunk)
+
+        if getattr(storage, 'file_permissions_mode', None) is not None:
+            os.chmod(temp_path, storage.file_permissions_mode)
+
+        file_move_safe(temp_path, path, allow_overwrite=True)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return name
+
+
 class ImageFolder(models.Model):
     folder = models.ForeignKey('self', null=True)  # Null value would mean it was in root image folder
     title = models.CharField(max_length=255, verbose_name=_('title'))
     created_at = models.DateTimeField(verbose_name=_('created at'), auto_now_add=True, db_index=True)
     path = models.TextField(blank=True)
 
+    # The ids of the folder's ancestors and the folder itself, eg. '1/5/12/', so that
+    # subtrees can be found with a (indexed) prefix match. Depth is 1 for folders in
+    # the root image folder.
+    tree_path = models.CharField(max_length=255, blank=True, db_index=True, editable=False)
+    depth = models.PositiveIntegerField(default=0, editable=False)
+
     admin_form_fields = (
         'title',
     )
@@ -97,18 +338,69 @@ class ImageFolder(models.Model):
         else:
             return False
 
+    def get_ancestor_ids(self):
+        return [int(folder_id) for folder_id in self.tree_path.split('/')[:-2]]
+
+    def get_ancestors(self):
+        """Returns the folders above this one, starting from the root, with one query."""
+        return ImageFolder.objects.filter(pk__in=self.get_ancestor_ids()).order_by('depth')
+
     def get_breadcrumbs(self):
-        folder_breadcrumb = []
-        folder_breadcrumb_current_folder = self
-        while folder_breadcrumb_current_folder:
-            folder_breadcrumb.append(folder_breadcrumb_current_folder)
-            folder_breadcrumb_current_folder = folder_breadcrumb_current_folder.get_parent()
-        folder_breadcrumb.reverse()
+        folder_breadcrumb = list(self.get_ancestors())
+        folder_breadcrumb.append(self)
         return folder_breadcrumb
 
     def get_subfolders(self):
         return ImageFolder.objects.filter(folder=self)
 
+    def get_descendants(self, include_self=False):
+        """Returns all the folders under this one, at any depth."""
+        descendants = ImageFolder.objects.filter(tree_path__startswith=self.tree_path)
+        if not include_self:
+            descendants = descendants.exclude(pk=self.pk)
+        return descendants
+
+    def is_descendant_of(self, folder):
+        return self.tree_path.startswith(folder.tree_path) and self.pk != folder.pk
+
+    def get_descendant_images(self):
+        """Returns the images in this folder and all the folders under it."""
+        from wagtail.wagtailimages import get_image_model
+        return get_image_model().objects.filter(folder__tree_path__startswith=self.tree_path)
+
+    def get_image_count(self):
+        """Returns the number of images in this folder and all the folders under it."""
+        return self.get_descendant_images().count()
+
+    def get_tree_path(self):
+        parent_folder = self.folder
+        if parent_folder:
+            return '%s%d/' % (parent_folder.tree_path, self.pk), parent_folder.depth + 1
+        else:
+            return '%d/' % self.pk, 1
+
+    def update_tree_path(self):
+        """Updates the tree paths of the folder and the folders under it, after it has
+        been created or moved to another parent folder, with one query."""
+        old_tree_path = self.tree_path
+        new_tree_path, new_depth = self.get_tree_path()
+        if old_tree_path == new_tree_path:
+            return
+
+        if old_tree_path:
+            ImageFolder.objects.filter(tree_path__startswith=old_tree_path).update(
+                tree_path=Concat(
+                    Value(new_tree_path), Substr('tree_path', len(old_tree_path) + 1),
+                    output_field=models.CharField()
+                ),
+                depth=F('depth') + (new_depth - self.depth),
+            )
+        else:
+            ImageFolder.objects.filter(pk=self.pk).update(tree_path=new_tree_path, depth=new_depth)
+
+        self.tree_path = new_tree_path
+        self.depth = new_depth
+
     def save(self, *args, **kwargs):
 
         # do a unidecode in the title and then
@@ -121,50 +413,93 @@ class ImageFolder(models.Model):
         else:
             self.path = os.path.join(IMAGES_FOLDER_NAME, unicoded_title)
 
+        if self.folder and self.tree_path and self.folder.tree_path.startswith(self.tree_path):
+            raise ValueError("A folder can't be moved into itself or one of its sub folders")
+
         if self.pk is None:
             super(ImageFolder, self).save()
+            self.update_tree_path()
             # Create the folder
             os.makedirs(self.get_complete_path())
         else:
-            if 'rename' in kwargs and not kwargs['rename']:
-                # In case of sub folders, only the DB needs to updated
-                # The physical path would be updated by the parent folder
-                super(ImageFolder, self).save()
-            else:
-                current_path = ImageFolder.objects.get(pk=self.pk).get_complete_path()
+            current_path = ImageFolder.objects.filter(pk=self.pk).values_list('path', flat=True).get()
+
+            with transaction.atomic():
+                self.update_tree_path()
                 super(ImageFolder, self).save()
-                # Rename the folder
-                os.rename(current_path, self.get_complete_path())
 
-            # Update the images' paths
-            Image = get_image_model()
-            images = Image.objects.filter(folder=self)
-            for image in images:
-                image.file.name = os.path.join(self.path, image.filename)
-                image.save()
+                if current_path != self.path:
+                    self.update_subtree_paths(current_path)
+
+                    if kwargs.get('rename', True):
+                        # Rename the folder. This is done last, so that the database
+                        # changes are rolled back if it fails.
+                        os.rename(os.path.join(settings.MEDIA_ROOT, current_path), self.get_complete_path())
+
+    def update_subtree_paths(self, old_path):
+        """Replaces the old path of this folder with its new one at the start of the paths of
+        the folders under it and the file names of all their images, with one query each."""
+        def replace_prefix(field_name, old_prefix, new_prefix):
+            return Concat(
+                Value(new_prefix), Substr(field_name, len(old_prefix) + 1),
+                output_field=models.TextField()
+            )
+
+        self.get_descendants().filter(path__startswith=old_path + '/').update(
+            path=replace_prefix('path', old_path + '/', self.path + '/')
+        )
 
-            # Update the sub_folders' path
-            for sub_folder in self.get_subfolders():
-                sub_folder.save(rename=False)
+        self.get_descendant_images().filter(file__startswith=old_path + '/').update(
+            file=replace_prefix('file', old_path + '/', self.path + '/')
+        )
 
     def delete(self, *args, **kwargs):
-        # Recursively delete the sub folders
-        for sub_folder in self.get_subfolders():
-            sub_folder.delete()
+        """Deletes the folder along with all the folders and images under it.
 
-        # Delete the images
+        The images and their renditions are deleted with a few queries per batch of
+        images, rather than one at a time. Once the transaction has been committed,
+        the directory is deleted, and the files of the renditions and the search index
+        entries of the images are deleted in background threads."""
+        from wagtail.wagtailimages import get_image_model
         Image = get_image_model()
-        images = Image.objects.filter(folder=self)
-        for image in images:
-            image.delete()
+        Rendition = Image.get_rendition_model()
 
-        try:
-            # Delete the physical folder
-            shutil.rmtree(self.get_complete_path())
-        except FileNotFoundError:
-            pass
+        image_ids = list(self.get_descendant_images().values_list('pk', flat=True))
 
-        super(ImageFolder, self).delete()
+        with transaction.atomic():
+            with defer_file_deletion() as deleted_files, defer_search_index_removal() as deleted_images:
+                for i in range(0, len(image_ids), FOLDER_DELETE_BATCH_SIZE):
+                    batch = image_ids[i:i + FOLDER_DELETE_BATCH_SIZE]
+                    Rendition.objects.filter(image_id__in=batch).delete()
+                    Image.objects.filter(pk__in=batch).delete()
+
+                self.get_descendants(include_self=True).delete()
+
+        # The original images in the folder are removed along with the physical folder
+        deleted_files = [
+            (storage, name) for storage, name in deleted_files
+            if not name.startswith(self.path + '/')
+        ]
+        complete_path = self.get_complete_path()
+
+        def delete_folder_files():
+            try:
+                # Delete the physical folder
+                shutil.rmtree(complete_path)
+            except FileNotFoundError:
+                pass
+
+            if deleted_files:
+                delete_files_in_background(deleted_files)
+            if deleted_images:
+                run_in_background(remove_from_search_index, deleted_images)
+
+        # Nothing is deleted from disk or the search index if the transaction is rolled
+        # back (transaction.on_commit was added in Django 1.9)
+        if hasattr(transaction, 'on_commit'):
+            transaction.on_commit(delete_folder_files)
+        else:
+            delete_folder_files()
 
     def validate_folder(self):
         """Validates whether a folder can be created.
@@ -218,6 +553,10 @@ class AbstractImage(CollectionMember, index.Indexed, models.Model):
     focal_point_height = models.PositiveIntegerField(null=True, blank=True)
 
     file_size = models.PositiveIntegerField(null=True, editable=False)
+    file_hash = models.CharField(max_length=40, blank=True, editable=False)
+    # The modification time of the file when it was imported from the filesystem
+    # (see ImageImporter), to tell whether it has changed since
+    file_mtime = models.FloatField(null=True, editable=False)
 
     objects = ImageQuerySet.as_manager()
 
@@ -244,6 +583,23 @@ class AbstractImage(CollectionMember, index.Indexed, models.Model):
 
         return self.file_size
 
+    def get_file_hash(self):
+        if not self.file_hash:
+            file_hash = hashlib.sha1()
+
+            try:
+                with self.file.storage.open(self.file.name, 'rb') as f:
+                    for chunk in f.chunks():
+                        file_hash.update(chunk)
+            except IOError:
+                # File doesn't exist
+                return
+
+            self.file_hash = file_hash.hexdigest()
+            self.save(update_fields=['file_hash'])
+
+        return self.file_hash
+
     def get_upload_to(self, filename):
         filename = self.file.field.storage.get_valid_name(filename)
 
@@ -288,6 +644,16 @@ class AbstractImage(CollectionMember, index.Indexed, models.Model):
     def __str__(self):
         return self.title
 
+    def get_indexed_instance(self):
+        deferred_objects = getattr(_deferred_search_index_removals, 'objects', None)
+        if deferred_objects is not None:
+            # The image is being deleted within defer_search_index_removal. A copy is
+            # recorded, as the deletion clears the image's id.
+            deferred_objects.append(copy.copy(self))
+            return None
+
+        return super(AbstractImage, self).get_indexed_instance()
+
     @contextmanager
     def get_willow_image(self):
         # Open file if it is closed
@@ -339,6 +705,11 @@ class AbstractImage(CollectionMember, index.Indexed, models.Model):
         return self.get_focal_point() is not None
 
     def set_focal_point(self, rect):
+        if self.pk is not None:
+            # Renditions are looked up by a key derived from the focal point, so
+            # cached lookups made under the old key are of no further use
+            invalidate_image_renditions(type(self), self.pk)
+
         if rect is not None:
             self.focal_point_x = rect.centroid_x
             self.focal_point_y = rect.centroid_y
@@ -393,49 +764,320 @@ class AbstractImage(CollectionMember, index.Indexed, models.Model):
         else:
             return cls.renditions.related.related_model
 
+    def find_existing_rendition(self, filter):
+        """
+        Returns the rendition for the given filter if it has already been generated,
+        otherwise raises the rendition model's DoesNotExist exception.
+
+        Renditions prefetched with ``prefetch_renditions`` are checked first, followed
+        by the rendition cache and then the database.
+        """
+        rendition = self.find_cached_rendition(filter)
+        if rendition is not None:
+            return rendition
+
+        rendition = self.renditions.get(
+            filter_spec=filter.spec,
+            focal_point_key=filter.get_cache_key(self),
+        )
+        self.cache_rendition(rendition)
+        return rendition
+
+    def find_existing_renditions(self, filters):
+        """
+        Returns the renditions that have already been generated for the given
+        filters, as a dict keyed by filter spec. Filters without a rendition are
+        left out.
+
+        This is the equivalent of ``find_existing_rendition`` for several filters at
+        once; the renditions that aren't prefetched or cached are fetched from the
+        database together, in a single query.
+        """
+        renditions = {}
+        uncached_filters = {}
+
+        for filter in filters:
+            rendition = self.find_cached_rendition(filter)
+            if rendition is not None:
+                renditions[filter.spec] = rendition
+            else:
+                uncached_filters[filter.spec] = filter
+
+        if uncached_filters:
+            for rendition in self.renditions.filter(filter_spec__in=uncached_filters.keys()):
+                filter = uncached_filters[rendition.filter_spec]
+                if rendition.focal_point_key == filter.get_cache_key(self):
+                    renditions[filter.spec] = rendition
+                    self.cache_rendition(rendition)
+
+        return renditions
+
+    def find_cached_rendition(self, filter):
+        """
+        Returns the rendition for the given filter if it has been prefetched with
+        ``prefetch_renditions`` or is in the rendition cache, without querying the
+        database. Otherwise returns None.
+        """
+        cache_key = filter.get_cache_key(self)
+
+        if 'renditions' in getattr(self, '_prefetched_objects_cache', {}):
+            for rendition in self.renditions.all():
+                if rendition.filter_spec == filter.spec and rendition.focal_point_key == cache_key:
+                    return rendition
+
+        cached = get_rendition_cache().get(self.get_rendition_cache_key(), (filter.spec, cache_key))
+        if cached is not None:
+            return self.get_rendition_model()(
+                image=self,
+                filter_spec=filter.spec,
+                focal_point_key=cache_key,
+                **cached
+            )
+
+    def get_rendition_cache_key(self):
+        return get_image_key(type(self), self.pk)
+
+    def cache_rendition(self, rendition):
+        """
+        Stores the details needed to rebuild the rendition without a database
+        query in the rendition cache
+        """
+        get_rendition_cache().set(
+            self.get_rendition_cache_key(),
+            (rendition.filter_spec, rendition.focal_point_key),
+            {
+                'id': rendition.id,
+                'file': rendition.file.name,
+                'width': rendition.width,
+                'height': rendition.height,
+            }
+        )
+
     def get_rendition(self, filter):
         if isinstance(filter, string_types):
             filter = Filter(spec=filter)
 
-        cache_key = filter.get_cache_key(self)
         Rendition = self.get_rendition_model()
 
         try:
-            rendition = self.renditions.get(
-                filter_spec=filter.spec,
-                focal_point_key=cache_key,
-            )
+            rendition = self.find_existing_rendition(filter)
         except Rendition.DoesNotExist:
-            # Generate the rendition image
-            generated_image = filter.run(self, BytesIO())
-
-            # Generate filename
-            input_filename = os.path.basename(self.file.name)
-            input_filename_without_extension, input_extension = os.path.splitext(input_filename)
-
-            # A mapping of image formats to extensions
-            FORMAT_EXTENSIONS = {
-                'jpeg': '.jpg',
-                'png': '.png',
-                'gif': '.gif',
-            }
+            with rendition_lock(self.get_rendition_lock_key(filter)):
+                # Another thread or process may have generated the rendition while we
+                # were waiting for the lock
+                try:
+                    rendition = self.find_existing_rendition(filter)
+                except Rendition.DoesNotExist:
+                    rendition = self.create_rendition(filter)
 
-            output_extension = filter.spec.replace('|', '.') + FORMAT_EXTENSIONS[generated_image.format_name]
-            if cache_key:
-                output_extension = cache_key + '.' + output_extension
+        return rendition
 
-            # Truncate filename to prevent it going over 60 chars
-            output_filename_without_extension = input_filename_without_extension[:(59 - len(output_extension))]
-            output_filename = output_filename_without_extension + '.' + output_extension
+    def get_rendition_lock_key(self, filter):
+        return (self.get_rendition_cache_key(), filter.spec, filter.get_cache_key(self))
 
-            rendition, created = self.renditions.get_or_create(
-                filter_spec=filter.spec,
-                focal_point_key=cache_key,
-                defaults={'file': File(generated_image.f, name=output_filename)}
+    def get_rendition_filename(self, filter, format_name):
+        """
+        Returns the file name to give the rendition of this image generated by
+        ``filter``, in the given output format
+        """
+        cache_key = filter.get_cache_key(self)
+
+        if getattr(settings, 'WAGTAILIMAGES_CONTENT_ADDRESSED_RENDITIONS', False):
+            # Name the file after everything that determines its contents, so that the
+            # same rendition always gets the same name, and different ones never do
+            name_hash = hashlib.sha1('{}:{}:{}:{}'.format(
+                self.pk, self.get_file_hash() or '', filter.spec, cache_key
+            ).encode('utf-8'))
+            return name_hash.hexdigest() + FORMAT_EXTENSIONS[format_name]
+
+        input_filename = os.path.basename(self.file.name)
+        input_filename_without_extension, input_extension = os.path.splitext(input_filename)
+
+        output_extension = filter.spec.replace('|', '.') + FORMAT_EXTENSIONS[format_name]
+        if cache_key:
+            output_extension = cache_key + '.' + output_extension
+
+        # Truncate filename to prevent it going over 60 chars
+        output_filename_without_extension = input_filename_without_extension[:(59 - len(output_extension))]
+        return output_filename_without_extension + '.' + output_extension
+
+    def save_rendition_file(self, filter, generated_image):
+        """
+        Saves the output of a filter to the rendition storage, returning its file name
+        """
+        Rendition = self.get_rendition_model()
+        storage = Rendition._meta.get_field('file').storage
+        output_filename = self.get_rendition_filename(filter, generated_image.format_name)
+        name = Rendition(image=self, filter_spec=filter.spec).get_upload_to(output_filename)
+
+        if getattr(settings, 'WAGTAILIMAGES_CONTENT_ADDRESSED_RENDITIONS', False):
+            # The name is unique to the rendition, so it's written without checking
+            # whether the file exists. If another process has just generated it, the
+            # file is replaced with an identical one.
+            return save_file_as(
+                storage, name, File(generated_image.f), max_length=Rendition._meta.get_field('file').max_length
+            )
+
+        return storage.save(name, File(generated_image.f), max_length=Rendition._meta.get_field('file').max_length)
+
+    def save_rendition(self, filter, generated_image):
+        """
+        Records the output of a filter as a rendition of this image, unless the
+        rendition has already been created
+        """
+        with generated_image.f as output:
+            # Willow leaves the file positioned at the end of the image
+            output_size = output.tell()
+            width, height = get_image_dimensions(output)
+            file_name = self.save_rendition_file(filter, generated_image)
+
+        lookup = {'filter_spec': filter.spec, 'focal_point_key': filter.get_cache_key(self)}
+
+        try:
+            with transaction.atomic(using=router.db_for_write(self.get_rendition_model(), instance=self)):
+                rendition = self.renditions.create(file=file_name, width=width, height=height, **lookup)
+            created = True
+        except IntegrityError:
+            rendition = self.get_concurrently_created_rendition(lookup)
+            created = False
+
+        if created:
+            logger.debug(
+                "Generated rendition '%s' of image %d (%d bytes, peak memory usage %s bytes)",
+                filter.spec, self.pk, output_size, get_peak_memory_usage()
             )
+        elif rendition.file.name != file_name:
+            # Another process created the rendition while this one was generating it
+            rendition.file.storage.delete(file_name)
 
+        self.cache_rendition(rendition)
         return rendition
 
+    def get_concurrently_created_rendition(self, lookup):
+        """
+        Fetches the rendition that another worker created while this one was
+        generating it. rendition_lock only stops that from happening until the other
+        worker's transaction commits, so when it generated the rendition within a
+        transaction (such as with ATOMIC_REQUESTS), its row may not have been visible
+        before the lock was released.
+
+        The insert that failed waited for that transaction to commit. Within a
+        transaction, the row is fetched with a locking read, which sees rows committed
+        after the transaction started on databases (such as MySQL) that otherwise
+        wouldn't.
+        """
+        db = router.db_for_write(self.get_rendition_model(), instance=self)
+        renditions = self.renditions.using(db).filter(**lookup)
+        if transaction.get_connection(db).in_atomic_block:
+            renditions = renditions.select_for_update()
+
+        return renditions.get()
+
+    def create_rendition(self, filter):
+        # Generate the rendition image
+        generated_image = filter.run(self, RenditionOutputFile())
+        return self.save_rendition(filter, generated_image)
+
+    def generate_rendition_images(self, filters):
+        """
+        Runs each of the filters on this image, yielding (filter, generated_image)
+        pairs. The original image is only opened and decoded once.
+
+        Filters that only scale the image down are run largest first, so that smaller
+        ones can be generated from the output of a larger one instead of the original.
+        """
+        with self.get_willow_image() as willow:
+            original_format = willow.format_name
+            open_env = {}
+            willow = open_for_filters(willow, self, filters, open_env)
+            original_size = open_env.get('unscaled-size', willow.get_size())
+
+            def get_area(size):
+                return size[0] * size[1]
+
+            output_sizes = {}
+            for filter in filters:
+                if filter.only_resizes:
+                    output_size = filter.get_output_size(self, original_size)
+                    if output_size is not None:
+                        output_sizes[filter.spec] = output_size
+
+            filters = sorted(
+                filters,
+                key=lambda filter: get_area(output_sizes.get(filter.spec, (0, 0))),
+                reverse=True
+            )
+
+            resized_images = []
+            for filter in filters:
+                source = willow
+
+                output_size = output_sizes.get(filter.spec)
+                if output_size is not None:
+                    # Find the smallest image generated so far that's at least as big
+                    larger_images = [
+                        resized_image for resized_image in resized_images
+                        if resized_image.get_size()[0] >= output_size[0] and
+                        resized_image.get_size()[1] >= output_size[1]
+                    ]
+                    if larger_images:
+                        source = min(larger_images, key=lambda resized_image: get_area(resized_image.get_size()))
+
+                        # Resize it to exactly the size the filter would output, so that
+                        # the filter's own resize operations won't do anything
+                        if source.get_size() != output_size:
+                            source = source.resize(output_size)
+
+                env = {
+                    'original-format': original_format,
+                }
+                if source is willow:
+                    env.update(open_env)
+
+                output_willow = filter.apply_operations(source, self, env)
+                if output_size is not None:
+                    resized_images.append(output_willow)
+
+                yield filter, filter.save_output(output_willow, env, RenditionOutputFile())
+
+    def get_renditions(self, *filters):
+        """
+        Returns renditions of this image for each of the filters (or filter specs), as
+        an OrderedDict keyed by filter spec. Renditions that don't exist yet are
+        generated together, see generate_rendition_images.
+        """
+        filters = [
+            Filter(spec=filter) if isinstance(filter, string_types) else filter
+            for filter in filters
+        ]
+        existing_renditions = self.find_existing_renditions(filters)
+
+        renditions = OrderedDict()
+        missing_filters = OrderedDict()
+        for filter in filters:
+            renditions[filter.spec] = existing_renditions.get(filter.spec)
+            if renditions[filter.spec] is None:
+                missing_filters[filter.spec] = filter
+
+        if not missing_filters:
+            return renditions
+
+        with rendition_lock(*[self.get_rendition_lock_key(filter) for filter in missing_filters.values()]):
+            # Another thread or process may have generated some of the renditions while
+            # we were waiting for the lock
+            for filter_spec, rendition in self.find_existing_renditions(missing_filters.values()).items():
+                renditions[filter_spec] = rendition
+                del missing_filters[filter_spec]
+
+            if len(missing_filters) == 1:
+                filter = list(missing_filters.values())[0]
+                renditions[filter.spec] = self.create_rendition(filter)
+            elif missing_filters:
+                for filter, generated_image in self.generate_rendition_images(missing_filters.values()):
+                    renditions[filter.spec] = self.save_rendition(filter, generated_image)
+
+        return renditions
+
     def is_portrait(self):
         return (self.width < self.height)
 
@@ -485,11 +1127,102 @@ def image_feature_detection(sender, instance, **kwargs):
             instance.set_focal_point(instance.get_suggested_focal_point())
 
 
+_deferred_file_deletions = threading.local()
+
+
+@contextmanager
+def defer_file_deletion():
+    """
+    Records the files of the images and renditions deleted within the block in the
+    list it yields, rather than deleting them straight away. Deleting the files
+    one at a time as each row is deleted would slow bulk deletions down.
+    """
+    previous_files = getattr(_deferred_file_deletions, 'files', None)
+    _deferred_file_deletions.files = files = []
+    try:
+        yield files
+    finally:
+        _deferred_file_deletions.files = previous_files
+
+
+def delete_field_file(field_file):
+    files = getattr(_deferred_file_deletions, 'files', None)
+
+    if files is not None:
+        files.append((field_file.storage, field_file.name))
+    else:
+        # Pass false so FileField doesn't save the model.
+        field_file.delete(False)
+
+
+def delete_files(files):
+    """
+    Deletes a list of (storage, name) pairs, as recorded by defer_file_deletion
+    """
+    for storage, name in files:
+        try:
+            storage.delete(name)
+        except EnvironmentError:
+            logger.warning("Failed to delete file %s", name, exc_info=True)
+
+
+def run_in_background(func, *args):
+    thread = threading.Thread(target=func, args=args)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def delete_files_in_background(files):
+    return run_in_background(delete_files, files)
+
+
+_deferred_search_index_removals = threading.local()
+
+
+@contextmanager
+def defer_search_index_removal():
+    """
+    Records the images deleted within the block in the list it yields, rather than
+    removing them from the search index straight away (see remove_from_search_index).
+    """
+    previous_objects = getattr(_deferred_search_index_removals, 'objects', None)
+    _deferred_search_index_removals.objects = objects = []
+    try:
+        yield objects
+    finally:
+        _deferred_search_index_removals.objects = previous_objects
+
+
+def remove_from_search_index(objects):
+    """
+    Removes a list of objects, as recorded by defer_search_index_removal, from the
+    search backends. Search backends don't support removing objects in bulk, so
+    this is best run in the background.
+    """
+    for backend_name, backend in get_search_backends_with_name(with_auto_update=True):
+        for obj in objects:
+            try:
+                backend.delete(obj)
+            except Exception:
+                # Catch and log all errors, as wagtailsearch does when removing single objects
+                logger.exception("Exception raised while deleting %r from the '%s' search backend", obj, backend_name)
+
+
 # Receive the post_delete signal and delete the file associated with the model instance.
 @receiver(post_delete, sender=Image)
 def image_delete(sender, instance, **kwargs):
-    # Pass false so FileField doesn't save the model.
-    instance.file.delete(False)
+    delete_field_file(instance.file)
+    invalidate_image_renditions(sender, instance.pk)
+
+
+# Discard any cached renditions when an image is saved. New images may have the id of
+# one that has been deleted (some databases reuse the ids of deleted rows), and the
+# renditions cached by ServeView depend on the image's focal point.
+@receiver(post_save, sender=Image)
+def image_saved(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is None or not set(update_fields) <= set(['file_size', 'file_hash']):
+        invalidate_image_renditions(sender, instance.pk)
 
 
 def get_folder_model():
@@ -524,66 +1257,126 @@ class Filter(models.Model):
             operations.append(op_class(*op_spec_parts))
         return operations
 
+    @cached_property
+    def only_resizes(self):
+        """
+        True if this filter does nothing to the image other than scale it down, keeping
+        its aspect ratio. The output of these filters can be generated from a larger
+        rendition of the image, rather than the original.
+        """
+        return all(getattr(operation, 'only_resizes', False) for operation in self.operations)
+
     def run(self, image, output):
         with image.get_willow_image() as willow:
-            original_format = willow.format_name
-
-            # Fix orientation of image
-            willow = willow.auto_orient()
-
             env = {
-                'original-format': original_format,
+                'original-format': willow.format_name,
             }
-            for operation in self.operations:
-                # Check that the operation can take the "env" argument
-                try:
-                    inspect.getcallargs(operation.run, willow, image, env)
-                    accepts_env = True
-                except TypeError:
-                    # Check that the paramters fit the old style, so we don't
-                    # raise a warning if there is a coding error
-                    inspect.getcallargs(operation.run, willow, image)
-                    accepts_env = False
-                    warnings.warn("ImageOperation run methods should take 4 "
-                                  "arguments. %d.run only takes 3.",
-                                  RemovedInWagtail19Warning)
-
-                # Call operation
-                if accepts_env:
-                    willow = operation.run(willow, image, env) or willow
-                else:
-                    willow = operation.run(willow, image) or willow
+            willow = open_for_filters(willow, image, [self], env)
 
-            # Find the output format to use
-            if 'output-format' in env:
-                # Developer specified an output format
-                output_format = env['output-format']
+            willow = self.apply_operations(willow, image, env)
+            return self.save_output(willow, env, output)
+
+    def apply_operations(self, willow, image, env):
+        """
+        Runs the filter's operations on an opened (and oriented) image, returning the
+        resulting Willow image
+        """
+        for operation in self.operations:
+            # Check that the operation can take the "env" argument
+            try:
+                inspect.getcallargs(operation.run, willow, image, env)
+                accepts_env = True
+            except TypeError:
+                # Check that the paramters fit the old style, so we don't
+                # raise a warning if there is a coding error
+                inspect.getcallargs(operation.run, willow, image)
+                accepts_env = False
+                warnings.warn("ImageOperation run methods should take 4 "
+                              "arguments. %d.run only takes 3.",
+                              RemovedInWagtail19Warning)
+
+            # Call operation
+            if accepts_env:
+                willow = operation.run(willow, image, env) or willow
             else:
-                # Default to outputting in original format
-                output_format = original_format
-
-                # Convert BMP files to PNG
-                if original_format == 'bmp':
-                    output_format = 'png'
-
-                # Convert unanimated GIFs to PNG as well
-                if original_format == 'gif' and not willow.has_animation():
-                    output_format = 'png'
-
-            if output_format == 'jpeg':
-                # Allow changing of JPEG compression quality
-                if 'jpeg-quality' in env:
-                    quality = env['jpeg-quality']
-                elif hasattr(settings, 'WAGTAILIMAGES_JPEG_QUALITY'):
-                    quality = settings.WAGTAILIMAGES_JPEG_QUALITY
-                else:
-                    quality = 85
+                willow = operation.run(willow, image) or willow
 
-                return willow.save_as_jpeg(output, quality=quality, progressive=True, optimize=True)
-            elif output_format == 'png':
-                return willow.save_as_png(output)
-            elif output_format == 'gif':
-                return willow.save_as_gif(output)
+        return willow
+
+    def save_output(self, willow, env, output):
+        """
+        Writes the output of apply_operations to the output file, in the format chosen
+        by the operations (or one based on the original image's format)
+        """
+        original_format = env['original-format']
+
+        # Find the output format to use
+        if 'output-format' in env:
+            # Developer specified an output format
+            output_format = env['output-format']
+        else:
+            # Default to outputting in original format
+            output_format = original_format
+
+            # Convert BMP files to PNG
+            if original_format == 'bmp':
+                output_format = 'png'
+
+            # Convert unanimated GIFs to PNG as well
+            if original_format == 'gif' and not willow.has_animation():
+                output_format = 'png'
+
+        if output_format == 'jpeg':
+            # Allow changing of JPEG compression quality
+            if 'jpeg-quality' in env:
+                quality = env['jpeg-quality']
+            elif hasattr(settings, 'WAGTAILIMAGES_JPEG_QUALITY'):
+                quality = settings.WAGTAILIMAGES_JPEG_QUALITY
+            else:
+                quality = 85
+
+            return willow.save_as_jpeg(output, quality=quality, progressive=True, optimize=True)
+        elif output_format == 'png':
+            return willow.save_as_png(output)
+        elif output_format == 'gif':
+            return willow.save_as_gif(output)
+
+    def get_output_size(self, image, size=None):
+        """
+        Works out the (width, height) of the rendition this filter would generate for
+        the image, from its stored dimensions (or the given size) and focal point,
+        without opening the image file. Returns None if any of the operations can't
+        predict the size of their output.
+
+        The stored dimensions don't take the image's EXIF orientation into account, so
+        pass the size of the oriented image where that is known.
+        """
+        width, height = size or (image.width, image.height)
+
+        for operation in self.operations:
+            try:
+                width, height = operation.get_output_size(width, height, image)
+            except NotImplementedError:
+                return None
+
+        return width, height
+
+    def get_output_scale(self, image, size):
+        """
+        Returns the fraction of the resolution of the image (of the given size) that
+        the filter's output needs, or 1 if any of its operations can't tell.
+        """
+        width, height = size
+        scale = 1
+
+        for operation in self.operations:
+            try:
+                scale *= operation.get_output_scale(width, height, image)
+                width, height = operation.get_output_size(width, height, image)
+            except NotImplementedError:
+                return 1
+
+        return scale
 
     def get_cache_key(self, image):
         vary_parts = []
@@ -645,14 +1438,29 @@ class AbstractRendition(models.Model):
     height = models.IntegerField(editable=False)
     focal_point_key = models.CharField(max_length=16, blank=True, default='', editable=False)
 
+    # Set on the unsaved renditions that stand in for ones that are still being
+    # generated (see rendition_queue.get_placeholder_rendition)
+    placeholder_url = None
+
     @property
     def url(self):
+        if self.placeholder_url is not None:
+            return self.placeholder_url
         return self.file.url
 
     @property
     def alt(self):
         return self.image.title
 
+    def get_format_name(self):
+        """
+        Returns the format of the rendition's file ('jpeg', 'png' or 'gif'), which is
+        worked out from its extension without opening it. Returns None for files with
+        unrecognised extensions.
+        """
+        extension = os.path.splitext(self.file.name)[1].lower()
+        return EXTENSION_FORMATS.get(extension)
+
     @property
     def attrs(self):
         """
@@ -681,14 +1489,50 @@ class AbstractRendition(models.Model):
     def __html__(self):
         return self.img_tag()
 
-    def get_upload_to(self, filename):
+    @classmethod
+    def get_storage_layout(cls):
+        return getattr(settings, 'WAGTAILIMAGES_RENDITION_STORAGE_LAYOUT', 'flat')
+
+    def get_upload_to(self, filename, layout=None):
+        """
+        Returns the path to store a rendition file at. The directories are set by the
+        WAGTAILIMAGES_RENDITION_STORAGE_LAYOUT setting (or the layout argument):
+
+        'flat' (the default) puts all renditions into the images directory.
+
+        'hashed' spreads them across 65536 subdirectories, named after the first four
+        hex digits of the hash of the filename (eg. images/ab/cd/filename.jpg).
+
+        'image_id' puts the renditions of each image into their own subdirectory, in
+        groups of a thousand images (eg. images/12/12345/filename.jpg).
+        """
         folder_name = 'images'
         filename = self.file.field.storage.get_valid_name(filename)
+        layout = layout or self.get_storage_layout()
+
+        if layout == 'hashed':
+            filename_hash = hashlib.md5(filename.encode('utf-8')).hexdigest()
+            folder_name = os.path.join(folder_name, filename_hash[:2], filename_hash[2:4])
+        elif layout == 'image_id':
+            folder_name = os.path.join(folder_name, str(self.image_id // 1000), str(self.image_id))
+
         return os.path.join(folder_name, filename)
 
     @classmethod
     def check(cls, **kwargs):
         errors = super(AbstractRendition, cls).check(**kwargs)
+
+        if cls.get_storage_layout() not in RENDITION_STORAGE_LAYOUTS:
+            errors.append(
+                checks.Error(
+                    "Unknown rendition storage layout %r" % cls.get_storage_layout(),
+                    hint="WAGTAILIMAGES_RENDITION_STORAGE_LAYOUT must be one of: %s." % (
+                        ', '.join(RENDITION_STORAGE_LAYOUTS)),
+                    obj=cls,
+                    id='wagtailimages.E002',
+                )
+            )
+
         if not cls._meta.abstract:
             if not any(
                 set(constraint) == set(['image', 'filter_spec', 'focal_point_key'])
@@ -722,5 +1566,36 @@ class Rendition(AbstractRendition):
 # Receive the post_delete signal and delete the file associated with the model instance.
 @receiver(post_delete, sender=Rendition)
 def rendition_delete(sender, instance, **kwargs):
-    # Pass false so FileField doesn't save the model.
-    instance.file.delete(False)
+    delete_field_file(instance.file)
+    invalidate_image_renditions(Image, instance.image_id)
+
+
+class RenditionJob(models.Model):
+    """
+    A rendition waiting to be generated by the background workers when
+    ``WAGTAILIMAGES_ASYNC_RENDITIONS`` is enabled. The table acts as the queue, so
+    jobs can be picked up by any process and survive restarts.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    # Not a foreign key, as jobs apply to whichever model WAGTAILIMAGES_IMAGE_MODEL refers to
+    image_id = models.PositiveIntegerField()
+    filter_spec = models.CharField(max_length=255)
+    focal_point_key = models.CharField(max_length=16, blank=True, default='')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # When a worker last started on the job, so that jobs left running by a worker
+    # that died (or that failed) can be picked up again after a while
+    claimed_at = models.DateTimeField(null=True, editable=False)
+
+    class Meta:
+        unique_together = (
+            ('image_id', 'filter_spec', 'focal_point_key'),
+        )
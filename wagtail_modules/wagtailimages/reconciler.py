@@ -0,0 +1,398 @@
+from __future__ import absolute_import, unicode_literals
+
+import heapq
+import logging
+import os
+import time
+from operator import attrgetter
+
+from django.conf import settings
+
+from wagtail.wagtailimages import get_image_model
+from wagtail.wagtailimages.exceptions import ReconciliationError
+from wagtail.wagtailimages.fields import ALLOWED_EXTENSIONS
+from wagtail.wagtailimages.importer import ImageImporter, ImportJob, get_legacy_copies, is_legacy_copy
+from wagtail.wagtailimages.models import IMAGES_FOLDER_NAME, get_folder_model
+
+logger = logging.getLogger('wagtail.images')
+
+# The directory that rendition files are stored under (see AbstractRendition.get_upload_to)
+RENDITIONS_FOLDER_NAME = 'images'
+
+ISSUE_TYPES = ('missing_folder', 'orphan_folder', 'missing_file', 'orphan_file', 'orphan_rendition')
+
+
+class Reconciler(object):
+    """
+    Compares the image files and directories under MEDIA_ROOT with the images, folders
+    and renditions in the database, and reports (or fixes) the differences:
+
+    missing_folder: a folder whose directory doesn't exist. Fixed by creating the directory.
+    orphan_folder: a directory under original_images without a folder. Fixed by creating the folder.
+    missing_file: an image whose file doesn't exist. Fixed by deleting the image.
+    orphan_file: an image file under original_images without an image. Fixed by importing it.
+        Files whose image points at a copy of them (made by earlier versions of
+        create_db_entries) aren't orphans.
+    orphan_rendition: a file under images without a rendition. Fixed by deleting the file.
+
+    The tree is scanned a directory at a time in sorted order, merging the sorted
+    listing of each directory with the sorted rows for it. Directories are listed in
+    sorted chunks of chunk_size entries, so large directories (such as the flat
+    renditions directory) are never held in memory whole; rendition files are looked
+    up in the database a batch at a time. The scan can be stopped after a number of
+    files with the limit argument of ``run``, which returns a cursor (the path of the
+    last file scanned) to resume from in the next run.
+
+    Files modified less than min_age seconds ago are ignored, as they may belong to
+    an image or rendition that is still being saved.
+
+    As a safeguard against deleting images when the media directory isn't mounted,
+    fixing raises ReconciliationError if original_images is missing or empty while
+    there are images in the database, or if more than max_deletions images would be
+    deleted in one run.
+    """
+    def __init__(self, fix=False, min_age=3600, batch_size=500, report=None, max_deletions=None,
+                 chunk_size=10000):
+        self.fix = fix
+        self.min_age = min_age
+        self.max_deletions = max_deletions
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.report = report
+
+        self.Image = get_image_model()
+        self.Rendition = self.Image.get_rendition_model()
+        self.ImageFolder = get_folder_model()
+
+    def run(self, start_after=None, limit=None):
+        """
+        Scans the files after the start_after cursor, stopping after limit files if it
+        is given. Returns the cursor to resume from, or None once the whole tree has
+        been scanned.
+        """
+        self.start_after = tuple(start_after.split('/')) if start_after else ()
+        self.limit = limit
+        self.cursor = start_after
+        self.file_count = 0
+        self.counts = dict.fromkeys(ISSUE_TYPES, 0)
+        self.min_mtime = time.time() - self.min_age
+
+        if self.fix:
+            self.check_safe_to_fix()
+
+        self.importer = ImageImporter(batch_size=self.batch_size)
+        self.pending_imports = []
+        self.pending_deletions = []
+        self.deletion_count = 0
+
+        # Folders are looked up by the path of their parent directory and their name
+        self.child_folders = {}
+        for folder in self.ImageFolder.objects.all():
+            parent_path, name = os.path.split(folder.path)
+            self.child_folders.setdefault(parent_path, {})[name] = folder
+
+        complete = True
+        for root in sorted([IMAGES_FOLDER_NAME, RENDITIONS_FOLDER_NAME]):
+            root_path = (root, )
+            if self.is_scanned(root_path):
+                continue
+
+            exists = os.path.isdir(self.get_full_path(root_path))
+            if self.is_limit_reached() or not self.scan_directory(root_path, None, exists):
+                complete = False
+                break
+
+        self.flush_imports()
+        self.flush_deletions()
+
+        return None if complete else self.cursor
+
+    def check_safe_to_fix(self):
+        root = self.get_full_path((IMAGES_FOLDER_NAME, ))
+        is_empty = not os.path.isdir(root) or next(iter(os.scandir(root)), None) is None
+
+        if is_empty and self.Image.objects.exists():
+            raise ReconciliationError(
+                "%s is missing or empty, but there are images in the database. "
+                "Check that the media directory is mounted." % root
+            )
+
+    def get_full_path(self, path):
+        return os.path.join(settings.MEDIA_ROOT, *path)
+
+    def is_scanned(self, path):
+        """
+        Returns True if the file or directory at the path (a tuple of names) was
+        scanned in full by a previous run
+        """
+        return path <= self.start_after and self.start_after[:len(path)] != path
+
+    def is_limit_reached(self):
+        return self.limit is not None and self.file_count >= self.limit
+
+    def add_issue(self, issue_type, name):
+        self.counts[issue_type] += 1
+        if self.report is not None:
+            self.report(issue_type, name)
+
+    def scan_directory(self, path, folder, exists):
+        """
+        Scans the directory at the path (a tuple of names) and the directories under
+        it. folder is its ImageFolder (None for the root directories, and for orphan
+        directories that haven't been fixed). Returns False if the limit was reached.
+        """
+        name = '/'.join(path)
+        is_renditions = path[0] == RENDITIONS_FOLDER_NAME
+
+        if is_renditions:
+            db_files = {}
+            db_dirs = {}
+        else:
+            db_files = self.get_directory_images(path, folder)
+            db_dirs = self.child_folders.get(name, {})
+        db_names = set(db_files) | set(db_dirs)
+        legacy_copies = get_legacy_copies(db_files)
+
+        # A directory that a previous run stopped in is resumed from the entry it
+        # stopped at
+        if len(self.start_after) > len(path) and self.start_after[:len(path)] == path:
+            after = self.start_after[len(path)]
+            inclusive = True
+        else:
+            after = None
+            inclusive = False
+
+        while True:
+            fs_files, fs_dirs, upper = self.list_directory(path, exists, after, inclusive)
+
+            names = sorted(set(fs_files) | fs_dirs | set(
+                db_name for db_name in db_names
+                if (after is None or (db_name >= after if inclusive else db_name > after)) and
+                (upper is None or db_name <= upper)
+            ))
+
+            if not self.scan_entries(path, folder, names, fs_files, fs_dirs, db_files, db_dirs, legacy_copies):
+                return False
+
+            if upper is None:
+                return True
+
+            after = upper
+            inclusive = False
+
+    def list_directory(self, path, exists, after, inclusive):
+        """
+        Returns the first chunk_size entries of the directory that sort after the
+        after name (or are equal to it, if inclusive is set), as ({file name: entry},
+        set of directory names, name of the last entry). The last name is None if
+        there are no more entries after these.
+
+        The entries are read as a stream, so that only a chunk of a large directory
+        (such as the renditions directory) is held in memory at once. The directory
+        is read again for each chunk.
+        """
+        fs_files = {}
+        fs_dirs = set()
+        if not exists:
+            return fs_files, fs_dirs, None
+
+        entries = os.scandir(self.get_full_path(path))
+        if after is not None:
+            if inclusive:
+                entries = (entry for entry in entries if entry.name >= after)
+            else:
+                entries = (entry for entry in entries if entry.name > after)
+
+        chunk = heapq.nsmallest(self.chunk_size, entries, key=attrgetter('name'))
+
+        for entry in chunk:
+            if entry.is_dir():
+                fs_dirs.add(entry.name)
+            elif entry.is_file():
+                fs_files[entry.name] = entry
+
+        if len(chunk) < self.chunk_size:
+            return fs_files, fs_dirs, None
+
+        return fs_files, fs_dirs, chunk[-1].name
+
+    def scan_entries(self, path, folder, names, fs_files, fs_dirs, db_files, db_dirs, legacy_copies):
+        """
+        Scans the named entries of a directory, in sorted order. legacy_copies is the
+        get_legacy_copies result for the images of the directory. Returns False if the
+        limit was reached.
+        """
+        is_renditions = path[0] == RENDITIONS_FOLDER_NAME
+
+        for start in range(0, len(names), self.batch_size):
+            batch = names[start:start + self.batch_size]
+
+            # Look up the files that might be orphans in one query per batch, as
+            # their rows may not be in this folder
+            known_files = self.get_known_files(is_renditions, [
+                '/'.join(path + (file_name, )) for file_name in batch
+                if file_name in fs_files and file_name not in db_files and path + (file_name, ) > self.start_after
+            ])
+
+            for entry_name in batch:
+                entry_path = path + (entry_name, )
+                if self.is_limit_reached() and not self.is_scanned(entry_path):
+                    # Stop before this entry, so that the next run starts with it
+                    return False
+
+                if entry_name in fs_dirs or entry_name in db_dirs:
+                    if not self.is_scanned(entry_path):
+                        sub_folder = db_dirs.get(entry_name)
+                        if not is_renditions and self.start_after[:len(entry_path)] != entry_path:
+                            # The directory wasn't started on in a previous run
+                            sub_folder = self.check_directory(entry_path, sub_folder, entry_name in fs_dirs, folder)
+
+                        # Missing directories may have been created by check_directory
+                        sub_exists = entry_name in fs_dirs or os.path.isdir(self.get_full_path(entry_path))
+                        if not self.scan_directory(entry_path, sub_folder, sub_exists):
+                            return False
+
+                if entry_name in fs_files or entry_name in db_files:
+                    if entry_path <= self.start_after:
+                        continue
+
+                    file_name = '/'.join(entry_path)
+                    if entry_name not in fs_files:
+                        self.add_issue('missing_file', file_name)
+                        if self.fix:
+                            self.delete_image(db_files[entry_name])
+                    elif entry_name not in db_files and file_name not in known_files:
+                        self.check_orphan_file(
+                            entry_path, fs_files[entry_name], folder, is_renditions,
+                            legacy_copies.get(entry_name, [])
+                        )
+
+                    self.file_count += 1
+                    self.cursor = file_name
+
+        return True
+
+    def check_directory(self, path, folder, exists, parent_folder):
+        """
+        Checks a directory under original_images, returning its folder
+        """
+        if folder is None:
+            self.add_issue('orphan_folder', '/'.join(path))
+
+            # Folders are stored at the ASCII version of their title, so directories
+            # with other names can't be given folders
+            title = path[-1]
+            if self.fix and all(ord(char) < 128 for char in title):
+                if len(path) > 2 and parent_folder is None:
+                    # The parent directory is an orphan that couldn't be fixed
+                    return None
+
+                folder = self.ImageFolder(title=title, folder=parent_folder)
+                try:
+                    folder.save()
+                except FileExistsError:
+                    # The directory is already there
+                    pass
+                self.child_folders.setdefault('/'.join(path[:-1]), {})[title] = folder
+
+        elif not exists:
+            self.add_issue('missing_folder', '/'.join(path))
+            if self.fix:
+                os.makedirs(folder.get_complete_path())
+
+        return folder
+
+    def check_orphan_file(self, path, entry, folder, is_renditions, legacy_copies=()):
+        stat = entry.stat()
+        if stat.st_mtime > self.min_mtime:
+            # This may be a file that's still being saved
+            return
+
+        file_name = '/'.join(path)
+        if is_renditions:
+            self.add_issue('orphan_rendition', file_name)
+            if self.fix:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    logger.exception("Failed to delete orphan rendition %s", file_name)
+        else:
+            extension = os.path.splitext(entry.name)[1][1:].lower()
+            if extension not in ALLOWED_EXTENSIONS:
+                return
+
+            if any(is_legacy_copy(entry.path, self.get_full_path(path[:-1] + (copy_name, )))
+                   for copy_name in legacy_copies):
+                # The file's image points at a copy of it
+                return
+
+            self.add_issue('orphan_file', file_name)
+            if self.fix and (folder is not None or len(path) == 2):
+                self.pending_imports.append(ImportJob(folder, file_name, entry.path, stat.st_size, stat.st_mtime))
+                if len(self.pending_imports) >= self.batch_size:
+                    self.flush_imports()
+
+    def delete_image(self, image_id):
+        if self.max_deletions is not None and self.deletion_count >= self.max_deletions:
+            self.flush_imports()
+            self.flush_deletions()
+            raise ReconciliationError(
+                "Stopped after deleting %d images with missing files. Check that the media "
+                "directory is complete, then allow more deletions to continue." % self.deletion_count
+            )
+
+        self.deletion_count += 1
+        self.pending_deletions.append(image_id)
+        if len(self.pending_deletions) >= self.batch_size:
+            self.flush_deletions()
+
+    def flush_imports(self):
+        if self.pending_imports:
+            self.importer.import_batch(self.pending_imports)
+            self.pending_imports = []
+
+    def flush_deletions(self):
+        if self.pending_deletions:
+            self.Image.objects.filter(pk__in=self.pending_deletions).delete()
+            self.pending_deletions = []
+
+    def get_directory_images(self, path, folder):
+        """
+        Returns the {file name: id} of the images in the folder whose files are in the
+        directory at the path (a tuple of names). Images with files somewhere else are
+        checked separately.
+        """
+        name = '/'.join(path)
+        if folder is not None:
+            images = self.Image.objects.filter(folder=folder)
+        elif len(path) == 1:
+            images = self.Image.objects.filter(folder__isnull=True)
+        else:
+            return {}
+
+        directory_images = {}
+        check_elsewhere = self.start_after[:len(path)] != path
+        for image_id, file_name in images.values_list('pk', 'file').iterator():
+            directory, base_name = os.path.split(file_name)
+            if directory == name:
+                directory_images[base_name] = image_id
+            elif check_elsewhere and not os.path.exists(os.path.join(settings.MEDIA_ROOT, file_name)):
+                self.add_issue('missing_file', file_name)
+                if self.fix:
+                    self.delete_image(image_id)
+
+        return directory_images
+
+    def get_known_files(self, is_renditions, file_names):
+        """
+        Returns the set of the file names that belong to an image (or a rendition)
+        """
+        model = self.Rendition if is_renditions else self.Image
+
+        known_files = set()
+        for start in range(0, len(file_names), self.batch_size):
+            known_files.update(model.objects.filter(
+                file__in=file_names[start:start + self.batch_size]
+            ).values_list('file', flat=True))
+
+        return known_files
@@ -0,0 +1,215 @@
+from __future__ import absolute_import, unicode_literals
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class LRUCache(object):
+    """
+    A bounded, thread-safe mapping that discards the least recently used entry
+    once it holds more than ``max_size`` entries.
+
+    Keys are tuples whose first item identifies the image the entry belongs to,
+    so that all the entries for an image can be discarded at once.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                return None
+
+            # Re-insert to mark the entry as the most recently used one
+            self._entries[key] = value
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete_image(self, image_key):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == image_key]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RenditionCache(object):
+    """
+    Caches small, picklable dicts describing renditions (such as their file name
+    and dimensions), so that rendering an image doesn't need a database query once
+    its rendition exists.
+
+    Entries are held in a bounded in-process LRU cache, and in a Django cache
+    backend shared between processes if one is given. Invalidating an image removes its
+    entries from the shared backend and bumps a generation counter there; other
+    processes clear their in-process entries when they notice the new generation,
+    which they check for at most every ``check_interval`` seconds.
+    """
+    check_interval = 10
+
+    def __init__(self, name, max_size, backend=None):
+        self.name = name
+        self.local = LRUCache(max_size)
+        self.backend = caches[backend] if backend else None
+
+        self._generation = None
+        self._next_generation_check = 0
+
+    def get_backend_key(self, image_key):
+        return 'wagtailimages:%s:%s' % (self.name, image_key)
+
+    @property
+    def generation_key(self):
+        return 'wagtailimages:%s:generation' % self.name
+
+    def check_generation(self):
+        if self.backend is None:
+            return
+
+        now = time.time()
+        if now < self._next_generation_check:
+            return
+        self._next_generation_check = now + self.check_interval
+
+        generation = self.backend.get(self.generation_key)
+        if generation != self._generation:
+            # Another process has invalidated some entries since we last checked
+            self.local.clear()
+            self._generation = generation
+
+    def get(self, image_key, key):
+        self.check_generation()
+
+        data = self.local.get((image_key, ) + key)
+
+        if data is None and self.backend is not None:
+            data = (self.backend.get(self.get_backend_key(image_key)) or {}).get(key)
+
+            if data is not None:
+                self.local.set((image_key, ) + key, data)
+
+        return data
+
+    def set(self, image_key, key, data):
+        self.local.set((image_key, ) + key, data)
+
+        if self.backend is not None:
+            # All the entries for an image are stored under a single key, so that they
+            # can be invalidated without knowing which filters have been used
+            backend_key = self.get_backend_key(image_key)
+            entries = self.backend.get(backend_key) or {}
+            entries[key] = data
+            self.backend.set(backend_key, entries)
+
+    def invalidate(self, image_key):
+        self.local.delete_image(image_key)
+
+        if self.backend is not None:
+            self.backend.delete(self.get_backend_key(image_key))
+            self.bump_generation()
+
+    def invalidate_many(self, image_keys):
+        """
+        Invalidates the entries of several images, bumping the generation once
+        """
+        self.local.clear()
+
+        if self.backend is not None:
+            self.backend.delete_many([self.get_backend_key(image_key) for image_key in image_keys])
+            self.bump_generation()
+
+    def bump_generation(self):
+        try:
+            self.backend.incr(self.generation_key)
+        except ValueError:
+            # The counter doesn't exist yet (or has been evicted)
+            self.backend.set(self.generation_key, 1, None)
+
+    def clear(self):
+        self.local.clear()
+
+
+def get_image_key(image_model, image_id):
+    """
+    Returns the string that identifies an image in the rendition caches. This
+    includes the model, as custom image models have their own sequence of ids.
+    """
+    return '%s.%s:%s' % (image_model._meta.app_label, image_model._meta.model_name, image_id)
+
+
+_rendition_cache = None
+
+
+def get_rendition_cache():
+    """
+    Returns the cache of rendition details used by ``AbstractImage.get_rendition``,
+    configured by the ``WAGTAILIMAGES_RENDITION_CACHE_BACKEND`` (an alias from
+    ``CACHES`` to share entries between processes) and
+    ``WAGTAILIMAGES_RENDITION_CACHE_SIZE`` (number of entries held in each process, 0
+    to disable) settings.
+
+    Nothing is cached unless the backend is set, as processes would otherwise have
+    no way of telling each other to discard the entries of renditions they delete.
+    """
+    global _rendition_cache
+    if _rendition_cache is None:
+        backend = getattr(settings, 'WAGTAILIMAGES_RENDITION_CACHE_BACKEND', None)
+        _rendition_cache = RenditionCache(
+            'renditions',
+            max_size=getattr(settings, 'WAGTAILIMAGES_RENDITION_CACHE_SIZE', 1000) if backend else 0,
+            backend=backend,
+        )
+    return _rendition_cache
+
+
+def invalidate_image_renditions(image_model, image_id):
+    """
+    Discards all the cached rendition details of an image. Must be called whenever
+    a rendition is deleted; custom rendition models should call this from their
+    post_delete signal handler.
+    """
+    get_rendition_cache().invalidate(get_image_key(image_model, image_id))
+
+
+def invalidate_many_image_renditions(image_model, image_ids):
+    """
+    Discards all the cached rendition details of several images, such as after
+    their renditions have been changed in bulk.
+
+    Other processes only discard their in-process entries (within
+    ``RenditionCache.check_interval`` seconds) if the
+    ``WAGTAILIMAGES_RENDITION_CACHE_BACKEND`` setting is set.
+    """
+    get_rendition_cache().invalidate_many([get_image_key(image_model, image_id) for image_id in image_ids])
+
+
+@receiver(setting_changed)
+def reset_rendition_caches(setting, **kwargs):
+    global _rendition_cache
+    if setting.startswith('WAGTAILIMAGES_RENDITION_CACHE'):
+        _rendition_cache = None
@@ -0,0 +1,191 @@
+from __future__ import absolute_import, unicode_literals
+
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.utils.safestring import SafeData, mark_safe
+from django.utils.six import string_types
+
+from wagtail.wagtailimages.models import Filter, prefetch_renditions
+from wagtail.wagtailimages.shortcuts import get_rendition_or_not_found, get_renditions_or_not_found
+
+_local = threading.local()
+
+
+class RenditionCollector(object):
+    """
+    Records the renditions (and images) requested while rendering a fragment of
+    HTML, leaving a placeholder in the HTML for each of them. They are then fetched
+    together by ``resolve``, which replaces the placeholders with the markup.
+    """
+    def __init__(self):
+        # A token that won't appear in the HTML by chance
+        self.token = uuid.uuid4().hex
+        self.placeholder_regex = re.compile(r'\[\[wagtailimages-rendition:%s:(\d+)\]\]' % self.token)
+        self.image_placeholder_regex = re.compile(r'\[\[wagtailimages-image:%s:(\d+)\]\]' % self.token)
+        self.requests = []
+        self.image_requests = []
+
+    def add(self, image, filter, render):
+        """
+        Returns the placeholder for the markup that ``render`` outputs for the
+        rendition of the image
+        """
+        if isinstance(filter, string_types):
+            filter = Filter(spec=filter)
+
+        self.requests.append((image, filter, render))
+        return mark_safe('[[wagtailimages-rendition:%s:%d]]' % (self.token, len(self.requests) - 1))
+
+    def add_image(self, model, image_id, render):
+        """
+        Returns the placeholder for the markup that ``render`` outputs for the image
+        with the given id, which hasn't been fetched yet (such as an image embedded in
+        rich text). ``render`` is passed None if the image doesn't exist.
+        """
+        self.image_requests.append((model, image_id, render))
+        return mark_safe('[[wagtailimages-image:%s:%d]]' % (self.token, len(self.image_requests) - 1))
+
+    def resolve_images(self, html):
+        """
+        Fetches the images requested by ``add_image`` with a single query per image
+        model, and replaces their placeholders with their markup. The markup is output
+        while this collector is active, so the renditions it requests are collected too.
+        """
+        if not self.image_requests:
+            return html
+
+        ids_by_model = OrderedDict()
+        for model, image_id, render in self.image_requests:
+            ids_by_model.setdefault(model, set()).add(image_id)
+
+        images = {}
+        for model, image_ids in ids_by_model.items():
+            for image_id, image in model.objects.in_bulk(image_ids).items():
+                images[(model, image_id)] = image
+
+        if not hasattr(_local, 'collectors'):
+            _local.collectors = []
+
+        _local.collectors.append(self)
+        try:
+            markup = [
+                render(images.get((model, image_id)))
+                for model, image_id, render in self.image_requests
+            ]
+        finally:
+            _local.collectors.pop()
+        self.image_requests = []
+
+        resolved_html = self.image_placeholder_regex.sub(lambda match: markup[int(match.group(1))], html)
+
+        if isinstance(html, SafeData):
+            return mark_safe(resolved_html)
+        return resolved_html
+
+    def get_renditions(self):
+        """
+        Returns the renditions for each of the requests, as a list in the same order.
+        The existing renditions are fetched with a single query per image model, and
+        the missing renditions of each image are generated together.
+        """
+        # Templates often have several copies of the same image (eg. from different
+        # querysets), these only need to be fetched once
+        images = OrderedDict()
+        filters = OrderedDict()
+        for image, filter, render in self.requests:
+            image_key = (type(image), image.pk)
+            images.setdefault(image_key, image)
+            filters.setdefault(image_key, OrderedDict())[filter.spec] = filter
+
+        images_by_model = OrderedDict()
+        for (model, pk), image in images.items():
+            images_by_model.setdefault(model, []).append(image)
+
+        for model, model_images in images_by_model.items():
+            filter_specs = set(
+                filter_spec for image in model_images
+                for filter_spec in filters[(model, image.pk)]
+            )
+            prefetch_renditions(model_images, *filter_specs)
+
+        renditions = {}
+        for image_key, image in images.items():
+            renditions[image_key] = get_renditions_or_not_found(image, filters[image_key].values())
+
+        return [
+            renditions[(type(image), image.pk)][filter.spec]
+            for image, filter, render in self.requests
+        ]
+
+    def resolve(self, html):
+        """
+        Fetches the requested images and renditions and replaces their placeholders in
+        the HTML
+        """
+        html = self.resolve_images(html)
+
+        if not self.requests:
+            return html
+
+        markup = [
+            render(rendition)
+            for (image, filter, render), rendition in zip(self.requests, self.get_renditions())
+        ]
+        self.requests = []
+
+        resolved_html = self.placeholder_regex.sub(lambda match: markup[int(match.group(1))], html)
+
+        if isinstance(html, SafeData):
+            return mark_safe(resolved_html)
+        return resolved_html
+
+
+def get_active_collector():
+    collectors = getattr(_local, 'collectors', None)
+    if collectors:
+        return collectors[-1]
+
+
+@contextmanager
+def collect_renditions():
+    """
+    Collects the renditions requested by the {% image %} tag, image chooser blocks and
+    images in rich text while the block runs, so that they are fetched together. The
+    HTML rendered in the block must be passed through the collector's ``resolve``
+    method, eg.
+
+        with collect_renditions() as collector:
+            html = template.render(context)
+        html = collector.resolve(html)
+
+    In templates, use the {% collectrenditions %} block tag instead. Fragments
+    cached with the {% cache %} tag mustn't be rendered within the block, as the
+    placeholders would be cached in place of the images.
+    """
+    collector = RenditionCollector()
+
+    if not hasattr(_local, 'collectors'):
+        _local.collectors = []
+
+    _local.collectors.append(collector)
+    try:
+        yield collector
+    finally:
+        _local.collectors.pop()
+
+
+def render_rendition(image, filter, render):
+    """
+    Returns the markup that ``render`` outputs for the rendition of the image. While
+    renditions are being collected, a placeholder is returned instead.
+    """
+    collector = get_active_collector()
+
+    if collector is None:
+        return render(get_rendition_or_not_found(image, filter))
+    else:
+        return collector.add(image, filter, render)
@@ -0,0 +1,113 @@
+from __future__ import absolute_import, unicode_literals
+
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows
+    fcntl = None
+
+
+_local_locks = {}
+_local_locks_lock = threading.Lock()
+
+
+def acquire_local_lock(key):
+    with _local_locks_lock:
+        lock, count = _local_locks.get(key, (None, 0))
+        if lock is None:
+            lock = threading.Lock()
+        _local_locks[key] = (lock, count + 1)
+
+    lock.acquire()
+
+
+def release_local_lock(key):
+    with _local_locks_lock:
+        lock, count = _local_locks[key]
+
+        # Forget about locks once nothing is using them, so that they don't build up
+        if count == 1:
+            del _local_locks[key]
+        else:
+            _local_locks[key] = (lock, count - 1)
+
+    lock.release()
+
+
+def get_lock_dir():
+    """
+    Returns the directory of the files used to lock renditions between processes,
+    set by the ``WAGTAILIMAGES_RENDITION_LOCK_DIR`` setting. Setting it to None only
+    locks renditions between the threads of each process.
+    """
+    return getattr(
+        settings, 'WAGTAILIMAGES_RENDITION_LOCK_DIR',
+        os.path.join(tempfile.gettempdir(), 'wagtailimages-locks')
+    )
+
+
+def get_lock_file_name(key):
+    # Keys are spread over a fixed set of 4096 lock files, so that they don't build
+    # up. Renditions that share a lock file can't be generated at the same time by
+    # different processes, but this is rare.
+    key_hash = hashlib.sha1('\n'.join(key).encode('utf-8')).hexdigest()
+    return '%s.lock' % key_hash[:3]
+
+
+def acquire_file_lock(lock_dir, file_name):
+    try:
+        os.makedirs(lock_dir)
+    except OSError:
+        # The directory already exists
+        pass
+
+    lock_file = open(os.path.join(lock_dir, file_name), 'a')
+    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+    return lock_file
+
+
+def release_file_lock(lock_file):
+    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    lock_file.close()
+
+
+@contextmanager
+def rendition_lock(*keys):
+    """
+    Waits until no other thread in this process, nor any other process on this
+    machine, holds a lock on any of the keys, then holds those locks until the
+    block exits. Used to make sure that only one worker generates a rendition at a
+    time; keys are (image key, filter spec, focal point key) tuples.
+
+    The locks are always acquired in the same order, so that locking several keys
+    at once can't deadlock.
+    """
+    keys = sorted(set(keys))
+    local_locks = []
+    file_locks = []
+
+    try:
+        for key in keys:
+            acquire_local_lock(key)
+            local_locks.append(key)
+
+        lock_dir = get_lock_dir()
+        if fcntl is not None and lock_dir:
+            for file_name in sorted(set(get_lock_file_name(key) for key in keys)):
+                file_locks.append(acquire_file_lock(lock_dir, file_name))
+
+        yield
+    finally:
+        for lock_file in reversed(file_locks):
+            release_file_lock(lock_file)
+
+        for key in reversed(local_locks):
+            release_local_lock(key)
@@ -0,0 +1,213 @@
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.six import string_types
+
+from wagtail.wagtailimages.models import Filter, RenditionJob
+
+logger = logging.getLogger('wagtail.images')
+
+
+# A transparent 1x1 GIF, which browsers stretch to the placeholder's dimensions
+DEFAULT_PLACEHOLDER_URL = 'data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7'
+
+
+def is_async_enabled():
+    return getattr(settings, 'WAGTAILIMAGES_ASYNC_RENDITIONS', False)
+
+
+def get_stalled_jobs():
+    """
+    Returns the jobs that should have been run by now, but may have been lost:
+    jobs that were queued or claimed longer ago than
+    ``WAGTAILIMAGES_ASYNC_RENDITION_TIMEOUT`` seconds (600 by default) and are still
+    pending (the process that queued them has probably died before handing them to
+    its workers), still running (their worker has probably died) or have failed.
+    """
+    timeout = getattr(settings, 'WAGTAILIMAGES_ASYNC_RENDITION_TIMEOUT', 600)
+    before = timezone.now() - timedelta(seconds=timeout)
+
+    return RenditionJob.objects.filter(
+        Q(status=RenditionJob.STATUS_PENDING, created_at__lt=before) |
+        Q(status__in=[RenditionJob.STATUS_RUNNING, RenditionJob.STATUS_FAILED], claimed_at__lt=before)
+    )
+
+
+def get_claimable_jobs():
+    """
+    Returns the jobs that a worker can start on: pending jobs, and stalled jobs
+    (see get_stalled_jobs).
+    """
+    return RenditionJob.objects.filter(status=RenditionJob.STATUS_PENDING) | get_stalled_jobs()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the pool of worker threads that generate queued renditions. Its size
+    is set by the ``WAGTAILIMAGES_ASYNC_RENDITION_WORKERS`` setting.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'WAGTAILIMAGES_ASYNC_RENDITION_WORKERS', 2)
+            )
+    return _executor
+
+
+def get_placeholder_rendition(image, filter, size):
+    """
+    Returns an unsaved rendition that stands in for one that is still being
+    generated. It has the final dimensions, but displays the image at the
+    ``WAGTAILIMAGES_ASYNC_RENDITION_PLACEHOLDER_URL`` setting (a transparent pixel by
+    default) rather than downloading the full-size original.
+    """
+    Rendition = image.get_rendition_model()
+    width, height = size
+    rendition = Rendition(
+        image=image,
+        filter_spec=filter.spec,
+        focal_point_key=filter.get_cache_key(image),
+        width=width,
+        height=height,
+    )
+    rendition.placeholder_url = getattr(
+        settings, 'WAGTAILIMAGES_ASYNC_RENDITION_PLACEHOLDER_URL', DEFAULT_PLACEHOLDER_URL
+    )
+    return rendition
+
+
+def enqueue_rendition(image, filter):
+    """
+    Records a job to generate the rendition, and hands it to the worker pool once
+    the current transaction has been committed. Does nothing if the rendition is
+    already queued, unless its job has stalled or failed (see get_stalled_jobs).
+    """
+    focal_point_key = filter.get_cache_key(image)
+
+    try:
+        with transaction.atomic():
+            job = RenditionJob.objects.create(
+                image_id=image.pk,
+                filter_spec=filter.spec,
+                focal_point_key=focal_point_key,
+            )
+    except IntegrityError:
+        # The job is already queued. It's only handed to the workers again if it has
+        # stalled, as otherwise it's already been handed to them
+        job = get_stalled_jobs().filter(
+            image_id=image.pk,
+            filter_spec=filter.spec,
+            focal_point_key=focal_point_key,
+        ).first()
+
+        if job is None:
+            return
+
+    def submit():
+        get_executor().submit(run_queued_rendition_job, job.pk)
+
+    # Workers use their own database connections, so they can't see the job until
+    # it has been committed (transaction.on_commit was added in Django 1.9)
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(submit)
+    else:
+        submit()
+
+
+def get_rendition_or_placeholder(image, filter):
+    """
+    Returns the rendition if it already exists. Otherwise, the rendition is queued
+    to be generated in the background and a placeholder is returned in its place.
+    """
+    if isinstance(filter, string_types):
+        filter = Filter(spec=filter)
+
+    try:
+        return image.find_existing_rendition(filter)
+    except image.get_rendition_model().DoesNotExist:
+        pass
+
+    size = filter.get_output_size(image)
+    if size is None:
+        # We can't give the placeholder the right dimensions, generate it now instead
+        return image.get_rendition(filter)
+
+    enqueue_rendition(image, filter)
+    return get_placeholder_rendition(image, filter, size)
+
+
+def run_rendition_job(job_id):
+    """
+    Generates the rendition for a queued job. Jobs that another worker is running
+    are skipped; jobs that fail are kept with the failed status, to be retried once
+    they can be claimed again. Returns True if the job was run, False if it failed
+    and None if it couldn't be claimed.
+    """
+    from wagtail.wagtailimages import get_image_model
+
+    # Claim the job, so that it's only run once
+    claimed = get_claimable_jobs().filter(pk=job_id).update(
+        status=RenditionJob.STATUS_RUNNING,
+        claimed_at=timezone.now(),
+    )
+    if not claimed:
+        return None
+
+    job = RenditionJob.objects.get(pk=job_id)
+    Image = get_image_model()
+
+    try:
+        image = Image.objects.get(pk=job.image_id)
+        image.get_rendition(job.filter_spec)
+    except Image.DoesNotExist:
+        pass
+    except Exception:
+        logger.exception("Failed to generate rendition '%s' of image %d", job.filter_spec, job.image_id)
+        RenditionJob.objects.filter(pk=job_id).update(status=RenditionJob.STATUS_FAILED)
+        return False
+
+    job.delete()
+    return True
+
+
+def run_queued_rendition_job(job_id):
+    try:
+        run_rendition_job(job_id)
+    finally:
+        # Worker threads each have their own database connection, which would
+        # otherwise be left open
+        connection.close()
+
+
+def process_rendition_jobs(retry_failed=False):
+    """
+    Runs the queued jobs that can be claimed in the current thread, such as ones left
+    over from a previous process. Failed jobs are retried straight away if
+    retry_failed is set. Returns the numbers of jobs that were run and that failed.
+    """
+    if retry_failed:
+        RenditionJob.objects.filter(status=RenditionJob.STATUS_FAILED).update(status=RenditionJob.STATUS_PENDING)
+
+    run_count = 0
+    failed_count = 0
+    for job_id in list(get_claimable_jobs().order_by('pk').values_list('pk', flat=True)):
+        result = run_rendition_job(job_id)
+        if result:
+            run_count += 1
+        elif result is False:
+            failed_count += 1
+
+    return run_count, failed_count
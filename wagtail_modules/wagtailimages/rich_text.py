@@ -1,7 +1,19 @@
 from __future__ import absolute_import, unicode_literals
 
+from wagtail.wagtailcore.rich_text import expand_db_html as core_expand_db_html
 from wagtail.wagtailimages import get_image_model
 from wagtail.wagtailimages.formats import get_image_format
+from wagtail.wagtailimages.rendition_collector import collect_renditions, get_active_collector
+
+
+def expand_db_html(html, for_editor=False):
+    """
+    The equivalent of wagtailcore's expand_db_html, fetching all the embedded images
+    and their renditions together (see ImageEmbedHandler)
+    """
+    with collect_renditions() as collector:
+        html = core_expand_db_html(html, for_editor=for_editor)
+    return collector.resolve(html)
 
 
 class ImageEmbedHandler(object):
@@ -31,14 +43,31 @@ class ImageEmbedHandler(object):
         representation.
         """
         Image = get_image_model()
+        collector = get_active_collector()
+
+        def render(image):
+            if image is None:
+                return "<img>"
+
+            image_format = get_image_format(attrs['format'])
+
+            if for_editor:
+                return image_format.image_to_editor_html(image, attrs['alt'])
+            else:
+                return image_format.image_to_html(image, attrs['alt'])
+
+        if collector is not None:
+            # While renditions are being collected (such as within the
+            # {% collectrenditions %} tag), the embedded images are fetched together
+            # along with their renditions
+            try:
+                return collector.add_image(Image, int(attrs['id']), render)
+            except ValueError:
+                return render(None)
+
         try:
             image = Image.objects.get(id=attrs['id'])
         except Image.DoesNotExist:
-            return "<img>"
-
-        image_format = get_image_format(attrs['format'])
+            image = None
 
-        if for_editor:
-            return image_format.image_to_editor_html(image, attrs['alt'])
-        else:
-            return image_format.image_to_html(image, attrs['alt'])
+        return render(image)
@@ -1,24 +1,107 @@
 # coding=utf-8
 from __future__ import absolute_import, unicode_literals
 
-from wagtail.wagtailimages.models import SourceImageIOError
+import re
+from collections import OrderedDict
+
+from django.forms.utils import flatatt
+from django.utils.safestring import mark_safe
+from django.utils.six import string_types
+
+from wagtail.wagtailimages.models import Filter, SourceImageIOError
+from wagtail.wagtailimages.rendition_queue import get_rendition_or_placeholder, is_async_enabled
 
 
 def get_rendition_or_not_found(image, specs):
     """
     Tries to get / create the rendition for the image or renders a not-found image if it does not exist.
 
+    When WAGTAILIMAGES_ASYNC_RENDITIONS is enabled, missing renditions are generated in the
+    background and a placeholder with the same dimensions is returned in the meantime.
+
     :param image: AbstractImage
     :param specs: str or Filter
     :return: Rendition
     """
     try:
+        if is_async_enabled():
+            return get_rendition_or_placeholder(image, specs)
+
         return image.get_rendition(specs)
     except SourceImageIOError:
         # Image file is (probably) missing from /media/original_images - generate a dummy
         # rendition so that we just output a broken image, rather than crashing out completely
         # during rendering.
-        Rendition = image.renditions.model  # pick up any custom Image / Rendition classes that may be in use
-        rendition = Rendition(image=image, width=0, height=0)
-        rendition.file.name = 'not-found'
-        return rendition
+        return get_not_found_rendition(image)
+
+
+def get_not_found_rendition(image):
+    Rendition = image.renditions.model  # pick up any custom Image / Rendition classes that may be in use
+    rendition = Rendition(image=image, width=0, height=0)
+    rendition.file.name = 'not-found'
+    return rendition
+
+
+def get_renditions_or_not_found(image, specs):
+    """
+    The equivalent of get_rendition_or_not_found for several renditions of an image.
+    The existing renditions are fetched in one query, and the missing ones are
+    generated together (see AbstractImage.get_renditions).
+
+    :param image: AbstractImage
+    :param specs: list of str or Filter
+    :return: OrderedDict of Renditions, keyed by filter spec
+    """
+    filters = [Filter(spec=spec) if isinstance(spec, string_types) else spec for spec in specs]
+
+    try:
+        if is_async_enabled():
+            existing_renditions = image.find_existing_renditions(filters)
+            return OrderedDict(
+                (filter.spec, existing_renditions.get(filter.spec) or get_rendition_or_placeholder(image, filter))
+                for filter in filters
+            )
+
+        return image.get_renditions(*filters)
+    except SourceImageIOError:
+        return OrderedDict((filter.spec, get_not_found_rendition(image)) for filter in filters)
+
+
+BRACES_REGEX = re.compile(r'\{([^{}]*)\}')
+
+
+def expand_filter_spec(filter_spec):
+    """
+    Expands the options in braces in a filter spec into a list of filter specs, eg.
+    'width-{400,800}|jpegquality-60' gives ['width-400|jpegquality-60', 'width-800|jpegquality-60']
+    """
+    match = BRACES_REGEX.search(filter_spec)
+    if match is None:
+        return [filter_spec]
+
+    filter_specs = []
+    for option in match.group(1).split(','):
+        filter_specs.extend(expand_filter_spec(
+            filter_spec[:match.start()] + option.strip() + filter_spec[match.end():]
+        ))
+    return filter_specs
+
+
+def srcset_img_tag(renditions, extra_attributes={}):
+    """
+    Returns an <img> tag offering the browser a choice of renditions of the same
+    image, through its srcset attribute. Each rendition is described by its actual
+    width, and the smallest one is used for the src, width and height attributes.
+    """
+    renditions = sorted(renditions, key=lambda rendition: rendition.width)
+
+    # Filters can give the same rendition for different specs (eg. if the image is
+    # smaller than the widths being asked for)
+    srcset = OrderedDict()
+    for rendition in renditions:
+        srcset.setdefault(rendition.width, rendition.url)
+
+    attrs = renditions[0].attrs_dict.copy()
+    attrs['srcset'] = ', '.join('{} {}w'.format(url, width) for width, url in srcset.items())
+    attrs.update(extra_attributes)
+    return mark_safe('<img{}>'.format(flatatt(attrs)))
@@ -6,10 +6,13 @@ from django import template
 from django.utils.functional import cached_property
 
 from wagtail.wagtailimages.models import Filter
-from wagtail.wagtailimages.shortcuts import get_rendition_or_not_found
+from wagtail.wagtailimages.rendition_collector import collect_renditions, render_rendition
+from wagtail.wagtailimages.shortcuts import (
+    expand_filter_spec, get_rendition_or_not_found, get_renditions_or_not_found, srcset_img_tag)
 
 register = template.Library()
 allowed_filter_pattern = re.compile("^[A-Za-z0-9_\-\.]+$")
+allowed_srcset_filter_pattern = re.compile("^[A-Za-z0-9_\-\.{},]+$")
 
 
 @register.tag(name="image")
@@ -85,15 +88,125 @@ class ImageNode(template.Node):
         if not image:
             return ''
 
-        rendition = get_rendition_or_not_found(image, self.filter)
-
         if self.output_var_name:
             # return the rendition object in the given variable
-            context[self.output_var_name] = rendition
+            context[self.output_var_name] = get_rendition_or_not_found(image, self.filter)
+            return ''
+        else:
+            # render the rendition's image tag, once the rendition has been fetched
+            resolved_attrs = {}
+            for key in self.attrs:
+                resolved_attrs[key] = self.attrs[key].resolve(context)
+            return render_rendition(image, self.filter, lambda rendition: rendition.img_tag(resolved_attrs))
+
+
+@register.tag(name="srcset_image")
+def srcset_image(parser, token):
+    """
+    Outputs an <img> tag with a srcset of several renditions of an image, which are
+    fetched and generated together. The alternatives are given in braces, eg.
+
+    {% srcset_image self.photo width-{400,800,1200} sizes="(max-width: 600px) 100vw, 50vw" %}
+
+    The renditions can also be put into a variable as a list (for writing <picture>
+    elements by hand), with {% srcset_image self.photo width-{400,800} as renditions %}
+    """
+    bits = token.split_contents()[1:]
+    if not bits:
+        raise template.TemplateSyntaxError("'srcset_image' tag requires an image")
+
+    image_expr = parser.compile_filter(bits[0])
+    bits = bits[1:]
+
+    filter_spec_bits = []
+    attrs = {}
+    output_var_name = None
+
+    if len(bits) >= 2 and bits[-2] == 'as':
+        output_var_name = bits[-1]
+        bits = bits[:-2]
+
+    for bit in bits:
+        try:
+            name, value = bit.split('=')
+            attrs[name] = parser.compile_filter(value)
+        except ValueError:
+            if allowed_srcset_filter_pattern.match(bit):
+                filter_spec_bits.append(bit)
+            else:
+                raise template.TemplateSyntaxError(
+                    "filter specs in 'srcset_image' tag may only contain A-Z, a-z, 0-9, dots, hyphens, "
+                    "underscores, braces and commas. (given filter: {})".format(bit)
+                )
+
+    if not filter_spec_bits or (output_var_name and attrs) or 'as' in filter_spec_bits:
+        raise template.TemplateSyntaxError(
+            "'srcset_image' tag should be of the form "
+            "{% srcset_image self.photo width-{400,800} [ custom-attr=\"value\" ... ] %} "
+            "or {% srcset_image self.photo width-{400,800} as renditions %}"
+        )
+
+    filter_specs = expand_filter_spec('|'.join(filter_spec_bits))
+    return SrcsetImageNode(image_expr, filter_specs, attrs=attrs, output_var_name=output_var_name)
+
+
+class SrcsetImageNode(template.Node):
+    def __init__(self, image_expr, filter_specs, output_var_name=None, attrs={}):
+        self.image_expr = image_expr
+        self.filter_specs = filter_specs
+        self.output_var_name = output_var_name
+        self.attrs = attrs
+
+    @cached_property
+    def filters(self):
+        return [Filter(spec=filter_spec) for filter_spec in self.filter_specs]
+
+    def render(self, context):
+        try:
+            image = self.image_expr.resolve(context)
+        except template.VariableDoesNotExist:
+            return ''
+
+        if not image:
+            return ''
+
+        renditions = list(get_renditions_or_not_found(image, self.filters).values())
+
+        if self.output_var_name:
+            context[self.output_var_name] = renditions
             return ''
         else:
-            # render the rendition's image tag now
             resolved_attrs = {}
             for key in self.attrs:
                 resolved_attrs[key] = self.attrs[key].resolve(context)
-            return rendition.img_tag(resolved_attrs)
+            return srcset_img_tag(renditions, resolved_attrs)
+
+
+@register.tag(name="collectrenditions")
+def collectrenditions(parser, token):
+    """
+    Fetches all the renditions output by {% image %} tags, image chooser blocks and
+    images in rich text within the block together, rather than one at a time, eg.
+
+    {% collectrenditions %}
+        {% for block in page.body %}{% include_block block %}{% endfor %}
+    {% endcollectrenditions %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 1:
+        raise template.TemplateSyntaxError("'collectrenditions' tag takes no arguments")
+
+    nodelist = parser.parse(('endcollectrenditions',))
+    parser.delete_first_token()
+    return CollectRenditionsNode(nodelist)
+
+
+class CollectRenditionsNode(template.Node):
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+
+    def render(self, context):
+        with collect_renditions() as collector:
+            output = self.nodelist.render(context)
+
+        return collector.resolve(output)
@@ -1016,6 +1016,14 @@ class TestPreviewView(TestCase, WagtailTestUtils):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'image/png')
 
+    def test_get_streams_output(self):
+        response = self.client.get(reverse('wagtailimages:preview', args=(self.image.id, 'fill-800x600')))
+
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(content))
+        self.assertTrue(content.startswith(b'\x89PNG'))
+
     def test_get_invalid_filter_spec(self):
         """
         Test that an invalid filter spec returns a 400 response
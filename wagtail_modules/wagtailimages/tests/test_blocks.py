@@ -7,7 +7,9 @@ from django.conf import settings
 from django.core import serializers
 from django.test import TestCase
 
-from wagtail.wagtailimages.blocks import ImageChooserBlock
+from wagtail.wagtailcore.blocks import ListBlock
+from wagtail.wagtailimages.blocks import ImageChooserBlock, ImageListBlock
+from wagtail.wagtailimages.rendition_cache import get_rendition_cache
 
 from .utils import Image, get_test_image_file
 
@@ -55,3 +57,63 @@ class TestImageChooserBlock(TestCase):
         expected_html = '<img alt="missing image" src="/media/not-found" width="0" height="0">'
 
         self.assertHTMLEqual(html, expected_html)
+
+
+class TestBulkImageChooserBlock(TestCase):
+    def setUp(self):
+        self.images = [
+            Image.objects.create(title="Test image %d" % i, file=get_test_image_file())
+            for i in range(3)
+        ]
+        for image in self.images:
+            image.get_rendition('width-400')
+        get_rendition_cache().clear()
+
+    def test_bulk_to_python(self):
+        block = ImageChooserBlock()
+        ids = [self.images[2].id, None, self.images[0].id, 0, self.images[2].id]
+
+        with self.assertNumQueries(1):
+            images = block.bulk_to_python(ids)
+
+        self.assertEqual(images, [self.images[2], None, self.images[0], None, self.images[2]])
+
+    def test_rendition_specs(self):
+        block = ImageChooserBlock(rendition_specs=['width-400'])
+
+        with self.assertNumQueries(2):
+            images = block.bulk_to_python([image.id for image in self.images])
+            renditions = [image.get_rendition('width-400') for image in images]
+
+        self.assertEqual([rendition.width for rendition in renditions], [400, 400, 400])
+
+    def test_image_list_block(self):
+        block = ImageListBlock(ImageChooserBlock(rendition_specs=['width-400']))
+
+        with self.assertNumQueries(2):
+            images = block.to_python([image.id for image in self.images])
+
+        self.assertEqual(images, self.images)
+        self.assertEqual(block.get_prep_value(images), [image.id for image in self.images])
+
+    def test_list_block(self):
+        block = ListBlock(ImageChooserBlock(rendition_specs=['width-400']))
+
+        with self.assertNumQueries(2):
+            images = block.to_python([image.id for image in self.images])
+
+        self.assertEqual(images, self.images)
+
+    def test_string_ids(self):
+        block = ImageChooserBlock()
+
+        images = block.bulk_to_python([str(self.images[1].id), 'foo', self.images[0].id])
+
+        self.assertEqual(images, [self.images[1], None, self.images[0]])
+
+    def test_to_python_single_query(self):
+        block = ImageChooserBlock(rendition_specs=['width-400'])
+
+        # A single image isn't worth an extra query for its renditions
+        with self.assertNumQueries(1):
+            self.assertEqual(block.to_python(self.images[0].id), self.images[0])
@@ -0,0 +1,528 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+from mock import MagicMock, patch
+
+from wagtail.wagtailimages.exceptions import ReconciliationError
+from wagtail.wagtailimages.importer import ImageImporter
+from wagtail.wagtailimages.models import (
+    Rendition, defer_file_deletion, defer_search_index_removal, delete_files, get_folder_model,
+    remove_from_search_index)
+from wagtail.wagtailimages.reconciler import Reconciler
+from wagtail.wagtailimages.utils import create_db_entries, get_folders_list
+
+from .utils import Image, get_test_image_file
+
+ImageFolder = get_folder_model()
+
+
+class FolderTestCase(TestCase):
+    def setUp(self):
+        # Folders are created on disk as well as in the database
+        self.media_root = tempfile.mkdtemp()
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+    def create_folder(self, title, parent=None):
+        folder = ImageFolder(title=title, folder=parent)
+        folder.save()
+        return folder
+
+    def create_image(self, title, folder=None):
+        return Image.objects.create(title=title, file=get_test_image_file(), folder=folder)
+
+
+class TestGetFoldersList(FolderTestCase):
+    def setUp(self):
+        super(TestGetFoldersList, self).setUp()
+
+        self.animals = self.create_folder("Animals")
+        self.cats = self.create_folder("Cats", self.animals)
+        self.dogs = self.create_folder("Dogs", self.animals)
+        self.plants = self.create_folder("Plants")
+
+        self.cat = self.create_image("Cat", self.cats)
+        self.animal = self.create_image("Animal", self.animals)
+        self.create_image("Tree", self.plants)
+
+    def test_tree(self):
+        folders_list = get_folders_list([self.animals])
+
+        self.assertEqual(len(folders_list), 1)
+        animals = folders_list[0]
+        self.assertEqual(animals['title'], "Animals")
+        self.assertEqual(animals['images'], [{'id': self.animal.id, 'title': "Animal", 'url': self.animal.file.url}])
+
+        self.assertEqual([folder['title'] for folder in animals['sub_folders']], ["Cats", "Dogs"])
+        cats, dogs = animals['sub_folders']
+        self.assertEqual([image['id'] for image in cats['images']], [self.cat.id])
+        self.assertEqual(dogs['images'], [])
+        self.assertEqual(dogs['sub_folders'], [])
+
+    def test_number_of_queries(self):
+        root_folders = ImageFolder.objects.filter(folder__isnull=True)
+
+        # One query for the root folders, then one each for all the folders and images
+        with self.assertNumQueries(3):
+            folders_list = get_folders_list(root_folders)
+
+        self.assertEqual([folder['title'] for folder in folders_list], ["Animals", "Plants"])
+        self.assertEqual(folders_list[1]['images'][0]['title'], "Tree")
+
+
+class TestFolderTree(FolderTestCase):
+    def setUp(self):
+        super(TestFolderTree, self).setUp()
+
+        self.animals = self.create_folder("Animals")
+        self.cats = self.create_folder("Cats", self.animals)
+        self.big_cats = self.create_folder("Big cats", self.cats)
+        self.plants = self.create_folder("Plants")
+
+    def test_tree_path(self):
+        self.assertEqual(self.animals.tree_path, '%d/' % self.animals.id)
+        self.assertEqual(self.animals.depth, 1)
+
+        big_cats = ImageFolder.objects.get(id=self.big_cats.id)
+        self.assertEqual(big_cats.tree_path, '%d/%d/%d/' % (self.animals.id, self.cats.id, self.big_cats.id))
+        self.assertEqual(big_cats.depth, 3)
+
+    def test_breadcrumbs(self):
+        big_cats = ImageFolder.objects.get(id=self.big_cats.id)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(big_cats.get_breadcrumbs(), [self.animals, self.cats, self.big_cats])
+
+    def test_descendants(self):
+        self.assertEqual(set(self.animals.get_descendants()), {self.cats, self.big_cats})
+        self.assertEqual(set(self.animals.get_descendants(include_self=True)), {self.animals, self.cats, self.big_cats})
+        self.assertTrue(self.big_cats.is_descendant_of(self.animals))
+        self.assertFalse(self.animals.is_descendant_of(self.animals))
+        self.assertFalse(self.plants.is_descendant_of(self.animals))
+
+    def test_image_count(self):
+        self.create_image("Animal", self.animals)
+        self.create_image("Lion", self.big_cats)
+        self.create_image("Tree", self.plants)
+
+        self.assertEqual(self.animals.get_image_count(), 2)
+        self.assertEqual(self.cats.get_image_count(), 1)
+
+    def test_move_subtree(self):
+        cats = ImageFolder.objects.get(id=self.cats.id)
+        cats.folder = self.plants
+        cats.save()
+
+        big_cats = ImageFolder.objects.get(id=self.big_cats.id)
+        self.assertEqual(big_cats.tree_path, '%d/%d/%d/' % (self.plants.id, self.cats.id, self.big_cats.id))
+        self.assertEqual(big_cats.depth, 3)
+        self.assertEqual(set(self.plants.get_descendants()), {self.cats, self.big_cats})
+        self.assertFalse(self.animals.get_descendants().exists())
+
+        cats.folder = None
+        cats.save()
+
+        big_cats = ImageFolder.objects.get(id=self.big_cats.id)
+        self.assertEqual(big_cats.tree_path, '%d/%d/' % (self.cats.id, self.big_cats.id))
+        self.assertEqual(big_cats.depth, 2)
+
+    def test_cant_move_into_descendant(self):
+        animals = ImageFolder.objects.get(id=self.animals.id)
+        animals.folder = self.big_cats
+
+        with self.assertRaises(ValueError):
+            animals.save()
+
+
+class TestFolderRename(FolderTestCase):
+    def setUp(self):
+        super(TestFolderRename, self).setUp()
+
+        self.animals = self.create_folder("Animals")
+        self.cats = self.create_folder("Cats", self.animals)
+        self.plants = self.create_folder("Plants")
+        self.cat = self.create_image("Cat", self.cats)
+        self.animal = self.create_image("Animal", self.animals)
+
+    def test_rename(self):
+        self.animals.title = "Creatures"
+        self.animals.save()
+
+        cats = ImageFolder.objects.get(id=self.cats.id)
+        self.assertEqual(cats.path, 'original_images/Creatures/Cats')
+        self.assertTrue(os.path.isdir(cats.get_complete_path()))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'original_images/Animals')))
+
+        cat = Image.objects.get(id=self.cat.id)
+        self.assertTrue(cat.file.name.startswith('original_images/Creatures/Cats/'))
+        self.assertTrue(cat.file.storage.exists(cat.file.name))
+        self.assertTrue(Image.objects.get(id=self.animal.id).file.name.startswith('original_images/Creatures/'))
+
+    def test_move(self):
+        cats = ImageFolder.objects.get(id=self.cats.id)
+        cats.folder = self.plants
+        cats.save()
+
+        cat = Image.objects.get(id=self.cat.id)
+        self.assertTrue(cat.file.name.startswith('original_images/Plants/Cats/'))
+        self.assertTrue(cat.file.storage.exists(cat.file.name))
+
+        # Images in the old parent folder aren't affected
+        self.assertTrue(Image.objects.get(id=self.animal.id).file.name.startswith('original_images/Animals/'))
+
+    def test_database_changes_rolled_back_if_rename_fails(self):
+        os.makedirs(os.path.join(self.media_root, 'original_images/Creatures/Existing'))
+        self.animals.title = "Creatures"
+
+        with self.assertRaises(OSError):
+            self.animals.save()
+
+        self.assertEqual(ImageFolder.objects.get(id=self.cats.id).path, 'original_images/Animals/Cats')
+        self.assertTrue(Image.objects.get(id=self.cat.id).file.name.startswith('original_images/Animals/Cats/'))
+
+
+class TestFolderDelete(FolderTestCase):
+    def setUp(self):
+        super(TestFolderDelete, self).setUp()
+
+        self.animals = self.create_folder("Animals")
+        self.cats = self.create_folder("Cats", self.animals)
+        self.plants = self.create_folder("Plants")
+        self.cat = self.create_image("Cat", self.cats)
+        self.animal = self.create_image("Animal", self.animals)
+        self.tree = self.create_image("Tree", self.plants)
+        self.rendition = self.cat.get_rendition('width-400')
+
+    def delete_folder(self, folder):
+        # Files are deleted once the transaction has been committed
+        with patch.object(transaction, 'on_commit', side_effect=lambda func: func(), create=True):
+            folder.delete()
+
+    def test_delete(self):
+        self.delete_folder(self.animals)
+
+        self.assertFalse(ImageFolder.objects.filter(id__in=[self.animals.id, self.cats.id]).exists())
+        self.assertFalse(Image.objects.filter(id__in=[self.cat.id, self.animal.id]).exists())
+        self.assertFalse(Rendition.objects.filter(id=self.rendition.id).exists())
+        self.assertFalse(os.path.exists(self.animals.get_complete_path()))
+
+        # Other folders are left alone
+        self.assertTrue(Image.objects.filter(id=self.tree.id).exists())
+        self.assertTrue(os.path.isdir(self.plants.get_complete_path()))
+
+    def test_files_deleted_in_background(self):
+        with patch('wagtail.wagtailimages.models.delete_files_in_background') as delete_files_in_background:
+            self.delete_folder(self.animals)
+
+        # The original images are deleted along with the folder
+        files = delete_files_in_background.call_args[0][0]
+        self.assertEqual([name for storage, name in files], [self.rendition.file.name])
+
+    def test_nothing_deleted_until_commit(self):
+        with patch.object(transaction, 'on_commit', create=True) as on_commit:
+            self.animals.delete()
+
+        self.assertTrue(os.path.isdir(self.animals.get_complete_path()))
+        self.assertTrue(on_commit.called)
+
+    def test_search_index_entries_removed_in_background(self):
+        with patch('wagtail.wagtailimages.models.run_in_background') as run_in_background:
+            self.delete_folder(self.animals)
+
+        func, images = run_in_background.call_args[0]
+        self.assertEqual(func, remove_from_search_index)
+        self.assertEqual(sorted(image.id for image in images), sorted([self.cat.id, self.animal.id]))
+
+    def test_defer_search_index_removal(self):
+        tree_id = self.tree.id
+        backend = MagicMock()
+
+        with patch('wagtail.wagtailimages.models.get_search_backends_with_name', return_value=[('default', backend)]):
+            with defer_search_index_removal() as images:
+                self.tree.delete()
+
+            self.assertFalse(backend.delete.called)
+            self.assertEqual([image.id for image in images], [tree_id])
+
+            remove_from_search_index(images)
+            backend.delete.assert_called_once_with(images[0])
+
+    def test_defer_file_deletion(self):
+        with defer_file_deletion() as files:
+            self.tree.delete()
+
+        self.assertEqual([name for storage, name in files], [self.tree.file.name])
+        self.assertTrue(self.tree.file.storage.exists(self.tree.file.name))
+
+        delete_files(files)
+
+        self.assertFalse(self.tree.file.storage.exists(self.tree.file.name))
+
+
+class FileTestCase(FolderTestCase):
+    def write_file(self, name, content=None, size=(640, 480)):
+        path = os.path.join(self.media_root, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        with open(path, 'wb') as f:
+            f.write(content if content is not None else get_test_image_file(size=size).file.getvalue())
+
+        return path
+
+
+class TestImageImporter(FileTestCase):
+    def setUp(self):
+        super(TestImageImporter, self).setUp()
+
+        self.write_file('original_images/Animals/cat.png')
+        self.write_file('original_images/Animals/Dogs/dog.png', size=(100, 50))
+        self.write_file('original_images/Animals/notes.txt', content=b'Not an image')
+
+    def test_create_db_entries(self):
+        folder = create_db_entries("Animals", None)
+
+        self.assertEqual(folder.title, "Animals")
+        dogs = ImageFolder.objects.get(title="Dogs")
+        self.assertEqual(dogs.folder, folder)
+
+        cat = Image.objects.get(folder=folder)
+        self.assertEqual(cat.title, "cat")
+        self.assertEqual((cat.width, cat.height), (640, 480))
+        self.assertEqual(cat.file.name, 'original_images/Animals/cat.png')
+
+        # The files are imported in place, rather than being copied
+        dog = Image.objects.get(folder=dogs)
+        self.assertEqual(dog.file.name, 'original_images/Animals/Dogs/dog.png')
+        self.assertEqual((dog.width, dog.height), (100, 50))
+        self.assertEqual(os.listdir(dogs.get_complete_path()), ['dog.png'])
+
+    def test_import_is_incremental(self):
+        ImageImporter().import_all()
+        cat = Image.objects.get(title="cat")
+        rendition = cat.get_rendition('width-400')
+
+        self.write_file('original_images/Animals/Dogs/puppy.png')
+        path = self.write_file('original_images/Animals/cat.png', size=(200, 100))
+        os.utime(path, (0, 0))
+
+        importer = ImageImporter()
+        importer.import_all()
+
+        self.assertEqual((importer.created_count, importer.updated_count, importer.skipped_count), (1, 1, 1))
+        self.assertEqual(Image.objects.count(), 3)
+
+        cat = Image.objects.get(id=cat.id)
+        self.assertEqual((cat.width, cat.height), (200, 100))
+        self.assertFalse(Rendition.objects.filter(id=rendition.id).exists())
+
+    def test_images_without_mtime_not_reimported(self):
+        ImageImporter().import_all()
+        cat = Image.objects.get(title="cat")
+        rendition = cat.get_rendition('width-400')
+
+        # Such as images uploaded through the admin
+        Image.objects.update(file_mtime=None)
+
+        importer = ImageImporter()
+        importer.import_all()
+
+        self.assertEqual((importer.created_count, importer.updated_count, importer.skipped_count), (0, 0, 2))
+        self.assertTrue(Rendition.objects.filter(id=rendition.id).exists())
+        self.assertFalse(Image.objects.filter(file_mtime__isnull=True).exists())
+        self.assertEqual(
+            Image.objects.get(id=cat.id).file_mtime,
+            os.stat(os.path.join(self.media_root, cat.file.name)).st_mtime
+        )
+
+    def test_legacy_copies_not_imported_again(self):
+        # Earlier versions of create_db_entries created images for copies of the files
+        animals = ImageImporter().get_or_create_folder("Animals", None)
+        with open(os.path.join(self.media_root, 'original_images/Animals/cat.png'), 'rb') as f:
+            self.write_file('original_images/Animals/cat_Ab3dE7f.png', content=f.read())
+        cat = Image.objects.create(
+            title="cat", file='original_images/Animals/cat_Ab3dE7f.png', folder=animals, width=640, height=480
+        )
+
+        importer = ImageImporter()
+        importer.import_all()
+
+        self.assertEqual(importer.created_count, 1)
+        self.assertEqual(list(Image.objects.filter(title="cat")), [cat])
+
+        # The reconciler doesn't see the original as an orphan either
+        issues = []
+        Reconciler(min_age=0, report=lambda issue_type, name: issues.append((issue_type, name))).run()
+        self.assertEqual(issues, [])
+
+    def test_different_files_with_similar_names_imported(self):
+        self.write_file('original_images/Animals/cat_Ab3dE7f.png', size=(100, 100))
+        ImageImporter().import_all()
+
+        self.assertEqual(Image.objects.filter(folder__title="Animals").count(), 2)
+
+    def test_invalid_files_reported(self):
+        self.write_file('original_images/Animals/broken.png', content=b'Not an image')
+
+        importer = ImageImporter()
+        importer.import_all()
+
+        self.assertEqual(importer.created_count, 2)
+        self.assertEqual([file_name for file_name, error in importer.errors], ['original_images/Animals/broken.png'])
+        self.assertFalse(Image.objects.filter(title="broken").exists())
+
+    def test_command(self):
+        output = StringIO()
+        call_command('import_images', workers=1, stdout=output, stderr=StringIO())
+
+        self.assertIn("Created 2 images and updated 0 images (0 unchanged)", output.getvalue())
+        self.assertTrue(ImageFolder.objects.filter(title="Dogs", folder__title="Animals").exists())
+
+        output = StringIO()
+        call_command('import_images', workers=1, stdout=output, stderr=StringIO())
+
+        self.assertIn("Created 0 images and updated 0 images (2 unchanged)", output.getvalue())
+
+
+class TestReconciler(FileTestCase):
+    def setUp(self):
+        super(TestReconciler, self).setUp()
+
+        self.animals = self.create_folder("Animals")
+        self.empty = self.create_folder("Empty")
+        os.rmdir(self.empty.get_complete_path())
+
+        self.cat = self.create_image("Cat", self.animals)
+        self.rendition = self.cat.get_rendition('width-400')
+        self.missing = self.create_image("Missing", self.animals)
+        os.remove(self.missing.file.path)
+
+        # Files that are older than the minimum age
+        for name in ['original_images/Animals/orphan.png', 'original_images/Plants/tree.png', 'images/orphan.png']:
+            os.utime(self.write_file(name), (0, 0))
+
+        self.issues = []
+
+    def reconcile(self, **kwargs):
+        reconciler = Reconciler(report=lambda issue_type, name: self.issues.append((issue_type, name)), **kwargs)
+        cursor = reconciler.run()
+        self.assertIsNone(cursor)
+        return reconciler
+
+    def test_report(self):
+        reconciler = self.reconcile()
+
+        self.assertEqual(sorted(self.issues), [
+            ('missing_file', self.missing.file.name),
+            ('missing_folder', 'original_images/Empty'),
+            ('orphan_file', 'original_images/Animals/orphan.png'),
+            ('orphan_file', 'original_images/Plants/tree.png'),
+            ('orphan_folder', 'original_images/Plants'),
+            ('orphan_rendition', 'images/orphan.png'),
+        ])
+        self.assertEqual(reconciler.file_count, 6)
+
+        # Nothing is changed
+        self.assertTrue(Image.objects.filter(id=self.missing.id).exists())
+        self.assertFalse(ImageFolder.objects.filter(title="Plants").exists())
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, 'images/orphan.png')))
+
+    def test_fix(self):
+        self.reconcile(fix=True)
+
+        self.assertFalse(Image.objects.filter(id=self.missing.id).exists())
+        self.assertTrue(os.path.isdir(self.empty.get_complete_path()))
+        self.assertTrue(Image.objects.filter(file='original_images/Animals/orphan.png', folder=self.animals).exists())
+        self.assertEqual(Image.objects.get(file='original_images/Plants/tree.png').folder.title, "Plants")
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'images/orphan.png')))
+        self.assertTrue(Rendition.objects.filter(id=self.rendition.id).exists())
+
+        # Everything matches now
+        self.issues = []
+        self.reconcile()
+        self.assertEqual(self.issues, [])
+
+    def test_fix_refused_if_media_directory_missing(self):
+        shutil.rmtree(os.path.join(self.media_root, 'original_images'))
+
+        with self.assertRaises(ReconciliationError):
+            self.reconcile(fix=True)
+
+        self.assertEqual(Image.objects.filter(id__in=[self.cat.id, self.missing.id]).count(), 2)
+
+        # Reporting is still allowed
+        self.reconcile()
+        self.assertIn(('missing_file', self.cat.file.name), self.issues)
+
+    def test_max_deletions(self):
+        with self.assertRaises(ReconciliationError):
+            self.reconcile(fix=True, max_deletions=0)
+
+        self.assertTrue(Image.objects.filter(id=self.missing.id).exists())
+
+        self.reconcile(fix=True, max_deletions=1)
+
+        self.assertFalse(Image.objects.filter(id=self.missing.id).exists())
+
+    def test_small_chunks(self):
+        for i in range(5):
+            os.utime(self.write_file('images/orphan%d.png' % i), (0, 0))
+
+        reconciler = self.reconcile()
+        issues = sorted(self.issues)
+
+        # Listing directories a few entries at a time finds the same issues
+        self.issues = []
+        chunked_reconciler = self.reconcile(chunk_size=2)
+
+        self.assertEqual(sorted(self.issues), issues)
+        self.assertEqual(chunked_reconciler.file_count, reconciler.file_count)
+
+    def test_new_files_ignored(self):
+        self.write_file('original_images/Animals/new.png')
+
+        self.reconcile()
+
+        self.assertNotIn(('orphan_file', 'original_images/Animals/new.png'), self.issues)
+
+    def test_resume_from_cursor(self):
+        reconciler = Reconciler(report=lambda issue_type, name: self.issues.append((issue_type, name)))
+
+        cursors = []
+        cursor = reconciler.run(limit=2)
+        while cursor is not None:
+            cursors.append(cursor)
+            self.assertEqual(reconciler.file_count, 2)
+            cursor = reconciler.run(start_after=cursor, limit=2)
+
+        self.assertEqual(len(cursors), 2)
+        self.assertEqual(cursors, sorted(cursors))
+
+        # Each issue is found once
+        self.assertEqual(len(self.issues), 6)
+        self.assertEqual(len(set(self.issues)), 6)
+
+    def test_command(self):
+        cursor_file = os.path.join(self.media_root, 'cursor')
+
+        output = StringIO()
+        call_command('reconcile_images', limit=3, cursor_file=cursor_file, stdout=output)
+
+        self.assertIn("Scanned 3 files", output.getvalue())
+        self.assertTrue(os.path.exists(cursor_file))
+
+        output = StringIO()
+        call_command('reconcile_images', limit=3, cursor_file=cursor_file, stdout=output)
+
+        self.assertIn("Scanned 3 files", output.getvalue())
+        self.assertIn("missing_file: %s" % self.missing.file.name, output.getvalue())
+        self.assertFalse(os.path.exists(cursor_file))
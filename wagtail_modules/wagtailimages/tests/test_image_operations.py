@@ -2,6 +2,7 @@ from __future__ import absolute_import, unicode_literals
 
 import warnings
 
+import PIL.JpegImagePlugin
 from django.test import TestCase, override_settings
 from django.utils.six import BytesIO
 from mock import Mock, patch
@@ -92,6 +93,24 @@ class ImageOperationTestCase(TestCase):
         test_run.__name__ = str('test_run_%s' % filter_spec)
         return test_run
 
+    @classmethod
+    def make_output_size_test(cls, filter_spec, image_kwargs, expected_output):
+        def test_output_size(self):
+            image = Image(**image_kwargs)
+            operation = self.operation_class(*filter_spec.split('-'))
+
+            # The predicted size must match the size of the image the operation outputs
+            operation_recorder = WillowOperationRecorder((image.width, image.height))
+            operation.run(operation_recorder, image, {})
+
+            self.assertEqual(
+                tuple(operation.get_output_size(image.width, image.height, image)),
+                tuple(operation_recorder.get_size())
+            )
+
+        test_output_size.__name__ = str('test_output_size_%s' % filter_spec)
+        return test_output_size
+
     @classmethod
     def setup_test_methods(cls):
         if cls.operation_class is None:
@@ -112,6 +131,9 @@ class ImageOperationTestCase(TestCase):
             run_test = cls.make_run_test(*args)
             setattr(cls, run_test.__name__, run_test)
 
+            output_size_test = cls.make_output_size_test(*args)
+            setattr(cls, output_size_test.__name__, output_size_test)
+
 
 class TestDoNothingOperation(ImageOperationTestCase):
     operation_class = image_operations.DoNothingOperation
@@ -445,6 +467,92 @@ class TestFilter(TestCase):
         self.assertEqual(run_mock.call_count, 2)
 
 
+class TestFilterOutputSize(TestCase):
+    def test_resize(self):
+        image = Image(width=1000, height=500)
+
+        self.assertEqual(Filter(spec='width-400').get_output_size(image), (400, 200))
+        self.assertEqual(Filter(spec='max-100x100').get_output_size(image), (100, 50))
+        self.assertEqual(Filter(spec='original').get_output_size(image), (1000, 500))
+
+    def test_chained_operations(self):
+        image = Image(width=1000, height=500)
+        fil = Filter(spec='fill-400x400|width-100|jpegquality-40|format-png')
+
+        self.assertEqual(fil.get_output_size(image), (100, 100))
+
+    def test_given_size(self):
+        image = Image(width=1000, height=500)
+
+        self.assertEqual(Filter(spec='width-400').get_output_size(image, (500, 1000)), (400, 800))
+
+    def test_matches_generated_rendition(self):
+        image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(size=(539, 720)),
+        )
+
+        for spec in ['fill-200x200', 'min-100x100', 'max-100x100', 'height-333']:
+            rendition = image.get_rendition(spec)
+            self.assertEqual(Filter(spec=spec).get_output_size(image), (rendition.width, rendition.height))
+
+
+class TestReducedSizeDecoding(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file_jpeg(size=(2000, 1500)),
+        )
+
+    def test_output_scale(self):
+        self.assertEqual(Filter(spec='width-500').get_output_scale(self.image, (2000, 1500)), 0.25)
+        self.assertEqual(Filter(spec='fill-100x100').get_output_scale(self.image, (2000, 1500)), 100 / 1500)
+        self.assertEqual(Filter(spec='width-500|width-250').get_output_scale(self.image, (2000, 1500)), 0.125)
+        self.assertEqual(Filter(spec='width-4000').get_output_scale(self.image, (2000, 1500)), 1)
+
+    def test_decodes_at_reduced_size(self):
+        draft = PIL.JpegImagePlugin.JpegImageFile.draft
+
+        with patch.object(PIL.JpegImagePlugin.JpegImageFile, 'draft', autospec=True, side_effect=draft) as mock:
+            rendition = self.image.get_rendition('max-165x165')
+
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual((rendition.width, rendition.height), (165, 123))
+
+    def test_doesnt_decode_at_reduced_size_for_small_reductions(self):
+        draft = PIL.JpegImagePlugin.JpegImageFile.draft
+
+        with patch.object(PIL.JpegImagePlugin.JpegImageFile, 'draft', autospec=True, side_effect=draft) as mock:
+            rendition = self.image.get_rendition('width-1200')
+
+        self.assertEqual(mock.call_count, 0)
+        self.assertEqual((rendition.width, rendition.height), (1200, 900))
+
+    def test_output_sizes_unchanged(self):
+        self.image.focal_point_x = 1500
+        self.image.focal_point_y = 300
+        self.image.focal_point_width = 200
+        self.image.focal_point_height = 200
+        self.image.save()
+
+        for spec in ['fill-100x100', 'fill-300x100-c50', 'min-150x150', 'height-99|format-png', 'width-999|width-333']:
+            rendition = self.image.get_rendition(spec)
+            self.assertEqual(Filter(spec=spec).get_output_size(self.image), (rendition.width, rendition.height))
+
+    def test_fill_crop_is_scaled(self):
+        willow = WillowOperationRecorder((500, 375))
+        operation = image_operations.FillOperation('fill', '100x100')
+        env = {'unscaled-size': (2000, 1500)}
+
+        operation.run(willow, Image(width=2000, height=1500), env)
+
+        self.assertEqual(willow.ran_operations, [
+            ('crop', ((62, 0, 438, 375), ), {}),
+            ('resize', ((100, 100), ), {}),
+        ])
+        self.assertNotIn('unscaled-size', env)
+
+
 @hooks.register('register_image_operations')
 def register_image_operations():
     return [
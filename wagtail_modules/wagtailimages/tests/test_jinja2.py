@@ -80,3 +80,19 @@ class TestImagesJinja(TestCase):
             self.render('{{ image(myimage, "width-200") }}', {'myimage': self.bad_image}),
             '<img alt="missing image" src="/media/not-found" width="0" height="0">'
         )
+
+    def test_srcset_image(self):
+        renditions = self.image.get_renditions('width-200', 'width-400')
+
+        self.assertHTMLEqual(
+            self.render('{{ srcset_image(myimage, "width-{200,400}", sizes="50vw") }}', {'myimage': self.image}),
+            '<img alt="Test image" src="{0}" width="200" height="150" srcset="{0} 200w, {1} 400w" sizes="50vw">'.format(
+                renditions['width-200'].url, renditions['width-400'].url
+            )
+        )
+
+    def test_srcset_missing_image(self):
+        self.assertHTMLEqual(
+            self.render('{{ srcset_image(myimage, "width-{200,400}") }}', {'myimage': self.bad_image}),
+            '<img alt="missing image" src="/media/not-found" width="0" height="0" srcset="/media/not-found 0w">'
+        )
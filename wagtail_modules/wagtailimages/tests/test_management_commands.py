@@ -0,0 +1,143 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from wagtail.wagtailimages.rendition_cache import RenditionCache, get_image_key
+
+from .utils import Image, get_test_image_file, shared_rendition_cache
+
+
+class TestPrerenderRenditions(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(),
+        )
+
+    def run_command(self, *args, **options):
+        options.setdefault('workers', 1)
+        output = StringIO()
+        call_command('prerender_renditions', *args, stdout=output, stderr=StringIO(), **options)
+        return output.getvalue()
+
+    def test_creates_renditions(self):
+        output = self.run_command('width-400', 'fill-100x100')
+
+        self.assertIn("Rendered 2 renditions of 1 images", output)
+
+        rendition = self.image.renditions.get(filter_spec='width-400')
+        self.assertEqual((rendition.width, rendition.height), (400, 300))
+        self.assertTrue(rendition.file.storage.exists(rendition.file.name))
+        self.assertTrue(self.image.renditions.filter(filter_spec='fill-100x100').exists())
+
+    def test_skips_existing_renditions(self):
+        rendition = self.image.get_rendition('width-400')
+
+        output = self.run_command('width-400', 'width-200')
+
+        self.assertIn("Rendered 1 renditions of 1 images", output)
+        self.assertEqual(self.image.renditions.get(filter_spec='width-400'), rendition)
+
+    def test_created_since(self):
+        output = self.run_command('width-400', created_since='2100-01-01')
+
+        self.assertIn("Rendered 0 renditions of 0 images", output)
+        self.assertFalse(self.image.renditions.exists())
+
+    def test_corrupt_image_doesnt_stop_run(self):
+        corrupt_image = Image.objects.create(
+            title="Corrupt image",
+            file=get_test_image_file(),
+        )
+        with open(corrupt_image.file.path, 'wb') as f:
+            f.write(b'Not an image')
+
+        output = StringIO()
+        errors = StringIO()
+        call_command('prerender_renditions', 'width-400', workers=1, stdout=output, stderr=errors)
+
+        self.assertIn("Rendered 1 renditions of 2 images", output.getvalue())
+        self.assertIn("1 images could not be rendered", errors.getvalue())
+        self.assertTrue(self.image.renditions.filter(filter_spec='width-400').exists())
+        self.assertFalse(corrupt_image.renditions.exists())
+
+    def test_invalid_filter_spec(self):
+        with self.assertRaises(CommandError):
+            self.run_command('nonexistant-100')
+
+
+class TestMigrateRenditionStorage(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(),
+        )
+        self.rendition = self.image.get_rendition('width-400')
+
+    def run_command(self, errors=None, **options):
+        output = StringIO()
+        call_command('migrate_rendition_storage', stdout=output, stderr=errors or StringIO(), **options)
+        return output.getvalue()
+
+    def test_moves_renditions(self):
+        old_name = self.rendition.file.name
+        storage = self.rendition.file.storage
+
+        output = self.run_command(layout='image_id')
+
+        self.assertIn("Moved 1 renditions", output)
+
+        rendition = self.image.renditions.get(pk=self.rendition.pk)
+        self.assertTrue(rendition.file.name.startswith('images/%d/%d/' % (self.image.id // 1000, self.image.id)))
+        self.assertTrue(storage.exists(rendition.file.name))
+        self.assertFalse(storage.exists(old_name))
+
+        # The cached rendition details must have been updated too
+        self.assertEqual(Image.objects.get(pk=self.image.pk).get_rendition('width-400').url, rendition.url)
+
+    @shared_rendition_cache
+    def test_other_processes_invalidated(self):
+        caches['renditions'].clear()
+
+        # The cache of another process, which has already cached the rendition
+        other_cache = RenditionCache('renditions', max_size=100, backend='renditions')
+        image_key = get_image_key(Image, self.image.pk)
+        other_cache.set(image_key, ('width-400', ''), {'file': self.rendition.file.name})
+        other_cache.get(image_key, ('width-400', ''))
+
+        errors = StringIO()
+        self.run_command(layout='image_id', errors=errors)
+
+        self.assertNotIn("WARNING", errors.getvalue())
+        other_cache._next_generation_check = 0
+        self.assertIsNone(other_cache.get(image_key, ('width-400', '')))
+
+    def test_warns_without_shared_cache(self):
+        errors = StringIO()
+        self.run_command(layout='image_id', errors=errors)
+
+        self.assertIn("WAGTAILIMAGES_RENDITION_CACHE_BACKEND is not set", errors.getvalue())
+
+    @override_settings(WAGTAILIMAGES_RENDITION_STORAGE_LAYOUT='hashed')
+    def test_uses_layout_setting(self):
+        self.run_command()
+
+        rendition = self.image.renditions.get(pk=self.rendition.pk)
+        self.assertRegexpMatches(rendition.file.name, r'^images/[0-9a-f]{2}/[0-9a-f]{2}/')
+
+    def test_dry_run(self):
+        old_name = self.rendition.file.name
+
+        output = self.run_command(layout='hashed', dry_run=True)
+
+        self.assertIn("1 renditions would be moved", output)
+        self.assertEqual(self.image.renditions.get(pk=self.rendition.pk).file.name, old_name)
+
+    def test_already_in_layout(self):
+        output = self.run_command(layout='flat')
+
+        self.assertIn("Moved 0 renditions", output)
@@ -1,20 +1,25 @@
 from __future__ import absolute_import, unicode_literals
 
+import hashlib
+import os
 import unittest
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, Permission
+from django.core.files.images import get_image_dimensions
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.urlresolvers import reverse
 from django.db.utils import IntegrityError
 from django.test import TestCase
 from django.test.utils import override_settings
+from mock import patch
 from willow.image import Image as WillowImage
 
 from wagtail.tests.testapp.models import EventPage, EventPageCarouselItem
 from wagtail.tests.utils import WagtailTestUtils
 from wagtail.wagtailcore.models import Collection, GroupCollectionPermission, Page
-from wagtail.wagtailimages.models import Rendition, SourceImageIOError
+from wagtail.wagtailimages.models import (
+    Filter, Rendition, RenditionOutputFile, SourceImageIOError, prefetch_renditions)
 from wagtail.wagtailimages.rect import Rect
 
 from .utils import Image, get_test_image_file
@@ -245,6 +250,232 @@ class TestRenditions(TestCase):
         self.assertEqual(rendition.alt, "Test image")
 
 
+class TestPrefetchRenditions(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(),
+        )
+        self.image.get_rendition('width-400')
+
+    def test_queryset_prefetch_renditions(self):
+        with self.assertNumQueries(2):
+            image = Image.objects.prefetch_renditions('width-400', 'max-165x165').get(id=self.image.id)
+
+        with self.assertNumQueries(0):
+            rendition = image.get_rendition('width-400')
+
+        self.assertEqual(rendition.width, 400)
+
+    def test_prefetch_renditions_for_list(self):
+        image = Image.objects.get(id=self.image.id)
+
+        with self.assertNumQueries(1):
+            prefetch_renditions([image], 'width-400')
+
+        with self.assertNumQueries(0):
+            rendition = image.get_rendition('width-400')
+
+        self.assertEqual(rendition.width, 400)
+
+    def test_prefetch_more_renditions(self):
+        self.image.get_rendition('width-200')
+        image = Image.objects.prefetch_renditions('width-400').get(id=self.image.id)
+
+        with self.assertNumQueries(1):
+            prefetch_renditions([image], 'width-200', 'width-400')
+
+        # The renditions prefetched before are kept
+        with self.assertNumQueries(0):
+            self.assertEqual(image.get_rendition('width-200').width, 200)
+            self.assertEqual(image.get_rendition('width-400').width, 400)
+
+        self.assertEqual(len(image.renditions.all()), 2)
+
+    def test_falls_back_to_database_for_missing_renditions(self):
+        image = Image.objects.prefetch_renditions('width-400').get(id=self.image.id)
+        rendition = image.get_rendition('width-200')
+
+        self.assertEqual(rendition.width, 200)
+
+
+class TestRenditionStorageLayout(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(),
+        )
+
+    def test_flat(self):
+        rendition = self.image.get_rendition('width-400')
+
+        # The storage may add a suffix, if there's already a file with the same name
+        self.assertRegexpMatches(rendition.file.name, r'^images/test(_\w+)?\.width-400(_\w+)?\.png$')
+
+    @override_settings(WAGTAILIMAGES_RENDITION_STORAGE_LAYOUT='hashed')
+    def test_hashed(self):
+        rendition = self.image.get_rendition('width-400')
+
+        self.assertRegexpMatches(
+            rendition.file.name,
+            r'^images/[0-9a-f]{2}/[0-9a-f]{2}/test(_\w+)?\.width-400(_\w+)?\.png$'
+        )
+        self.assertTrue(rendition.file.storage.exists(rendition.file.name))
+
+    @override_settings(WAGTAILIMAGES_RENDITION_STORAGE_LAYOUT='image_id')
+    def test_image_id(self):
+        rendition = self.image.get_rendition('width-400')
+
+        self.assertRegexpMatches(
+            rendition.file.name,
+            r'^images/%d/%d/test(_\w+)?\.width-400(_\w+)?\.png$' % (self.image.id // 1000, self.image.id)
+        )
+
+    @override_settings(WAGTAILIMAGES_RENDITION_STORAGE_LAYOUT='sideways')
+    def test_unknown_layout_check(self):
+        errors = Rendition.check()
+
+        self.assertEqual([error.id for error in errors], ['wagtailimages.E002'])
+
+
+class TestContentAddressedRenditions(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(),
+        )
+
+    def test_get_file_hash(self):
+        with self.image.file.storage.open(self.image.file.name, 'rb') as f:
+            expected_hash = hashlib.sha1(f.read()).hexdigest()
+
+        self.assertEqual(self.image.get_file_hash(), expected_hash)
+        self.assertEqual(Image.objects.get(id=self.image.id).file_hash, expected_hash)
+
+    @override_settings(WAGTAILIMAGES_CONTENT_ADDRESSED_RENDITIONS=True)
+    def test_file_name(self):
+        rendition = self.image.get_rendition('width-400')
+
+        name_hash = hashlib.sha1('{}:{}:{}:{}'.format(
+            self.image.id, self.image.get_file_hash(), 'width-400', ''
+        ).encode('utf-8')).hexdigest()
+        self.assertEqual(rendition.file.name, 'images/%s.png' % name_hash)
+
+    @override_settings(WAGTAILIMAGES_CONTENT_ADDRESSED_RENDITIONS=True)
+    def test_concurrently_generated_renditions_share_file(self):
+        fil = Filter(spec='width-400')
+
+        # Simulate two processes generating the same rendition at once
+        first_output = fil.run(self.image, RenditionOutputFile())
+        second_output = fil.run(self.image, RenditionOutputFile())
+        first_rendition = self.image.save_rendition(fil, first_output)
+        second_rendition = self.image.save_rendition(fil, second_output)
+
+        self.assertEqual(first_rendition, second_rendition)
+        self.assertEqual(self.image.renditions.count(), 1)
+        self.assertTrue(first_rendition.file.storage.exists(first_rendition.file.name))
+
+    @override_settings(WAGTAILIMAGES_CONTENT_ADDRESSED_RENDITIONS=True)
+    def test_file_written_without_existence_checks(self):
+        self.image.get_file_hash()
+
+        with patch('django.core.files.storage.FileSystemStorage.exists') as exists:
+            with patch('django.core.files.storage.FileSystemStorage.get_available_name') as get_available_name:
+                rendition = self.image.get_rendition('width-400')
+
+        self.assertFalse(exists.called)
+        self.assertFalse(get_available_name.called)
+
+        with rendition.file.storage.open(rendition.file.name, 'rb') as f:
+            self.assertEqual(get_image_dimensions(f), (400, 300))
+
+    @override_settings(WAGTAILIMAGES_CONTENT_ADDRESSED_RENDITIONS=True)
+    def test_file_permissions(self):
+        old_umask = os.umask(0o022)
+        try:
+            rendition = self.image.get_rendition('width-400')
+        finally:
+            os.umask(old_umask)
+
+        # The same as files saved by FileSystemStorage, so that the web server can read it
+        mode = os.stat(rendition.file.path).st_mode & 0o777
+        self.assertEqual(mode, 0o644)
+
+
+class TestGetRenditions(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(),
+        )
+
+    def test_get_renditions(self):
+        renditions = self.image.get_renditions('max-165x165', 'width-400', 'fill-100x100')
+
+        self.assertEqual(list(renditions.keys()), ['max-165x165', 'width-400', 'fill-100x100'])
+        self.assertEqual((renditions['max-165x165'].width, renditions['max-165x165'].height), (165, 123))
+        self.assertEqual((renditions['width-400'].width, renditions['width-400'].height), (400, 300))
+        self.assertEqual((renditions['fill-100x100'].width, renditions['fill-100x100'].height), (100, 100))
+
+        # The renditions are saved
+        self.assertEqual(self.image.renditions.count(), 3)
+        self.assertEqual(self.image.get_rendition('width-400'), renditions['width-400'])
+
+    def test_opens_image_once(self):
+        get_willow_image = Image.get_willow_image
+
+        with patch.object(Image, 'get_willow_image', autospec=True, side_effect=get_willow_image) as mock:
+            self.image.get_renditions('max-165x165', 'width-400', 'width-200', 'fill-100x100')
+
+        self.assertEqual(mock.call_count, 1)
+
+    def test_matches_get_rendition(self):
+        # Renditions derived from a larger one must have the same dimensions as ones
+        # generated from the original
+        filter_specs = ['width-500', 'width-333', 'max-165x165', 'min-100x77', 'height-99|format-jpeg']
+        renditions = self.image.get_renditions(*filter_specs)
+
+        image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(),
+        )
+        for filter_spec in filter_specs:
+            rendition = image.get_rendition(filter_spec)
+            self.assertEqual(
+                (renditions[filter_spec].width, renditions[filter_spec].height),
+                (rendition.width, rendition.height)
+            )
+
+    def test_uses_existing_renditions(self):
+        rendition = self.image.get_rendition('width-400')
+
+        renditions = self.image.get_renditions('width-400', 'width-200')
+
+        self.assertEqual(renditions['width-400'], rendition)
+        self.assertEqual(renditions['width-200'].width, 200)
+
+
+class TestRenditionOutputFile(TestCase):
+    @override_settings(WAGTAILIMAGES_RENDITION_MAX_MEMORY_SIZE=1024)
+    def test_kept_in_memory_until_max_size(self):
+        with RenditionOutputFile() as output:
+            output.write(b'x' * 1024)
+            self.assertFalse(output._rolled)
+
+            output.write(b'x')
+            self.assertTrue(output._rolled)
+
+    def test_rendition_file(self):
+        image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(),
+        )
+        rendition = image.get_rendition('width-400')
+
+        with rendition.file.storage.open(rendition.file.name, 'rb') as f:
+            self.assertTrue(f.read().startswith(b'\x89PNG'))
+
+
 class TestUsageCount(TestCase):
     fixtures = ['test.json']
 
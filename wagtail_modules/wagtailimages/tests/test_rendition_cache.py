@@ -0,0 +1,113 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from wagtail.wagtailimages.rect import Rect
+from wagtail.wagtailimages.rendition_cache import LRUCache, get_rendition_cache
+
+from .utils import Image, get_test_image_file, shared_rendition_cache
+
+
+class TestLRUCache(TestCase):
+    def test_discards_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set((1, 'a'), 'A')
+        cache.set((1, 'b'), 'B')
+
+        # Using 'a' makes 'b' the least recently used entry
+        cache.get((1, 'a'))
+        cache.set((2, 'c'), 'C')
+
+        self.assertEqual(cache.get((1, 'a')), 'A')
+        self.assertIsNone(cache.get((1, 'b')))
+        self.assertEqual(cache.get((2, 'c')), 'C')
+
+    def test_delete_image(self):
+        cache = LRUCache(10)
+        cache.set((1, 'a'), 'A')
+        cache.set((2, 'b'), 'B')
+
+        cache.delete_image(1)
+
+        self.assertIsNone(cache.get((1, 'a')))
+        self.assertEqual(cache.get((2, 'b')), 'B')
+
+    def test_disabled(self):
+        cache = LRUCache(0)
+        cache.set((1, 'a'), 'A')
+
+        self.assertIsNone(cache.get((1, 'a')))
+
+
+@shared_rendition_cache
+class TestRenditionCache(TestCase):
+    def setUp(self):
+        caches['renditions'].clear()
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(),
+        )
+
+    def test_get_rendition_uses_cache(self):
+        first_rendition = self.image.get_rendition('width-400')
+
+        image = Image.objects.get(id=self.image.id)
+        with self.assertNumQueries(0):
+            second_rendition = image.get_rendition('width-400')
+
+        self.assertEqual(first_rendition, second_rendition)
+        self.assertEqual(second_rendition.url, first_rendition.url)
+        self.assertEqual(second_rendition.width, 400)
+        self.assertEqual(second_rendition.height, 300)
+
+    def get_cached(self, filter_spec, focal_point_key=''):
+        return get_rendition_cache().get(self.image.get_rendition_cache_key(), (filter_spec, focal_point_key))
+
+    def test_invalidated_on_rendition_delete(self):
+        self.image.get_rendition('width-400')
+        self.assertIsNotNone(self.get_cached('width-400'))
+
+        self.image.renditions.all().delete()
+
+        self.assertIsNone(self.get_cached('width-400'))
+
+    def test_invalidated_on_set_focal_point(self):
+        rendition = self.image.get_rendition('fill-100x100')
+        self.assertIsNotNone(self.get_cached('fill-100x100', rendition.focal_point_key))
+
+        self.image.set_focal_point(Rect(100, 100, 200, 200))
+
+        self.assertIsNone(self.get_cached('fill-100x100', rendition.focal_point_key))
+
+    @override_settings(WAGTAILIMAGES_RENDITION_CACHE_SIZE=0)
+    def test_disabled(self):
+        self.image.get_rendition('width-400')
+
+        with self.assertNumQueries(1):
+            self.image.get_rendition('width-400')
+
+    def test_shared_backend(self):
+        rendition = self.image.get_rendition('width-400')
+
+        # Simulate another process, which only has the shared backend to go on
+        get_rendition_cache().clear()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.image.get_rendition('width-400'), rendition)
+
+
+class TestRenditionCacheWithoutBackend(TestCase):
+    def test_disabled_without_backend(self):
+        image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(),
+        )
+        image.get_rendition('width-400')
+
+        # Other processes couldn't be told to discard the entry if the rendition
+        # were deleted, so it isn't cached
+        self.assertIsNone(get_rendition_cache().get(image.get_rendition_cache_key(), ('width-400', '')))
+
+        with self.assertNumQueries(1):
+            Image.objects.get(id=image.id).get_rendition('width-400')
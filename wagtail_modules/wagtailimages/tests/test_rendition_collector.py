@@ -0,0 +1,110 @@
+from __future__ import absolute_import, unicode_literals
+
+from django import template
+from django.test import TestCase
+
+from wagtail.wagtailimages.blocks import ImageChooserBlock
+from wagtail.wagtailimages.formats import get_image_format
+from wagtail.wagtailimages.rendition_cache import get_rendition_cache
+from wagtail.wagtailimages.rendition_collector import collect_renditions, render_rendition
+
+from .utils import Image, get_test_image_file
+
+
+class TestCollectRenditions(TestCase):
+    def setUp(self):
+        self.images = [
+            Image.objects.create(
+                title="Test image %d" % i,
+                file=get_test_image_file(),
+            )
+            for i in range(3)
+        ]
+
+    def test_placeholders_replaced(self):
+        with collect_renditions() as collector:
+            html = '<p>%s</p>' % render_rendition(
+                self.images[0], 'width-400', lambda rendition: '<img width="%d">' % rendition.width
+            )
+
+        self.assertNotIn('width="400"', html)
+        self.assertEqual(collector.resolve(html), '<p><img width="400"></p>')
+
+    def test_without_collector(self):
+        html = render_rendition(self.images[0], 'width-400', lambda rendition: '<img width="%d">' % rendition.width)
+
+        self.assertEqual(html, '<img width="400">')
+
+    def test_renditions_fetched_together(self):
+        for image in self.images:
+            image.get_renditions('width-400', 'width-200')
+        get_rendition_cache().clear()
+
+        images = list(Image.objects.filter(id__in=[image.id for image in self.images]))
+
+        with self.assertNumQueries(1):
+            with collect_renditions() as collector:
+                html = ''.join(
+                    render_rendition(image, filter_spec, lambda rendition: '%d ' % rendition.width)
+                    for image in images
+                    for filter_spec in ['width-400', 'width-200']
+                )
+            html = collector.resolve(html)
+
+        self.assertEqual(html, '400 200 ' * 3)
+
+    def test_images_with_prefetched_renditions(self):
+        for image in self.images:
+            image.get_renditions('width-400', 'width-200')
+        get_rendition_cache().clear()
+
+        # The renditions prefetched for another filter don't hide the collected ones
+        images = list(Image.objects.filter(id__in=[image.id for image in self.images]).prefetch_renditions('width-400'))
+
+        with self.assertNumQueries(1):
+            with collect_renditions() as collector:
+                html = ''.join(
+                    render_rendition(image, 'width-200', lambda rendition: '%d ' % rendition.width)
+                    for image in images
+                )
+            html = collector.resolve(html)
+
+        self.assertEqual(html, '200 ' * 3)
+
+    def test_missing_renditions_generated(self):
+        with collect_renditions() as collector:
+            html = collector.resolve(get_image_format('left').image_to_html(self.images[0], 'Alt text'))
+
+        self.assertIn('width="500"', html)
+        self.assertTrue(self.images[0].renditions.filter(filter_spec='width-500').exists())
+
+    def test_image_chooser_block(self):
+        block = ImageChooserBlock()
+
+        with collect_renditions() as collector:
+            html = block.render(self.images[0])
+
+        self.assertEqual(collector.resolve(html), self.images[0].get_rendition('original').img_tag())
+
+    def test_template_tag(self):
+        temp = template.Template(
+            '{% load wagtailimages_tags %}{% collectrenditions %}'
+            '{% for image in images %}{% image image width-400 class="photo" %}{% endfor %}'
+            '{% endcollectrenditions %}'
+        )
+
+        html = temp.render(template.Context({'images': self.images}))
+
+        self.assertEqual(html.count('width="400"'), 3)
+        self.assertEqual(html.count('class="photo"'), 3)
+        self.assertNotIn('wagtailimages-rendition', html)
+
+    def test_nested_collectors(self):
+        with collect_renditions() as outer:
+            outer_html = render_rendition(self.images[0], 'width-400', lambda rendition: 'outer')
+
+            with collect_renditions() as inner:
+                inner_html = render_rendition(self.images[0], 'width-400', lambda rendition: 'inner')
+            self.assertEqual(inner.resolve(inner_html), 'inner')
+
+        self.assertEqual(outer.resolve(outer_html), 'outer')
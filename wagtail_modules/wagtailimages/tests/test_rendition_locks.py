@@ -0,0 +1,99 @@
+from __future__ import absolute_import, unicode_literals
+
+import threading
+
+from django.test import TestCase, override_settings
+from mock import patch
+
+from wagtail.wagtailimages.models import Rendition
+from wagtail.wagtailimages.rendition_locks import _local_locks, rendition_lock
+
+from .utils import Image, get_test_image_file
+
+
+class TestRenditionLock(TestCase):
+    def run_in_thread(self, key, events):
+        def target():
+            with rendition_lock(key):
+                events.append('thread')
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        return thread
+
+    def test_waits_for_lock(self):
+        key = ('wagtailimages.image:1', 'width-400', '')
+        events = []
+
+        with rendition_lock(key):
+            thread = self.run_in_thread(key, events)
+            thread.join(0.2)
+            events.append('main')
+
+        thread.join()
+
+        self.assertEqual(events, ['main', 'thread'])
+
+    def test_different_keys_dont_wait(self):
+        events = []
+
+        with rendition_lock(('wagtailimages.image:1', 'width-400', '')):
+            thread = self.run_in_thread(('wagtailimages.image:1', 'width-200', ''), events)
+            thread.join()
+            events.append('main')
+
+        self.assertEqual(events, ['thread', 'main'])
+
+    @override_settings(WAGTAILIMAGES_RENDITION_LOCK_DIR=None)
+    def test_without_lock_dir(self):
+        with rendition_lock(('wagtailimages.image:1', 'width-400', '')):
+            pass
+
+    def test_locks_are_forgotten(self):
+        with rendition_lock(('wagtailimages.image:1', 'width-400', ''), ('wagtailimages.image:1', 'width-200', '')):
+            self.assertEqual(len(_local_locks), 2)
+
+        self.assertEqual(len(_local_locks), 0)
+
+
+class TestGetRenditionLocking(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(),
+        )
+
+    def test_rechecks_after_acquiring_lock(self):
+        rendition = self.image.get_rendition('width-400')
+        find_existing_rendition = Image.find_existing_rendition
+        calls = []
+
+        def find_existing_rendition_after_first_call(image, filter):
+            # Pretend that another worker generated the rendition while this one was
+            # waiting for the lock
+            calls.append(filter.spec)
+            if len(calls) == 1:
+                raise Rendition.DoesNotExist
+
+            return find_existing_rendition(image, filter)
+
+        with patch.object(Image, 'find_existing_rendition', autospec=True,
+                          side_effect=find_existing_rendition_after_first_call):
+            with patch.object(Image, 'create_rendition') as create_rendition:
+                self.assertEqual(self.image.get_rendition('width-400'), rendition)
+
+        self.assertEqual(len(calls), 2)
+        self.assertFalse(create_rendition.called)
+
+    def test_rendition_created_by_uncommitted_transaction(self):
+        rendition = self.image.get_rendition('width-400')
+        storage = rendition.file.storage
+        files_before = set(storage.listdir('images')[1])
+
+        # Pretend that another worker created the rendition in a transaction that hadn't
+        # been committed when this one checked for it
+        with patch.object(Image, 'find_existing_rendition', autospec=True, side_effect=Rendition.DoesNotExist):
+            self.assertEqual(self.image.get_rendition('width-400'), rendition)
+
+        # The file generated by this worker is discarded
+        self.assertEqual(set(storage.listdir('images')[1]), files_before)
@@ -1,9 +1,11 @@
 from __future__ import absolute_import, unicode_literals
 
 from bs4 import BeautifulSoup
+from django import template
 from django.test import TestCase
 
-from wagtail.wagtailimages.rich_text import ImageEmbedHandler
+from wagtail.wagtailimages.rendition_cache import get_rendition_cache
+from wagtail.wagtailimages.rich_text import ImageEmbedHandler, expand_db_html
 
 from .utils import Image, get_test_image_file
 
@@ -50,3 +52,42 @@ class TestImageEmbedHandler(TestCase):
             '<img data-embedtype="image" data-id="1" data-format="left" '
             'data-alt="test-alt" class="richtext-image left"', result
         )
+
+
+class TestBatchedImageEmbeds(TestCase):
+    def setUp(self):
+        self.images = [
+            Image.objects.create(title="Test image %d" % i, file=get_test_image_file())
+            for i in range(3)
+        ]
+        self.html = ''.join(
+            '<p><embed alt="alt" embedtype="image" format="left" id="%d"/></p>' % image.id
+            for image in self.images
+        ) + '<p><embed alt="alt" embedtype="image" format="left" id="0"/></p>'
+
+        for image in self.images:
+            image.get_rendition('width-500')
+        get_rendition_cache().clear()
+
+    def check_html(self, html):
+        self.assertEqual(html.count('class="richtext-image left"'), 3)
+        self.assertEqual(html.count('width="500"'), 3)
+        self.assertIn('<img>', html)
+
+    def test_expand_db_html(self):
+        # One query for the images and one for their renditions
+        with self.assertNumQueries(2):
+            html = expand_db_html(self.html)
+
+        self.check_html(html)
+
+    def test_richtext_filter(self):
+        tpl = template.Template(
+            '{% load wagtailcore_tags wagtailimages_tags %}'
+            '{% collectrenditions %}{{ html|richtext }}{% endcollectrenditions %}'
+        )
+
+        with self.assertNumQueries(2):
+            html = tpl.render(template.Context({'html': self.html}))
+
+        self.check_html(html)
@@ -0,0 +1,152 @@
+from __future__ import absolute_import, unicode_literals
+
+import unittest
+
+from django.test import TestCase
+from django.utils import six
+from mock import patch
+
+from wagtail.wagtailimages.views.serve import generate_signature
+
+from .utils import Image, get_test_image_file
+
+if six.PY3:
+    import asyncio
+    from concurrent.futures import Executor, Future
+
+    from wagtail.wagtailimages.views.serve_async import AsyncServeView
+
+    class InlineExecutor(Executor):
+        """
+        Runs functions in the calling thread, so that they can see the test's
+        database transaction
+        """
+        def submit(self, fn, *args, **kwargs):
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+
+@unittest.skipIf(six.PY2, "AsyncServeView requires Python 3")
+class TestAsyncServeView(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(),
+        )
+
+        # Closing connections would end the test's transaction. The test client
+        # doesn't close them either.
+        patcher = patch('wagtail.wagtailimages.views.serve_async.close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_path(self, filter_spec='fill-800x600', image_id=None):
+        image_id = image_id or self.image.id
+        signature = generate_signature(image_id, filter_spec).decode()
+        return '/images/%s/%d/%s/' % (signature, image_id, filter_spec)
+
+    def request(self, path, method='GET', headers=None, **kwargs):
+        app = AsyncServeView(executor=InlineExecutor(), **kwargs)
+        scope = {
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'headers': [
+                (name.encode('latin-1'), value.encode('latin-1'))
+                for name, value in (headers or {}).items()
+            ],
+        }
+        messages = []
+
+        def send(message):
+            messages.append(message)
+            return asyncio.sleep(0)
+
+        def receive():
+            return asyncio.sleep(0, {'type': 'http.request', 'body': b''})
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(app(scope, receive, send))
+        finally:
+            loop.close()
+
+        start = messages[0]
+        response_headers = {name.decode(): value.decode() for name, value in start['headers']}
+        body = b''.join(message['body'] for message in messages[1:])
+        self.assertFalse(messages[-1].get('more_body', False))
+        return start['status'], response_headers, body
+
+    def test_serve(self):
+        status, headers, body = self.request(self.get_path())
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-type'], 'image/png')
+        self.assertEqual(int(headers['content-length']), len(body))
+        self.assertEqual(body, self.image.renditions.get(filter_spec='fill-800x600').file.read())
+
+    def test_serve_in_chunks(self):
+        with patch.object(AsyncServeView, 'chunk_size', 100):
+            status, headers, body = self.request(self.get_path())
+
+        self.assertEqual(status, 200)
+        self.assertEqual(int(headers['content-length']), len(body))
+
+    def test_head(self):
+        status, headers, body = self.request(self.get_path(), method='HEAD')
+
+        self.assertEqual(status, 200)
+        self.assertIn('content-length', headers)
+        self.assertEqual(body, b'')
+
+    def test_if_none_match(self):
+        etag = self.request(self.get_path())[1]['etag']
+
+        status, headers, body = self.request(self.get_path(), headers={'If-None-Match': etag})
+
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b'')
+
+    def test_range(self):
+        status, headers, body = self.request(self.get_path(), headers={'Range': 'bytes=0-9'})
+
+        self.assertEqual(status, 206)
+        self.assertEqual(len(body), 10)
+        self.assertTrue(headers['content-range'].startswith('bytes 0-9/'))
+
+    def test_range_not_satisfiable(self):
+        status, headers, body = self.request(self.get_path(), headers={'Range': 'bytes=100000000-'})
+
+        self.assertEqual(status, 416)
+
+    def test_redirect(self):
+        status, headers, body = self.request(self.get_path(), action='redirect')
+
+        self.assertEqual(status, 301)
+        self.assertEqual(headers['location'], self.image.renditions.get(filter_spec='fill-800x600').url)
+
+    def test_invalid_signature(self):
+        path = self.get_path().replace('fill-800x600', 'fill-400x400', 1)
+
+        status, headers, body = self.request(path)
+
+        self.assertEqual(status, 403)
+
+    def test_image_doesnt_exist(self):
+        status, headers, body = self.request(self.get_path(image_id=self.image.id + 1))
+
+        self.assertEqual(status, 404)
+
+    def test_invalid_filter_spec(self):
+        status, headers, body = self.request(self.get_path(filter_spec='bad-filter-spec'))
+
+        self.assertEqual(status, 400)
+
+    def test_post_not_allowed(self):
+        status, headers, body = self.request(self.get_path(), method='POST')
+
+        self.assertEqual(status, 405)
@@ -1,9 +1,20 @@
 # coding=utf-8
 from __future__ import absolute_import, unicode_literals
 
-from django.test import TestCase
+from datetime import timedelta
 
-from wagtail.wagtailimages.shortcuts import get_rendition_or_not_found
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+from mock import patch
+
+from wagtail.wagtailimages.models import RenditionJob
+from wagtail.wagtailimages.rendition_queue import (
+    DEFAULT_PLACEHOLDER_URL, get_claimable_jobs, get_stalled_jobs, run_rendition_job)
+from wagtail.wagtailimages.shortcuts import (
+    expand_filter_spec, get_rendition_or_not_found, get_renditions_or_not_found)
 
 from .utils import Image, get_test_image_file
 
@@ -24,3 +35,142 @@ class TestShortcuts(TestCase):
 
         rendition = get_rendition_or_not_found(bad_image, 'width-400')
         self.assertEqual(rendition.file.name, 'not-found')
+
+    def test_renditions_fallback_to_not_found(self):
+        bad_image = Image.objects.get(id=1)
+
+        renditions = get_renditions_or_not_found(bad_image, ['width-400', 'width-200'])
+
+        self.assertEqual(list(renditions.keys()), ['width-400', 'width-200'])
+        self.assertEqual(renditions['width-200'].file.name, 'not-found')
+
+    def test_expand_filter_spec(self):
+        self.assertEqual(expand_filter_spec('width-400'), ['width-400'])
+        self.assertEqual(
+            expand_filter_spec('width-{400, 800}|jpegquality-60'),
+            ['width-400|jpegquality-60', 'width-800|jpegquality-60']
+        )
+        self.assertEqual(
+            expand_filter_spec('fill-{100,200}x{50,100}'),
+            ['fill-100x50', 'fill-100x100', 'fill-200x50', 'fill-200x100']
+        )
+
+
+@override_settings(WAGTAILIMAGES_ASYNC_RENDITIONS=True)
+class TestAsyncRenditions(TestCase):
+
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(),
+        )
+
+    def test_placeholder_for_missing_rendition(self):
+        rendition = get_rendition_or_not_found(self.image, 'fill-200x100')
+
+        # The placeholder has the dimensions of the final rendition, but isn't saved
+        self.assertIsNone(rendition.pk)
+        self.assertEqual(rendition.width, 200)
+        self.assertEqual(rendition.height, 100)
+        self.assertEqual(rendition.url, DEFAULT_PLACEHOLDER_URL)
+
+        job = RenditionJob.objects.get(image_id=self.image.id)
+        self.assertEqual(job.filter_spec, 'fill-200x100')
+        self.assertEqual(job.status, RenditionJob.STATUS_PENDING)
+
+    def test_rendition_queued_once(self):
+        get_rendition_or_not_found(self.image, 'width-400')
+        get_rendition_or_not_found(self.image, 'width-400')
+
+        self.assertEqual(RenditionJob.objects.filter(image_id=self.image.id).count(), 1)
+
+    def test_run_rendition_job(self):
+        get_rendition_or_not_found(self.image, 'width-400')
+        job = RenditionJob.objects.get(image_id=self.image.id)
+
+        run_rendition_job(job.id)
+
+        self.assertFalse(RenditionJob.objects.filter(id=job.id).exists())
+        rendition = get_rendition_or_not_found(self.image, 'width-400')
+        self.assertIsNotNone(rendition.pk)
+        self.assertEqual(rendition.width, 400)
+        self.assertEqual(rendition.height, 300)
+
+    @override_settings(WAGTAILIMAGES_ASYNC_RENDITION_PLACEHOLDER_URL='/static/placeholder.png')
+    def test_placeholder_url_setting(self):
+        rendition = get_rendition_or_not_found(self.image, 'width-400')
+
+        self.assertEqual(rendition.url, '/static/placeholder.png')
+        self.assertIn('src="/static/placeholder.png"', rendition.img_tag())
+
+    def test_running_job_not_claimed_again(self):
+        get_rendition_or_not_found(self.image, 'width-400')
+        job = RenditionJob.objects.get(image_id=self.image.id)
+        RenditionJob.objects.filter(id=job.id).update(
+            status=RenditionJob.STATUS_RUNNING, claimed_at=timezone.now()
+        )
+
+        self.assertIsNone(run_rendition_job(job.id))
+        self.assertTrue(RenditionJob.objects.filter(id=job.id).exists())
+
+    def test_stale_jobs_claimed_again(self):
+        get_rendition_or_not_found(self.image, 'width-400')
+        get_rendition_or_not_found(self.image, 'width-200')
+        RenditionJob.objects.filter(filter_spec='width-400').update(
+            status=RenditionJob.STATUS_RUNNING, claimed_at=timezone.now() - timedelta(hours=1)
+        )
+        RenditionJob.objects.filter(filter_spec='width-200').update(
+            status=RenditionJob.STATUS_FAILED, claimed_at=timezone.now() - timedelta(hours=1)
+        )
+
+        for job in RenditionJob.objects.all():
+            self.assertTrue(run_rendition_job(job.id))
+
+        self.assertFalse(RenditionJob.objects.exists())
+        self.assertEqual(self.image.renditions.count(), 2)
+
+    def test_stale_pending_jobs_submitted_again(self):
+        get_rendition_or_not_found(self.image, 'width-400')
+        get_rendition_or_not_found(self.image, 'width-200')
+        stale_job = RenditionJob.objects.get(filter_spec='width-400')
+        RenditionJob.objects.filter(id=stale_job.id).update(created_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(list(get_stalled_jobs()), [stale_job])
+        self.assertEqual(get_claimable_jobs().count(), 2)
+
+        # The process that queued the job may have died before its workers ran it,
+        # so it's handed to the workers again. The other job is left alone
+        with patch('wagtail.wagtailimages.rendition_queue.get_executor') as get_executor, \
+                patch.object(transaction, 'on_commit', side_effect=lambda func: func(), create=True):
+            get_rendition_or_not_found(self.image, 'width-400')
+            get_rendition_or_not_found(self.image, 'width-200')
+
+        self.assertEqual(get_executor.return_value.submit.call_count, 1)
+        self.assertEqual(get_executor.return_value.submit.call_args[0][1], stale_job.id)
+
+    def test_process_rendition_jobs_command(self):
+        get_rendition_or_not_found(self.image, 'width-400')
+        get_rendition_or_not_found(self.image, 'width-200')
+
+        output = StringIO()
+        call_command('process_rendition_jobs', stdout=output, stderr=StringIO())
+
+        self.assertIn("Ran 2 rendition jobs", output.getvalue())
+        self.assertFalse(RenditionJob.objects.exists())
+        self.assertTrue(self.image.renditions.filter(filter_spec='width-200').exists())
+
+    def test_existing_rendition_returned(self):
+        rendition = self.image.get_rendition('width-400')
+
+        self.assertEqual(get_rendition_or_not_found(self.image, 'width-400'), rendition)
+        self.assertFalse(RenditionJob.objects.exists())
+
+    def test_placeholders_for_missing_renditions(self):
+        rendition = self.image.get_rendition('width-400')
+
+        renditions = get_renditions_or_not_found(self.image, ['width-400', 'width-200'])
+
+        self.assertEqual(renditions['width-400'], rendition)
+        self.assertIsNone(renditions['width-200'].pk)
+        self.assertEqual(renditions['width-200'].width, 200)
+        self.assertTrue(RenditionJob.objects.filter(image_id=self.image.id, filter_spec='width-200').exists())
@@ -6,11 +6,12 @@ import warnings
 
 from django import forms, template
 from django.conf import settings
+from django.core.cache import caches
 from django.core.exceptions import ImproperlyConfigured
 from django.core.urlresolvers import reverse
-from django.test import TestCase, override_settings
+from django.test import RequestFactory, TestCase, override_settings
 from django.utils import six
-from mock import MagicMock
+from mock import MagicMock, patch
 from taggit.forms import TagField, TagWidget
 
 from wagtail.tests.testapp.models import CustomImage, CustomImageFilePath
@@ -22,9 +23,11 @@ from wagtail.wagtailimages.formats import Format, get_image_format, register_ima
 from wagtail.wagtailimages.forms import get_image_form
 from wagtail.wagtailimages.models import Image as WagtailImage
 from wagtail.wagtailimages.rect import Rect, Vector
-from wagtail.wagtailimages.views.serve import ServeView, generate_signature, verify_signature
+from wagtail.wagtailimages.rendition_cache import get_rendition_cache
+from wagtail.wagtailimages.views.serve import (
+    ServeView, generate_signature, get_content_type, verify_signature)
 
-from .utils import Image, get_test_image_file
+from .utils import Image, get_test_image_file, shared_rendition_cache
 
 try:
     import sendfile  # noqa
@@ -126,6 +129,64 @@ class TestImageTag(TestCase):
             temp.render(context)
 
 
+class TestSrcsetImageTag(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(),
+        )
+
+    def render(self, template_string, image=None):
+        temp = template.Template('{% load wagtailimages_tags %}' + template_string)
+        return temp.render(template.Context({'image_obj': image or self.image}))
+
+    def test_srcset_image_tag(self):
+        result = self.render('{% srcset_image image_obj width-{200,400} sizes="50vw" %}')
+
+        renditions = self.image.get_renditions('width-200', 'width-400')
+        self.assertHTMLEqual(
+            result,
+            '<img alt="Test image" src="{0}" width="200" height="150" srcset="{0} 200w, {1} 400w" sizes="50vw">'.format(
+                renditions['width-200'].url, renditions['width-400'].url
+            )
+        )
+
+    def test_renditions_fetched_in_one_query(self):
+        self.image.get_renditions('width-200', 'width-400', 'width-600')
+        image = Image.objects.get(id=self.image.id)
+        get_rendition_cache().clear()
+
+        with self.assertNumQueries(1):
+            self.render('{% srcset_image image_obj width-{200,400,600} %}', image)
+
+    def test_same_width_only_listed_once(self):
+        # The test image is 640 pixels wide, so isn't scaled up
+        result = self.render('{% srcset_image image_obj max-{1000x1000,2000x2000} %}')
+
+        self.assertEqual(result.count(' 640w'), 1)
+
+    def test_chained_filters(self):
+        result = self.render('{% srcset_image image_obj fill-{100x100,200x200} format-jpeg %}')
+
+        self.assertIn('width="100"', result)
+        self.assertIn('.fill-200x200.format-jpeg.jpg 200w', result)
+
+    def test_as_variable(self):
+        result = self.render(
+            '{% srcset_image image_obj width-{200,400} as renditions %}'
+            '{% for rendition in renditions %}{{ rendition.width }} {% endfor %}'
+        )
+
+        self.assertEqual(result, '200 400 ')
+
+    def test_invalid_syntax(self):
+        with self.assertRaises(template.TemplateSyntaxError):
+            self.render('{% srcset_image image_obj width-{200,400} as renditions class="photo" %}')
+
+        with self.assertRaises(template.TemplateSyntaxError):
+            self.render('{% srcset_image image_obj %}')
+
+
 class TestMissingImage(TestCase):
     """
     Missing image files in media/original_images should be handled gracefully, to cope with
@@ -238,6 +299,28 @@ class TestFrontendServeView(TestCase):
         self.assertTrue(response.streaming)
         self.assertEqual(response['Content-Type'], 'image/png')
 
+    def test_content_type_from_extension(self):
+        signature = generate_signature(self.image.id, 'width-400|format-jpeg')
+
+        # Generate the rendition first, as the image library opens the source image
+        # with imghdr too
+        self.image.get_rendition('width-400|format-jpeg')
+
+        with patch('wagtail.wagtailimages.views.serve.imghdr.what') as what:
+            response = self.client.get(reverse('wagtailimages_serve', args=(signature, self.image.id, 'width-400|format-jpeg')))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertFalse(what.called)
+
+    def test_content_type_sniffed_for_unknown_extension(self):
+        rendition = self.image.get_rendition('fill-800x600')
+        storage = rendition.file.storage
+        with storage.open(rendition.file.name, 'rb') as f:
+            rendition.file.name = storage.save('images/test.img', f)
+
+        self.assertEqual(get_content_type(rendition), 'image/png')
+
     def test_get_with_extra_component(self):
         """
         Test that a filename can be optionally added to the end of the URL.
@@ -365,6 +448,143 @@ class TestFrontendServeView(TestCase):
         self.assertEqual(response.status_code, 410)
 
 
+@shared_rendition_cache
+class TestFrontendServeViewRenditionCache(TestCase):
+    def setUp(self):
+        caches['renditions'].clear()
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(),
+        )
+        self.signature = generate_signature(self.image.id, 'fill-800x600')
+        self.url = reverse('wagtailimages_serve', args=(self.signature, self.image.id, 'fill-800x600'))
+
+    def test_repeat_requests_dont_query_database(self):
+        first_response = self.client.get(self.url)
+
+        # The view is called directly, as middleware (such as SiteMiddleware) may
+        # query the database on every request
+        view = ServeView.as_view()
+        request = RequestFactory().get(self.url)
+        with self.assertNumQueries(0):
+            second_response = view(request, self.signature.decode(), str(self.image.id), 'fill-800x600')
+
+        self.assertEqual(second_response.status_code, 200)
+        self.assertEqual(second_response['ETag'], first_response['ETag'])
+        self.assertEqual(b''.join(second_response.streaming_content), b''.join(first_response.streaming_content))
+
+    def test_signature_still_checked(self):
+        self.client.get(self.url)
+
+        signature = generate_signature(self.image.id + 1, 'fill-800x600')
+        response = self.client.get(reverse('wagtailimages_serve', args=(signature, self.image.id, 'fill-800x600')))
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_invalidated_on_focal_point_change(self):
+        first_etag = self.client.get(self.url)['ETag']
+
+        self.image.set_focal_point(Rect(100, 100, 200, 200))
+        self.image.save()
+
+        response = self.client.get(self.url)
+
+        # A new rendition is generated for the new focal point
+        self.assertNotEqual(response['ETag'], first_etag)
+        self.assertEqual(self.image.renditions.count(), 2)
+
+
+class TestFrontendServeViewCaching(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_test_image_file(),
+        )
+        signature = generate_signature(self.image.id, 'fill-800x600')
+        self.url = reverse('wagtailimages_serve', args=(signature, self.image.id, 'fill-800x600'))
+
+    def get_content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_headers(self):
+        response = self.client.get(self.url)
+        content = self.get_content(response)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(response['Cache-Control'], 'max-age=2592000')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(int(response['Content-Length']), len(content))
+
+    @override_settings(WAGTAILIMAGES_SERVE_MAX_AGE=60)
+    def test_max_age_setting(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response['Cache-Control'], 'max-age=60')
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_if_none_match_other_etag(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"')
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        content = self.get_content(self.client.get(self.url))
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/%d' % len(content))
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(self.get_content(response), content[10:20])
+
+    def test_suffix_range(self):
+        content = self.get_content(self.client.get(self.url))
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.get_content(response), content[-10:])
+
+    def test_open_ended_range(self):
+        content = self.get_content(self.client.get(self.url))
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.get_content(response), content[10:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100000000-')
+
+        self.assertEqual(response.status_code, 416)
+
+    def test_multiple_ranges_ignored(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9,20-29')
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_range_other_etag(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"other"')
+
+        self.assertEqual(response.status_code, 200)
+
+
 class TestFrontendSendfileView(TestCase):
 
     def setUp(self):
@@ -1,13 +1,25 @@
 from __future__ import absolute_import, unicode_literals
 
 import PIL.Image
+from django.conf import settings
 from django.core.files.images import ImageFile
+from django.test import override_settings
 from django.utils.six import BytesIO
 
 from wagtail.wagtailimages import get_image_model
 
 Image = get_image_model()
 
+# The rendition cache is only enabled when it has a backend to share entries between
+# processes. Tests that use it should clear caches['renditions'] in setUp.
+shared_rendition_cache = override_settings(
+    CACHES=dict(settings.CACHES, renditions={
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'wagtailimages-renditions',
+    }),
+    WAGTAILIMAGES_RENDITION_CACHE_BACKEND='renditions',
+)
+
 
 def get_test_image_file(filename='test.png', colour='white', size=(640, 480)):
     f = BytesIO()
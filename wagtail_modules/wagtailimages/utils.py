@@ -1,18 +1,12 @@
 from __future__ import absolute_import, unicode_literals
 
-import os
+from collections import defaultdict
 
-from wagtail.wagtailsearch import index as search_index
 from wagtail.wagtailimages.models import get_folder_model
-from wagtail.wagtailimages.forms import get_image_form
-from wagtail.wagtailimages.fields import ALLOWED_EXTENSIONS
 from wagtail.wagtailimages import get_image_model
 
-from django.core.files import File
-
 ImageFolder = get_folder_model()
 Image = get_image_model()
-ImageForm = get_image_form(Image)
 
 
 # Helper functions for migrating the Rendition.filter foreign key to the filter_spec field,
@@ -56,86 +50,74 @@ def get_fill_filter_spec_migrations(app_name, rendition_model_name):
 
 
 def create_db_entries(title, user, parent_folder=None):
-    """Recursively creates DB entries for a physical folder, its sub folders
-    and images under them."""
+    """Creates DB entries for a physical folder, its sub folders
+    and images under them (see ImageImporter)."""
+
+    from wagtail.wagtailimages.importer import ImageImporter
+    return ImageImporter(user=user).import_folder(title, parent_folder)
 
-    folder = ImageFolder()
-    folder.title = title
-    if parent_folder:
-        folder.folder = parent_folder
 
-    try:
-        folder.save()
-    except FileExistsError:
-        # Ignore the exception as the physical folder already exists
-        pass
+def get_folders_list(folders):
+    """Converts a list of folder objects to a list of folder dicts, with the folders
+    under them in 'sub_folders' and the images in each folder in a dictionary format.
 
-    complete_path = folder.get_complete_path()
+    The whole tree is built from two flat queries (one for the folders, one for the
+    images), rather than querying each folder separately."""
 
-    for entry in os.listdir(complete_path):
-        # Get all the files and folders under the current folder
-        # If a file is found and if its of an image type, create an image entry
-        if os.path.isfile(os.path.join(complete_path, entry)):
-            extension = os.path.splitext(entry)[1]  # get the extension
-            extension = extension[1:]   # Remove the '.' from the extension
-            if extension in ALLOWED_EXTENSIONS:
-                create_image(entry, user, folder)
+    root_ids = [folder.id for folder in folders]
 
-        # Recursively do the same for the sub folders
-        if os.path.isdir(os.path.join(complete_path, entry)):
-            create_db_entries(entry, user, folder)
+    folder_dicts = dict()
+    children = defaultdict(list)
+    for folder in ImageFolder.objects.order_by('pk').values('id', 'title', 'folder_id'):
+        folder_dicts[folder['id']] = {
+            'id': folder['id'],
+            'title': folder['title'],
+            'images': list(),
+            'sub_folders': list(),
+        }
+        children[folder['folder_id']].append(folder['id'])
 
-    return folder
+    # Find all the folders under the requested ones
+    subtree_ids = set()
+    pending_ids = [folder_id for folder_id in root_ids if folder_id in folder_dicts]
+    while pending_ids:
+        folder_id = pending_ids.pop()
+        if folder_id not in subtree_ids:
+            subtree_ids.add(folder_id)
+            pending_ids.extend(children[folder_id])
 
+    for folder_id in subtree_ids:
+        folder_dicts[folder_id]['sub_folders'] = [folder_dicts[child_id] for child_id in children[folder_id]]
 
-def create_image(file_name, user, folder):
-    """Creates an image object."""
+    if subtree_ids:
+        images = Image.objects.order_by('pk')
+        if len(subtree_ids) < len(folder_dicts):
+            images = images.filter(folder_id__in=subtree_ids)
+        else:
+            images = images.filter(folder__isnull=False)
 
-    image_file = File(open(os.path.join(folder.get_complete_path(), file_name), 'rb'))
+        for image in images.values('id', 'title', 'file', 'folder_id'):
+            folder_dicts[image['folder_id']]['images'].append(get_image_values_dict(image))
 
-    # Build a form for validation
-    form = ImageForm({
-        'title': os.path.splitext(file_name)[0],
-        'collection': '1',  # Hard coding the root collection as default
-    }, {
-        'file': image_file
-    }, user=user)
+    return [folder_dicts[folder_id] for folder_id in root_ids if folder_id in folder_dicts]
 
-    if form.is_valid():
-        # Save it
-        image = form.save(commit=False)
-        image.uploaded_by_user = user
-        image.file_size = image.file.size
-        image.folder = folder
-        image.save()
 
-        # Reindex the image to make sure all tags are indexed
-        search_index.insert_or_update_object(image)
+def get_images_list(images):
+    """Converts an image queryset to a list of dictionaries containing the core fields of each
+    image, without loading the image objects."""
 
-        return image
-    return None
+    return [get_image_values_dict(image) for image in images.values('id', 'title', 'file')]
 
 
-def get_folders_list(folders):
-    """Recursively converts a list of folder objects to a list of folder dicts.
-    Also returns a list of images under each folder in a dictionary format."""
-
-    folders_list = list()
-    for folder in folders:
-        folder_dict = dict()
-        folder_dict['id'] = folder.id
-        folder_dict['title'] = folder.title
-
-        # Add images
-        folder_dict['images'] = list()
-        images = Image.objects.filter(folder=folder)
-        for image in images:
-            folder_dict['images'].append(get_image_dict(image))
-
-        # Get the contents of the sub folder
-        folder_dict['sub_folders'] = get_folders_list(folder.get_subfolders())
-        folders_list.append(folder_dict)
-    return folders_list
+def get_image_values_dict(values):
+    """Converts the values of an image (from a values() queryset) to the dictionary
+    returned by get_image_dict."""
+
+    image_dict = dict()
+    image_dict['id'] = values['id']
+    image_dict['title'] = values['title']
+    image_dict['url'] = Image._meta.get_field('file').storage.url(values['file'])
+    return image_dict
 
 
 def get_image_dict(image):
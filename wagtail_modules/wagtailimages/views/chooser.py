@@ -73,6 +73,9 @@ def chooser(request):
         except (ValueError, ImageFolder.DoesNotExist):
             pass
 
+    # Fetch the thumbnails of each page of results in a single query
+    images = images.prefetch_renditions('max-165x165')
+
     q = None
     if (
         'q' in request.GET or 'p' in request.GET or 'tag' in request.GET or
@@ -183,7 +186,7 @@ def chooser_upload(request):
     else:
         form = ImageForm(user=request.user)
 
-    images = Image.objects.order_by('-created_at')
+    images = Image.objects.order_by('-created_at').prefetch_renditions('max-165x165')
     paginator, images = paginate(request, images, per_page=12)
 
     return render_modal_workflow(
@@ -3,7 +3,7 @@ from __future__ import absolute_import, unicode_literals
 import os
 
 from django.core.urlresolvers import NoReverseMatch, reverse
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils.translation import ugettext as _
 from django.views.decorators.vary import vary_on_headers
@@ -18,10 +18,10 @@ from wagtail.wagtailimages import get_image_model
 from wagtail.wagtailimages.exceptions import InvalidFilterSpecError
 from wagtail.wagtailimages.forms import URLGeneratorForm, get_image_form
 from wagtail.wagtailimages.models import get_folder_model
-from wagtail.wagtailimages.models import Filter
+from wagtail.wagtailimages.models import Filter, RenditionOutputFile
 from wagtail.wagtailimages.permissions import permission_policy
 from wagtail.wagtailimages.views.serve import generate_signature
-from wagtail.wagtailimages.utils import get_folders_list, get_image_dict
+from wagtail.wagtailimages.utils import get_folders_list, get_images_list
 from wagtail.wagtailsearch import index as search_index
 
 permission_checker = PermissionPolicyChecker(permission_policy)
@@ -40,7 +40,7 @@ def index(request):
     # Get images (filtered by user permission)
     images = permission_policy.instances_user_has_any_permission_for(
         request.user, ['change', 'delete']
-    ).order_by('-created_at')
+    ).order_by('-created_at').prefetch_renditions('max-165x165')
     # Search
     query_string = None
     if 'q' in request.GET:
@@ -120,10 +120,7 @@ def custom_index(request):
 
     # Get all images under root
     Image = get_image_model()
-    images = Image.objects.filter(folder__isnull=True)
-    root_folder['images'] = list()
-    for image in images:
-        root_folder['images'].append(get_image_dict(image))
+    root_folder['images'] = get_images_list(Image.objects.filter(folder__isnull=True))
 
     return render(request, 'wagtailimages/images/custom_index.html', {
         'folders': [root_folder],
@@ -151,8 +148,9 @@ def edit(request, image_id):
                 original_file.storage.delete(original_file.name)
                 image.renditions.all().delete()
 
-                # Set new image file size
+                # Set new image file size, and clear the hash of the old file
                 image.file_size = image.file.size
+                image.file_hash = ''
 
             form.save()
 
@@ -256,14 +254,19 @@ def generate_url(request, image_id, filter_spec):
 def preview(request, image_id, filter_spec):
     image = get_object_or_404(get_image_model(), id=image_id)
 
+    output = RenditionOutputFile()
     try:
-        response = HttpResponse()
-        image = Filter(spec=filter_spec).run(image, response)
-        response['Content-Type'] = 'image/' + image.format_name
-        return response
+        image = Filter(spec=filter_spec).run(image, output)
     except InvalidFilterSpecError:
+        output.close()
         return HttpResponse("Invalid filter spec: " + filter_spec, content_type='text/plain', status=400)
 
+    # Stream the output back, rather than holding another copy of it in memory
+    response = FileResponse(output, content_type='image/' + image.format_name)
+    response['Content-Length'] = output.tell()
+    output.seek(0)
+    return response
+
 
 @permission_checker.require('delete')
 def delete(request, image_id):
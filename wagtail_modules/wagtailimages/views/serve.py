@@ -1,16 +1,23 @@
 from __future__ import absolute_import, unicode_literals
 
 import base64
+import calendar
 import hashlib
 import hmac
 import imghdr
+import time
 from wsgiref.util import FileWrapper
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured, PermissionDenied
-from django.http import HttpResponse, HttpResponsePermanentRedirect, StreamingHttpResponse
+from django.http import (
+    HttpResponse, HttpResponseNotModified, HttpResponsePermanentRedirect, StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
 from django.utils.decorators import classonlymethod
+from django.utils.http import http_date, parse_http_date_safe
 from django.utils.six import text_type
 from django.views.generic import View
 
@@ -18,6 +25,7 @@ from wagtail.utils.sendfile import sendfile
 from wagtail.wagtailimages import get_image_model
 from wagtail.wagtailimages.exceptions import InvalidFilterSpecError
 from wagtail.wagtailimages.models import SourceImageIOError
+from wagtail.wagtailimages.rendition_cache import get_image_key, get_rendition_cache
 
 
 def generate_signature(image_id, filter_spec, key=None):
@@ -35,7 +43,122 @@ def generate_signature(image_id, filter_spec, key=None):
 
 
 def verify_signature(signature, image_id, filter_spec, key=None):
-    return signature == generate_signature(image_id, filter_spec, key=key)
+    return constant_time_compare(signature, generate_signature(image_id, filter_spec, key=key))
+
+
+# Signed URLs always serve the same image, so they can be cached for a long time
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def get_rendition_etag(rendition):
+    """
+    Returns a strong ETag for a rendition. The file of a rendition never changes (if
+    the image changes, its renditions are deleted and generated again), so this only
+    depends on the rendition's id and file name.
+    """
+    key = '{}:{}'.format(rendition.pk, rendition.file.name)
+    return '"%s"' % hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def get_content_type(rendition):
+    """
+    Returns the content type of a rendition. This comes from its file extension, which
+    is set from the format of the image when the rendition is generated, so the file
+    is only opened (to sniff its format) when the extension isn't recognised.
+    """
+    format_name = rendition.get_format_name()
+
+    if format_name is None:
+        with rendition.file.storage.open(rendition.file.name, 'rb') as f:
+            format_name = imghdr.what(f)
+
+    return 'image/' + format_name
+
+
+def etag_matches(header, etag):
+    """
+    Checks whether an If-None-Match header matches the ETag
+    """
+    etags = [value.strip() for value in header.split(',')]
+    return '*' in etags or etag in etags or 'W/' + etag in etags
+
+
+def get_last_modified(rendition):
+    """
+    Returns the time the rendition's file was modified as a timestamp, or None if the
+    storage backend can't tell
+    """
+    storage = rendition.file.storage
+
+    try:
+        try:
+            # Added in Django 1.10, returns an aware datetime when USE_TZ is on
+            modified_time = storage.get_modified_time(rendition.file.name)
+        except (AttributeError, NotImplementedError):
+            modified_time = storage.modified_time(rendition.file.name)
+    except (NotImplementedError, EnvironmentError):
+        return None
+
+    if timezone.is_aware(modified_time):
+        return calendar.timegm(modified_time.utctimetuple())
+    else:
+        return time.mktime(modified_time.timetuple())
+
+
+def parse_range_header(header, size):
+    """
+    Parses a Range header, returning the (first, last) bytes of the file to send, or
+    None if the whole file should be sent. Only single byte ranges are supported,
+    other ranges are ignored. Raises RangeNotSatisfiable if the range is outside
+    the file.
+    """
+    units, _, ranges = header.partition('=')
+    if units.strip() != 'bytes' or ',' in ranges:
+        return
+
+    first, _, last = ranges.strip().partition('-')
+
+    try:
+        if first:
+            first = int(first)
+            last = int(last) if last else size - 1
+        else:
+            # A suffix range, requesting the last few bytes of the file
+            length = int(last)
+            if length == 0:
+                raise RangeNotSatisfiable
+            first = max(size - length, 0)
+            last = size - 1
+    except ValueError:
+        return
+
+    if first >= size:
+        raise RangeNotSatisfiable
+
+    if first > last:
+        return
+
+    return first, min(last, size - 1)
+
+
+def iter_file_range(f, first, last, chunk_size=8192):
+    try:
+        f.seek(first)
+        remaining = last - first + 1
+
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
 
 
 class ServeView(View):
@@ -55,24 +178,117 @@ class ServeView(View):
         if not verify_signature(signature.encode(), image_id, filter_spec, key=self.key):
             raise PermissionDenied
 
-        image = get_object_or_404(self.model, id=image_id)
+        rendition = self.get_cached_rendition(image_id, filter_spec)
 
-        # Get/generate the rendition
-        try:
-            rendition = image.get_rendition(filter_spec)
-        except SourceImageIOError:
-            return HttpResponse("Source image file not found", content_type='text/plain', status=410)
-        except InvalidFilterSpecError:
-            return HttpResponse("Invalid filter spec: " + filter_spec, content_type='text/plain', status=400)
+        if rendition is None:
+            image = get_object_or_404(self.model, id=image_id)
+
+            # Get/generate the rendition
+            try:
+                rendition = image.get_rendition(filter_spec)
+            except SourceImageIOError:
+                return HttpResponse("Source image file not found", content_type='text/plain', status=410)
+            except InvalidFilterSpecError:
+                return HttpResponse("Invalid filter spec: " + filter_spec, content_type='text/plain', status=400)
+
+            self.cache_rendition(rendition)
 
         return getattr(self, self.action)(rendition)
 
+    # The rendition a URL serves depends on the image's focal point, which isn't known
+    # until the image has been loaded. So the renditions are cached by filter spec
+    # alone, alongside the details cached by AbstractImage.get_rendition, and are
+    # discarded along with them whenever the image is saved.
+
+    def get_cached_rendition(self, image_id, filter_spec):
+        """
+        Returns the rendition served for the image and filter spec if it has been
+        cached, otherwise None. This doesn't query the database, unless
+        WAGTAILIMAGES_RENDITION_CACHE_BACKEND is set to a database cache.
+        """
+        cached = get_rendition_cache().get(get_image_key(self.model, image_id), (filter_spec, None))
+        if cached is not None:
+            return self.model.get_rendition_model()(image_id=image_id, filter_spec=filter_spec, **cached)
+
+    def cache_rendition(self, rendition):
+        get_rendition_cache().set(
+            get_image_key(self.model, rendition.image_id),
+            (rendition.filter_spec, None),
+            {
+                'id': rendition.id,
+                'focal_point_key': rendition.focal_point_key,
+                'file': rendition.file.name,
+                'width': rendition.width,
+                'height': rendition.height,
+            }
+        )
+
+    def get_max_age(self):
+        return getattr(settings, 'WAGTAILIMAGES_SERVE_MAX_AGE', DEFAULT_MAX_AGE)
+
+    def add_cache_headers(self, response, etag, last_modified=None):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, max_age=self.get_max_age())
+        return response
+
+    def get_not_modified_response(self, rendition, etag):
+        """
+        Returns a 304 response if the client's copy of the rendition is up to date,
+        otherwise None. This doesn't open the file.
+        """
+        if_none_match = self.request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            if etag_matches(if_none_match, etag):
+                return self.add_cache_headers(HttpResponseNotModified(), etag)
+            return
+
+        if_modified_since = parse_http_date_safe(self.request.META.get('HTTP_IF_MODIFIED_SINCE'))
+        if if_modified_since is not None:
+            last_modified = get_last_modified(rendition)
+            if last_modified is not None and int(last_modified) <= if_modified_since:
+                return self.add_cache_headers(HttpResponseNotModified(), etag, last_modified)
+
     def serve(self, rendition):
+        etag = get_rendition_etag(rendition)
+        response = self.get_not_modified_response(rendition, etag)
+        if response is not None:
+            return response
+
+        last_modified = get_last_modified(rendition)
+        content_type = get_content_type(rendition)
+
         # Open and serve the file
         rendition.file.open('rb')
-        image_format = imghdr.what(rendition.file)
-        return StreamingHttpResponse(FileWrapper(rendition.file),
-                                     content_type='image/' + image_format)
+        size = rendition.file.size
+
+        byte_range = None
+        range_header = self.request.META.get('HTTP_RANGE')
+
+        # If-Range means the client only wants part of the file if it hasn't changed
+        if range_header and self.request.META.get('HTTP_IF_RANGE', etag) == etag:
+            try:
+                byte_range = parse_range_header(range_header, size)
+            except RangeNotSatisfiable:
+                rendition.file.close()
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */%d' % size
+                return response
+
+        if byte_range is None:
+            response = StreamingHttpResponse(FileWrapper(rendition.file), content_type=content_type)
+            response['Content-Length'] = size
+        else:
+            first, last = byte_range
+            response = StreamingHttpResponse(
+                iter_file_range(rendition.file, first, last), content_type=content_type, status=206
+            )
+            response['Content-Range'] = 'bytes %d-%d/%d' % (first, last, size)
+            response['Content-Length'] = last - first + 1
+
+        response['Accept-Ranges'] = 'bytes'
+        return self.add_cache_headers(response, etag, last_modified)
 
     def redirect(self, rendition):
         # Redirect to the file's public location
@@ -86,4 +302,12 @@ class SendFileView(ServeView):
     backend = None
 
     def serve(self, rendition):
-        return sendfile(self.request, rendition.file.path, backend=self.backend)
+        etag = get_rendition_etag(rendition)
+        response = self.get_not_modified_response(rendition, etag)
+        if response is not None:
+            return response
+
+        response = sendfile(
+            self.request, rendition.file.path, mimetype=get_content_type(rendition), backend=self.backend
+        )
+        return self.add_cache_headers(response, etag)
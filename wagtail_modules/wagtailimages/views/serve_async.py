@@ -0,0 +1,214 @@
+"""
+An ASGI application that serves renditions in the same way as ServeView, for
+deployments that run an ASGI server alongside (or in front of) the Django app.
+
+Downloads are streamed from the event loop, so a slow client only holds on to a
+coroutine rather than a worker thread. Everything that blocks (the database, the
+rendition cache backend, generating missing renditions and reading from storage)
+runs in an executor.
+
+This module needs Python 3.5 or later, so it isn't imported by the rest of
+wagtailimages.
+"""
+
+import asyncio
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections
+from django.utils.http import http_date, parse_http_date_safe
+
+from wagtail.wagtailimages import get_image_model
+from wagtail.wagtailimages.exceptions import InvalidFilterSpecError
+from wagtail.wagtailimages.models import SourceImageIOError
+from wagtail.wagtailimages.views.serve import (
+    RangeNotSatisfiable, ServeView, etag_matches, get_content_type, get_last_modified,
+    get_rendition_etag, parse_range_header, verify_signature)
+
+
+# Matches the end of the URLs that are generated for ServeView, so that the
+# application can be mounted under any prefix
+URL_REGEX = re.compile(r'/([^/]*)/(\d*)/([^/]*)/[^/]*$')
+
+
+class Response(object):
+    """
+    A response to send to the client. If file is set, length bytes of it are sent
+    as the body (the file must already be at the position to start from).
+    """
+    def __init__(self, status, headers=None, body=b'', file=None, length=0):
+        self.status = status
+        self.headers = headers or []
+        self.body = body
+        self.file = file
+        self.length = length
+
+    @classmethod
+    def text(cls, status, text):
+        return cls(status, [('Content-Type', 'text/plain')], text.encode('utf-8'))
+
+
+class AsyncServeView(object):
+    """
+    ASGI application equivalent to ServeView. For example, to serve the URLs
+    generated for a ServeView with the 'wagtailimages_serve' name:
+
+        application = AsyncServeView()
+
+    and route requests under /images/ to it.
+
+    The executor is passed to loop.run_in_executor, so the loop's default executor
+    is used if it's None.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, model=None, key=None, action='serve', executor=None):
+        if action not in ['serve', 'redirect']:
+            raise ImproperlyConfigured("AsyncServeView action must be either 'serve' or 'redirect'")
+
+        # The rendition lookup and caching is shared with the synchronous view
+        self.view = ServeView(model=model or get_image_model(), key=key, action=action)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+
+        if scope['method'] not in ('GET', 'HEAD'):
+            response = Response(405, [('Allow', 'GET, HEAD')])
+        else:
+            response = await self.get_response(scope)
+
+        await self.send_response(send, response, head=scope['method'] == 'HEAD')
+
+    async def get_response(self, scope):
+        match = URL_REGEX.search(scope['path'])
+        if match is None:
+            return Response.text(404, "Not found")
+
+        signature, image_id, filter_spec = match.groups()
+        if not verify_signature(signature.encode(), image_id, filter_spec, key=self.view.key):
+            return Response.text(403, "Invalid signature")
+
+        headers = {
+            name.decode('latin-1').lower(): value.decode('latin-1')
+            for name, value in scope.get('headers', [])
+        }
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, self.get_rendition_response, image_id, filter_spec, headers
+        )
+
+    async def send_response(self, send, response, head=False):
+        headers = [
+            (name.lower().encode('latin-1'), str(value).encode('latin-1'))
+            for name, value in response.headers
+        ]
+        await send({'type': 'http.response.start', 'status': response.status, 'headers': headers})
+
+        if response.file is None or head:
+            if response.file is not None:
+                response.file.close()
+            await send({'type': 'http.response.body', 'body': b'' if head else response.body})
+            return
+
+        loop = asyncio.get_event_loop()
+        remaining = response.length
+
+        try:
+            while remaining > 0:
+                chunk = await loop.run_in_executor(
+                    self.executor, response.file.read, min(self.chunk_size, remaining)
+                )
+                if not chunk:
+                    break
+
+                remaining -= len(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            response.file.close()
+
+        await send({'type': 'http.response.body', 'body': b''})
+
+    def get_rendition_response(self, image_id, filter_spec, headers):
+        """
+        Finds (or generates) the rendition and works out the response. Runs in the
+        executor, as this may query the database and read from storage.
+        """
+        # Django does this at the start and end of each request, so that connections
+        # don't outlive CONN_MAX_AGE or stay open after an error
+        close_old_connections()
+        try:
+            rendition = self.view.get_cached_rendition(image_id, filter_spec)
+
+            if rendition is None:
+                try:
+                    image = self.view.model.objects.get(id=image_id)
+                except self.view.model.DoesNotExist:
+                    return Response.text(404, "Image not found")
+
+                try:
+                    rendition = image.get_rendition(filter_spec)
+                except SourceImageIOError:
+                    return Response.text(410, "Source image file not found")
+                except InvalidFilterSpecError:
+                    return Response.text(400, "Invalid filter spec: " + filter_spec)
+
+                self.view.cache_rendition(rendition)
+
+            if self.view.action == 'redirect':
+                return Response(301, [('Location', rendition.url)])
+
+            return self.serve(rendition, headers)
+        finally:
+            close_old_connections()
+
+    def get_cache_headers(self, etag, last_modified=None):
+        headers = [('ETag', etag), ('Cache-Control', 'max-age=%d' % self.view.get_max_age())]
+        if last_modified is not None:
+            headers.append(('Last-Modified', http_date(last_modified)))
+        return headers
+
+    def serve(self, rendition, headers):
+        etag = get_rendition_etag(rendition)
+
+        # The same conditions as ServeView.get_not_modified_response
+        if 'if-none-match' in headers:
+            if etag_matches(headers['if-none-match'], etag):
+                return Response(304, self.get_cache_headers(etag))
+        else:
+            if_modified_since = parse_http_date_safe(headers.get('if-modified-since'))
+            if if_modified_since is not None:
+                last_modified = get_last_modified(rendition)
+                if last_modified is not None and int(last_modified) <= if_modified_since:
+                    return Response(304, self.get_cache_headers(etag, last_modified))
+
+        last_modified = get_last_modified(rendition)
+        content_type = get_content_type(rendition)
+
+        storage = rendition.file.storage
+        size = storage.size(rendition.file.name)
+
+        byte_range = None
+        range_header = headers.get('range')
+        if range_header and headers.get('if-range', etag) == etag:
+            try:
+                byte_range = parse_range_header(range_header, size)
+            except RangeNotSatisfiable:
+                return Response(416, [('Content-Range', 'bytes */%d' % size)])
+
+        response_headers = [('Content-Type', content_type), ('Accept-Ranges', 'bytes')]
+        response_headers.extend(self.get_cache_headers(etag, last_modified))
+
+        f = storage.open(rendition.file.name, 'rb')
+
+        if byte_range is None:
+            response_headers.append(('Content-Length', size))
+            return Response(200, response_headers, file=f, length=size)
+
+        first, last = byte_range
+        f.seek(first)
+        response_headers.append(('Content-Range', 'bytes %d-%d/%d' % (first, last, size)))
+        response_headers.append(('Content-Length', last - first + 1))
+        return Response(206, response_headers, file=f, length=last - first + 1)